@@ -0,0 +1,83 @@
+import itertools
+
+# Identificador de cada línea de tiempo entregada al planificador (ver run_timeline).
+# Es creciente: un owner menor es una activación más vieja.
+_activation_ids = itertools.count(1)
+
+
+class PinStep:
+    """
+    Un paso de la línea de tiempo de actuación: poner el pin de un rol ('deteccion',
+    'exportable' o 'no_exportable') en un estado ('H' / 'L') a offset_s segundos del origen.
+    """
+    __slots__ = ('offset_s', 'pin_role', 'state')
+
+    def __init__(self, offset_s, pin_role, state):
+        self.offset_s = offset_s
+        self.pin_role = pin_role
+        self.state = state
+
+    def __repr__(self):
+        return f"+{self.offset_s:.2f}s {self.pin_role}={self.state}"
+
+
+def decision_timeline(exportable, timeline):
+    """
+    Pasos de la decisión de un mango, con tiempos relativos al LOW del pin de detección:
+    a los offset_s segundos el pin contrario pasa a LOW y el pin de la decisión a HIGH,
+    que vuelve a LOW después de dwell_s segundos.
+    timeline: {'offset_s': ..., 'dwell_s': ...} (ver ACTUATION_TIMELINE en config.py).
+    """
+    active, other = ('exportable', 'no_exportable') if exportable else ('no_exportable', 'exportable')
+    offset, dwell = timeline['offset_s'], timeline['dwell_s']
+    return [
+        PinStep(offset, other, 'L'),
+        PinStep(offset, active, 'H'),
+        PinStep(offset + dwell, active, 'L'),
+    ]
+
+
+def run_timeline(steps, send, on_activate_written=None):
+    """
+    Entrega todos los pasos al planificador de una vez; send(pin_role, state, delay, on_written, owner)
+    no bloquea (ver ArduinoLink.schedule), así que nadie espera a que transcurran los tiempos.
+    on_activate_written se pasa al primer paso que pone un pin en HIGH (la activación de la decisión).
+    Todos los pasos llevan el mismo owner: un LOW de esta línea de tiempo no corta la activación de
+    otro mango que tomó el pin después (ej. el mango siguiente decidido durante el dwell de este),
+    y los LOW de una línea de tiempo más nueva siempre se aplican (ver PinOwnership).
+    """
+    owner = next(_activation_ids)
+    for step in steps:
+        callback = None
+        if on_activate_written is not None and step.state == 'H':
+            callback, on_activate_written = on_activate_written, None
+        send(step.pin_role, step.state, step.offset_s, callback, owner)
+
+
+class PinOwnership:
+    """
+    Dueño de cada pin según las activaciones (owners de run_timeline) cuyos comandos ya vencieron.
+    Un HIGH con owner deja el pin a nombre de su activación. Un LOW de una activación más vieja
+    que la dueña del pin es un reseteo atrasado y se descarta; un LOW de la misma activación o de
+    una más nueva se aplica siempre y libera el pin (así el mango siguiente baja el pin contrario
+    aunque el anterior siga en su dwell). Los comandos sin owner se aplican siempre.
+    """
+
+    def __init__(self):
+        self._owners = {}  # pin -> owner de la activación que lo puso en HIGH
+
+    def apply(self, pin, state, owner):
+        """
+        Registra un comando que vence y retorna False si debe descartarse.
+        """
+        if owner is None:
+            self._owners.pop(pin, None)
+            return True
+        if state == 'H':
+            self._owners[pin] = owner
+            return True
+        current = self._owners.get(pin)
+        if current is not None and owner < current:
+            return False
+        self._owners.pop(pin, None)
+        return True
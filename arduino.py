@@ -0,0 +1,326 @@
+import time
+import heapq
+import threading
+from collections import deque
+import serial
+from serial_protocol import (
+    encode_command_frame, DeviceFrameParser, MAX_COMMANDS_PER_FRAME,
+    ACK_FRAME, PRESENCE_FRAME, READY_FRAME, ACK_OK, ACK_STATUS_NAMES
+)
+from config import SERIAL_ACK_TIMEOUT_S, SERIAL_ACK_RETRIES, ARDUINO_OUTPUT_PINS
+from actuation import PinOwnership
+
+# Comandos que vencen con menos de esta diferencia salen en una sola escritura
+COALESCE_WINDOW_S = 0.002
+# Cantidad de comandos recientes con que se calculan la latencia cola -> cable y el tiempo de ida y vuelta
+LATENCY_WINDOW = 500
+# Timeout de lectura del thread lector; también es el intervalo con que revisa los acks vencidos
+READ_TIMEOUT_S = 0.05
+
+# Conexiones abiertas por puerto: las líneas que comparten un Arduino comparten la conexión
+_links = {}
+_links_lock = threading.Lock()
+
+
+def _latency_stats(values):
+    latencies = sorted(values)
+    if not latencies:
+        return {"promedio": None, "p95": None, "max": None}
+    return {
+        "promedio": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 3),
+        "max": round(latencies[-1] * 1000, 3),
+    }
+
+
+class ArduinoLink:
+    """
+    Conexión serial con un Arduino. Un solo thread escritor por puerto envía los comandos
+    de pines desde una cola de prioridad ordenada por el momento en que deben salir, así
+    varias líneas pueden usar el mismo puerto sin mezclar comandos y nadie espera al serial.
+    Los comandos que vencen juntos (ej. 13 LOW y 12 HIGH) salen en un solo frame, y los
+    reseteos diferidos son comandos con retardo en la misma cola, sin un Timer por decisión.
+
+    Los comandos de una línea de tiempo de actuación llevan un owner (ver run_timeline): un HIGH
+    deja el pin a nombre de su activación, y el LOW atrasado de una activación más vieja se
+    descarta (ver PinOwnership), así la decisión de un mango no corta la del siguiente, pero el
+    mango siguiente sí baja el pin contrario que el anterior dejó en HIGH.
+
+    Los frames llevan número de secuencia (ver serial_protocol.py). Un thread lector recibe
+    los acks del Arduino y mide el tiempo de ida y vuelta de cada frame; si el ack no llega
+    en SERIAL_ACK_TIMEOUT_S, el frame se reenvía hasta SERIAL_ACK_RETRIES veces. Poner un pin en
+    un estado es idempotente, pero un reenvío tardío podría pisar un comando más nuevo: antes de
+    reenviar se quitan los pines que otro frame ya escribió después, y si no queda ninguno el
+    reenvío se descarta. El mismo thread entrega los avisos del sensor de presencia.
+    """
+
+    def __init__(self, port, baudrate=9600):
+        self.port = port
+        self.baudrate = baudrate
+        self.serial = None
+        self._write_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._commands = []  # heap de (vence_en, orden, pin, estado, encolado_en, al_escribir, owner), tiempos de time.monotonic()
+        self._pin_owners = PinOwnership()
+        self._order = 0
+        self._writer = None
+        self._reader = None
+        self._frame_seq = 0
+        self._pending_acks = {}  # seq -> [enviado_en, frame, reintentos_restantes, comandos, nro_escritura]
+        self._write_count = 0
+        self._pin_last_write = {}  # pin -> nro_escritura del último frame que lo escribió
+        self._pending_lock = threading.Lock()
+        self._presence_listeners = []
+        self._parser = DeviceFrameParser()
+        self.writes = 0
+        self.commands_sent = 0
+        self.commands_coalesced = 0  # Comandos que salieron junto a otros en el mismo frame
+        self.commands_superseded = 0  # LOW atrasados descartados porque una activación más nueva tomó el pin
+        self.acks = 0
+        self.nacks = 0
+        self.retransmits = 0
+        self.retransmits_superseded = 0  # Reenvíos descartados: un frame más nuevo ya escribió sus pines
+        self.lost_frames = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)  # segundos desde que vence hasta que se escribe
+        self._round_trips = deque(maxlen=LATENCY_WINDOW)  # segundos desde que se escribe hasta el ack
+
+    def connect(self, reset_wait_s=2.0):
+        """
+        Inicializa la conexión serial con Arduino y el thread lector de acks.
+        """
+        try:
+            if self.serial is None or not self.serial.is_open:
+                self.serial = serial.Serial(self.port, self.baudrate, timeout=READ_TIMEOUT_S)
+                time.sleep(reset_wait_s)  # Da tiempo a Arduino para reiniciarse después de abrir el puerto serial
+                print(f"DEBUG: Conexión serial con Arduino establecida en {self.port} a {self.baudrate} baudios.")
+                if self._reader is None or not self._reader.is_alive():
+                    self._reader = threading.Thread(target=self._reader_loop, daemon=True)
+                    self._reader.start()
+        except serial.SerialException as e:
+            print(f"ERROR: No se pudo establecer conexión serial con Arduino: {e}")
+            self.serial = None
+
+    def is_open(self):
+        return self.serial is not None and self.serial.is_open
+
+    def add_presence_listener(self, callback):
+        """callback(presente) se llama con cada aviso del sensor de presencia del Arduino."""
+        self._presence_listeners.append(callback)
+
+    def remove_presence_listener(self, callback):
+        if callback in self._presence_listeners:
+            self._presence_listeners.remove(callback)
+
+    def schedule(self, pin, state, delay=0.0, on_written=None, owner=None):
+        """
+        Encola una señal para un pin (H para HIGH, L para LOW) que sale dentro de delay segundos.
+        No bloquea: la escritura la hace el thread escritor del puerto.
+        on_written(encolado_en, vence_en, escrito_en), si se indica, se llama desde el thread escritor
+        cuando el comando sale por el puerto (tiempos de time.monotonic()).
+        owner: activación a la que pertenece el comando (None: se aplica siempre).
+        """
+        now = time.monotonic()
+        with self._cond:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+                self._writer.start()
+            self._order += 1
+            heapq.heappush(self._commands, (now + delay, self._order, pin, state, now, on_written, owner))
+            self._cond.notify()
+
+    def send_signal(self, pin, state):
+        """
+        Envía una señal a Arduino para un pin específico y estado (H para HIGH, L para LOW).
+        Ejemplo: send_signal(7, 'H')
+        """
+        self.schedule(pin, state)
+
+    def _next_due_commands(self):
+        """
+        Espera al comando que vence primero y retorna todos los que vencen dentro de la ventana de agrupación.
+        """
+        with self._cond:
+            while True:
+                if not self._commands:
+                    self._cond.wait()
+                    continue
+                wait = self._commands[0][0] - time.monotonic()
+                if wait <= 0:
+                    break
+                self._cond.wait(timeout=wait)
+            limit = time.monotonic() + COALESCE_WINDOW_S
+            due = []
+            while self._commands and self._commands[0][0] <= limit and len(due) < MAX_COMMANDS_PER_FRAME:
+                due.append(heapq.heappop(self._commands))
+            return due
+
+    def _owned_commands(self, due):
+        """
+        Aplica los owners a los comandos que vencen, en orden (ver PinOwnership): se descartan
+        los LOW atrasados de una activación más vieja que la dueña del pin.
+        """
+        commands = []
+        for command in due:
+            _due_at, _order, pin, state, _queued_at, _on_written, owner = command
+            if not self._pin_owners.apply(pin, state, owner):
+                self.commands_superseded += 1
+                continue
+            commands.append(command)
+        return commands
+
+    def _writer_loop(self):
+        while True:
+            due = self._owned_commands(self._next_due_commands())
+            if not due:
+                continue
+            # Si un pin aparece varias veces en el grupo vale el último estado
+            last_state = {}
+            for _due_at, _order, pin, state, _queued_at, _on_written, _owner in due:
+                last_state.pop(pin, None)
+                last_state[pin] = state
+            if not self.is_open():
+                print(f"ADVERTENCIA: Conexión serial con Arduino no establecida ({self.port}).")
+                continue
+            seq = self._frame_seq
+            self._frame_seq = (self._frame_seq + 1) % 256
+            commands = list(last_state.items())
+            frame = encode_command_frame(seq, commands)
+            try:
+                with self._write_lock:
+                    self.serial.write(frame)
+                    self._write_count += 1
+                    write_no = self._write_count
+                    for pin in last_state:
+                        self._pin_last_write[pin] = write_no
+                written_at = time.monotonic()
+            except Exception as e:
+                print(f"ERROR: No se pudo enviar señal a Arduino: {e}")
+                continue
+            with self._pending_lock:
+                self._pending_acks[seq] = [written_at, frame, SERIAL_ACK_RETRIES, commands, write_no]
+            self.writes += 1
+            self.commands_sent += len(due)
+            if len(due) > 1:
+                self.commands_coalesced += len(due)
+            for due_at, _order, _pin, _state, queued_at, on_written, _owner in due:
+                self._latencies.append(written_at - max(due_at, queued_at))
+                if on_written is not None:
+                    try:
+                        on_written(queued_at, due_at, written_at)
+                    except Exception as e:
+                        print(f"ERROR: Callback de escritura serial ({self.port}): {e}")
+            sent = ' '.join(f"{pin}{state}" for pin, state in last_state.items())
+            print(f"DEBUG: Enviado '{sent}' a Arduino ({self.port}, seq {seq}).")
+
+    def _handle_frame(self, frame_type, a, b):
+        if frame_type == ACK_FRAME:
+            with self._pending_lock:
+                pending = self._pending_acks.pop(a, None)
+            if pending is None:
+                return  # Ack de un frame ya dado por perdido o reenviado y confirmado
+            if b == ACK_OK:
+                self.acks += 1
+                self._round_trips.append(time.monotonic() - pending[0])
+            else:
+                self.nacks += 1
+                print(f"ERROR: Arduino ({self.port}) rechazó el frame {a}: {ACK_STATUS_NAMES.get(b, b)}.")
+        elif frame_type == PRESENCE_FRAME:
+            for callback in list(self._presence_listeners):
+                callback(bool(a))
+        elif frame_type == READY_FRAME:
+            print(f"DEBUG: Arduino listo ({self.port}).")
+
+    def _check_ack_timeouts(self):
+        now = time.monotonic()
+        resend = []
+        with self._pending_lock:
+            for seq, pending in list(self._pending_acks.items()):
+                if now - pending[0] < SERIAL_ACK_TIMEOUT_S:
+                    continue
+                if pending[2] > 0:
+                    pending[2] -= 1
+                    pending[0] = now
+                    resend.append((seq, pending))
+                else:
+                    del self._pending_acks[seq]
+                    self.lost_frames += 1
+                    print(f"ADVERTENCIA: Arduino ({self.port}) no confirmó el frame {seq}.")
+        for seq, pending in resend:
+            try:
+                with self._write_lock:
+                    # Con el lock de escritura tomado ningún frame nuevo sale entre la revisión y el reenvío
+                    commands = [(pin, state) for pin, state in pending[3] if self._pin_last_write.get(pin) == pending[4]]
+                    if not commands:
+                        with self._pending_lock:
+                            if self._pending_acks.get(seq) is pending:
+                                del self._pending_acks[seq]
+                        self.retransmits_superseded += 1
+                        continue
+                    if len(commands) < len(pending[3]):
+                        pending[1], pending[3] = encode_command_frame(seq, commands), commands
+                    self.serial.write(pending[1])
+                self.retransmits += 1
+            except Exception as e:
+                print(f"ERROR: No se pudo reenviar el frame a Arduino: {e}")
+
+    def _reader_loop(self):
+        while self.is_open():
+            try:
+                data = self.serial.read(max(1, self.serial.in_waiting))
+            except Exception as e:
+                print(f"ERROR: No se pudo leer del Arduino ({self.port}): {e}")
+                break
+            for frame_type, a, b in self._parser.feed(data):
+                self._handle_frame(frame_type, a, b)
+            self._check_ack_timeouts()
+
+    def get_stats(self):
+        with self._cond:
+            pending = len(self._commands)
+        with self._pending_lock:
+            awaiting_ack = len(self._pending_acks)
+        return {
+            "puerto": self.port,
+            "conectado": self.is_open(),
+            "comandos_pendientes": pending,
+            "frames_sin_ack": awaiting_ack,
+            "escrituras": self.writes,
+            "comandos_enviados": self.commands_sent,
+            "comandos_agrupados": self.commands_coalesced,
+            "comandos_reemplazados": self.commands_superseded,
+            "acks": self.acks,
+            "rechazos": self.nacks,
+            "reenvios": self.retransmits,
+            "reenvios_descartados": self.retransmits_superseded,
+            "frames_perdidos": self.lost_frames,
+            "bytes_descartados": self._parser.discarded_bytes,
+            "latencia_ms": _latency_stats(self._latencies),
+            "ida_y_vuelta_ms": _latency_stats(self._round_trips),
+        }
+
+
+def check_lane_pins(lanes, output_pins=ARDUINO_OUTPUT_PINS):
+    """
+    Valida los pines de config.LANES antes de crear las líneas: todos deben estar entre los
+    pines de salida del firmware, y las líneas que comparten un puerto no pueden repetir pines.
+    """
+    used = {}  # (puerto, pin) -> línea
+    for lane_id, lane_config in lanes.items():
+        for role, pin in lane_config['pins'].items():
+            if pin not in output_pins:
+                raise ValueError(f"Línea {lane_id}: el pin {pin} ({role}) no está en ARDUINO_OUTPUT_PINS {tuple(output_pins)}; "
+                                 f"agrégalo ahí y en OUTPUT_PINS de arduino/arduino.ino")
+            key = (lane_config['serial_port'], pin)
+            if key in used and used[key] != lane_id:
+                raise ValueError(f"Líneas {used[key]} y {lane_id} usan el pin {pin} del mismo Arduino ({lane_config['serial_port']})")
+            used[key] = lane_id
+
+
+def get_arduino_link(port, baudrate=9600):
+    """
+    Retorna la conexión con el Arduino del puerto dado, creándola la primera vez.
+    """
+    with _links_lock:
+        if port not in _links:
+            _links[port] = ArduinoLink(port, baudrate)
+        return _links[port]
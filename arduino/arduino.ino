@@ -1,70 +1,106 @@
-const int pin7 = 7;
-const int pin12 = 12;
-const int pin13 = 13;
+// Protocolo binario con el servidor (ver serial_protocol.py):
+//   Servidor -> Arduino: 0xA5 | seq | n | pin_1 estado_1 ... pin_n estado_n | xor(seq, n, comandos)
+//   Arduino -> servidor: frames de 4 bytes tipo | a | b | xor(tipo, a, b)
+//     0xAC ack (a = seq, b = 0 ok / 1 checksum inválido / 2 pin inválido)
+//     0xB0 presencia (a = 1 al llegar un mango, 0 al liberarse)
+//     0xB1 listo (al iniciar)
 
-void setup() {
-  Serial.begin(9600);
-  pinMode(pin7, OUTPUT);
-  pinMode(pin12, OUTPUT);
-  pinMode(pin13, OUTPUT);
+// Pines de salida que acepta este Arduino: deben coincidir con ARDUINO_OUTPUT_PINS de config.py.
+// Si varias líneas comparten la placa, listar aquí los pines de todas ellas (no usar 0/1 ni el del sensor).
+const byte OUTPUT_PINS[] = {7, 12, 13};
+const byte NUM_OUTPUT_PINS = sizeof(OUTPUT_PINS) / sizeof(OUTPUT_PINS[0]);
+const int pinSensor = 2; // Sensor de presencia de la banda (activo en LOW), usado en modo continuo
+
+const byte COMMAND_START = 0xA5;
+const byte MAX_COMMANDS = 8;
+const byte ACK_FRAME = 0xAC;
+const byte PRESENCE_FRAME = 0xB0;
+const byte READY_FRAME = 0xB1;
+const byte ACK_OK = 0;
+const byte ACK_BAD_CHECKSUM = 1;
+const byte ACK_BAD_PIN = 2;
+
+int lastSensorState = HIGH;
 
-  // Inicializa los pines en estado LOW
-  digitalWrite(pin7, LOW);
-  digitalWrite(pin12, LOW);
-  digitalWrite(pin13, LOW);
+// Estado del parser de frames de comandos
+byte frame[3 + 2 * MAX_COMMANDS + 1];
+byte frameLength = 0;
 
-  Serial.println("Arduino listo.");
+void sendFrame(byte type, byte a, byte b) {
+  byte out[4] = {type, a, b, (byte)(type ^ a ^ b)};
+  Serial.write(out, 4);
 }
 
-void loop() {
-  if (Serial.available() > 0) {
-    // Lee la cadena hasta el carácter de nueva línea
-    String command = Serial.readStringUntil('\n'); 
-    command.trim(); // Elimina cualquier espacio en blanco (incluido el '\r' si viene de Windows)
+bool validPin(byte pin) {
+  for (byte i = 0; i < NUM_OUTPUT_PINS; i++) {
+    if (OUTPUT_PINS[i] == pin) {
+      return true;
+    }
+  }
+  return false;
+}
 
-    Serial.print("Comando recibido: ");
-    Serial.println(command);
+void handleFrame() {
+  byte seq = frame[1];
+  byte count = frame[2];
+  byte checksum = seq ^ count;
+  for (byte i = 0; i < 2 * count; i++) {
+    checksum ^= frame[3 + i];
+  }
+  if (checksum != frame[3 + 2 * count]) {
+    sendFrame(ACK_FRAME, seq, ACK_BAD_CHECKSUM);
+    return;
+  }
+  // Se valida el frame completo antes de tocar los pines
+  for (byte i = 0; i < count; i++) {
+    if (!validPin(frame[3 + 2 * i])) {
+      sendFrame(ACK_FRAME, seq, ACK_BAD_PIN);
+      return;
+    }
+  }
+  for (byte i = 0; i < count; i++) {
+    digitalWrite(frame[3 + 2 * i], frame[4 + 2 * i] ? HIGH : LOW);
+  }
+  sendFrame(ACK_FRAME, seq, ACK_OK);
+}
 
-    if (command.length() >= 2) { // Espera formatos como "7H", "12L", "13H"
-      int pinNum;
-      char stateChar = command.charAt(command.length() - 1); // Último carácter es el estado (H/L)
-      String pinStr = command.substring(0, command.length() - 1); // El resto es el número de pin
+void readCommandByte(byte value) {
+  if (frameLength == 0 && value != COMMAND_START) {
+    return; // Fuera de un frame: se descarta hasta el próximo inicio
+  }
+  frame[frameLength++] = value;
+  if (frameLength == 3 && (frame[2] == 0 || frame[2] > MAX_COMMANDS)) {
+    frameLength = 0; // Cantidad de comandos inválida: se vuelve a sincronizar
+    return;
+  }
+  if (frameLength >= 3 && frameLength == 3 + 2 * frame[2] + 1) {
+    handleFrame();
+    frameLength = 0;
+  }
+}
 
-      pinNum = pinStr.toInt(); // Convierte la subcadena del pin a entero
+void setup() {
+  Serial.begin(9600);
+  // Inicializa los pines de salida en estado LOW
+  for (byte i = 0; i < NUM_OUTPUT_PINS; i++) {
+    pinMode(OUTPUT_PINS[i], OUTPUT);
+    digitalWrite(OUTPUT_PINS[i], LOW);
+  }
+  pinMode(pinSensor, INPUT_PULLUP);
+  lastSensorState = digitalRead(pinSensor);
 
-      int state = LOW;
-      if (stateChar == 'H') {
-        state = HIGH;
-      } else if (stateChar == 'L') {
-        state = LOW;
-      } else {
-        Serial.println("Caracter de estado inválido.");
-        return;
-      }
+  sendFrame(READY_FRAME, 0, 0);
+}
 
-      switch (pinNum) {
-        case 7:
-          digitalWrite(pin7, state);
-          Serial.print("Pin 7 establecido a ");
-          Serial.println(state == HIGH ? "HIGH" : "LOW");
-          break;
-        case 12:
-          digitalWrite(pin12, state);
-          Serial.print("Pin 12 establecido a ");
-          Serial.println(state == HIGH ? "HIGH" : "LOW");
-          break;
-        case 13:
-          digitalWrite(pin13, state);
-          Serial.print("Pin 13 establecido a ");
-          Serial.println(state == HIGH ? "HIGH" : "LOW");
-          break;
-        default:
-          Serial.print("Número de pin inválido: ");
-          Serial.println(pinNum);
-          break;
-      }
-    } else {
-      Serial.println("Formato de comando inválido.");
-    }
+void loop() {
+  // Informa los cambios del sensor de presencia: 1 al llegar un mango, 0 al liberarse
+  int sensorState = digitalRead(pinSensor);
+  if (sensorState != lastSensorState) {
+    lastSensorState = sensorState;
+    sendFrame(PRESENCE_FRAME, sensorState == LOW ? 1 : 0, 0);
   }
-}
\ No newline at end of file
+
+  while (Serial.available() > 0) {
+    readCommandByte((byte)Serial.read());
+  }
+}
@@ -0,0 +1,132 @@
+"""
+Emulador del Arduino de la línea sobre una pseudo-terminal (solo Linux/macOS).
+
+Habla el mismo protocolo binario que arduino/arduino.ino (ver serial_protocol.py):
+aplica los comandos de pines, responde los acks y puede simular el sensor de presencia.
+Sirve para probar la actuación y medir su rendimiento sin una placa conectada.
+
+Uso:
+    python arduino_emulator.py [--baudrate 9600] [--presence-interval 5]
+y poner en config.LANES el puerto que imprime (ej. '/dev/pts/3').
+"""
+import os
+import pty
+import tty
+import time
+import select
+import argparse
+import threading
+from config import ARDUINO_OUTPUT_PINS
+from serial_protocol import (
+    CommandFrameParser, encode_device_frame,
+    ACK_FRAME, PRESENCE_FRAME, READY_FRAME, ACK_OK, ACK_BAD_CHECKSUM, ACK_BAD_PIN
+)
+
+VALID_PINS = ARDUINO_OUTPUT_PINS
+
+
+class ArduinoEmulator:
+    """
+    Arduino emulado en una pseudo-terminal. port es la ruta que abre pyserial.
+    Con baudrate, cada byte recibido y enviado demora lo que tardaría en el cable
+    (10 bits por byte), así las mediciones se parecen a las de la placa real.
+    """
+
+    def __init__(self, baudrate=None, valid_pins=VALID_PINS):
+        self.baudrate = baudrate
+        self.valid_pins = set(valid_pins)
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self.pins = {pin: 'L' for pin in self.valid_pins}
+        self.frames_received = 0
+        self.commands_applied = 0
+        self.bad_frames = 0
+        self._parser = CommandFrameParser()
+        self._write_lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def _wire_delay(self, size):
+        if self.baudrate:
+            time.sleep(size * 10.0 / self.baudrate)
+
+    def _send(self, frame):
+        with self._write_lock:
+            self._wire_delay(len(frame))
+            os.write(self._master, frame)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._send(encode_device_frame(READY_FRAME))
+        return self
+
+    def _run(self):
+        while self._running:
+            ready, _w, _x = select.select([self._master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 256)
+            except OSError:
+                break
+            self._wire_delay(len(data))
+            for seq, commands, checksum_ok in self._parser.feed(data):
+                self.frames_received += 1
+                if not checksum_ok:
+                    self.bad_frames += 1
+                    self._send(encode_device_frame(ACK_FRAME, seq, ACK_BAD_CHECKSUM))
+                elif any(pin not in self.valid_pins for pin, _state in commands):
+                    self.bad_frames += 1
+                    self._send(encode_device_frame(ACK_FRAME, seq, ACK_BAD_PIN))
+                else:
+                    for pin, state in commands:
+                        self.pins[pin] = state
+                    self.commands_applied += len(commands)
+                    self._send(encode_device_frame(ACK_FRAME, seq, ACK_OK))
+
+    def set_presence(self, present):
+        """Simula un cambio del sensor de presencia de la banda."""
+        self._send(encode_device_frame(PRESENCE_FRAME, 1 if present else 0))
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        os.close(self._master)
+        os.close(self._slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arduino emulado en una pseudo-terminal")
+    parser.add_argument('--baudrate', type=int, default=9600, help="Velocidad simulada del cable (0 = sin demora)")
+    parser.add_argument('--presence-interval', type=float, default=0.0,
+                        help="Segundos entre mangos simulados por el sensor de presencia (0 = sin sensor)")
+    args = parser.parse_args()
+
+    emulator = ArduinoEmulator(baudrate=args.baudrate or None).start()
+    print(f"Arduino emulado en {emulator.port} (Ctrl+C para terminar)")
+    last_pins = dict(emulator.pins)
+    present = False
+    next_presence = time.time() + args.presence_interval
+    try:
+        while True:
+            time.sleep(0.05)
+            if emulator.pins != last_pins:
+                last_pins = dict(emulator.pins)
+                print("Pines: " + "  ".join(f"{pin}={state}" for pin, state in sorted(last_pins.items())))
+            if args.presence_interval and time.time() >= next_presence:
+                present = not present
+                emulator.set_presence(present)
+                print(f"Sensor de presencia: {'mango' if present else 'libre'}")
+                next_presence = time.time() + (1.0 if present else args.presence_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import os
+import json
+from ultralytics import YOLO
+from config import QUANTIZATION_MIN_AGREEMENT
+
+# Backends de inferencia soportados y el formato de exportación de ultralytics de cada uno.
+# 'pytorch' usa los pesos .pt directamente; los demás exportan una vez a un runtime optimizado para CPU.
+# 'onnx_int8' usa el ONNX cuantizado por quantization.py, que no se genera aquí.
+BACKEND_FORMATS = {
+    'pytorch': None,
+    'onnx': 'onnx',
+    'openvino': 'openvino',
+    'onnx_int8': 'onnx',
+}
+
+# Resultado de la validación de los modelos INT8 (lo escribe quantization.py)
+QUANTIZATION_GATE_FILE = 'int8_gate.json'
+
+# Tamaño de entrada con que se exportan los modelos (el mismo que usa predict por defecto)
+EXPORT_IMGSZ = 640
+
+
+def exported_path(weights, backend):
+    """
+    Ruta del artefacto exportado para un backend, junto a los pesos:
+    'madurez.pt' -> 'madurez.onnx' (onnx) o 'madurez_openvino_model' (openvino).
+    """
+    base, _ext = os.path.splitext(weights)
+    if backend == 'onnx':
+        return f"{base}.onnx"
+    if backend == 'onnx_int8':
+        return f"{base}_int8.onnx"
+    if backend == 'openvino':
+        return f"{base}_openvino_model"
+    return weights
+
+
+def ensure_exported(weights, backend):
+    """
+    Exporta los pesos al formato del backend si el artefacto no existe o es más viejo
+    que los pesos .pt. Retorna la ruta del artefacto a cargar.
+    """
+    if BACKEND_FORMATS.get(backend, 'desconocido') == 'desconocido':
+        raise ValueError(f"Backend de inferencia '{backend}' no soportado. Opciones: {list(BACKEND_FORMATS)}")
+    path = exported_path(weights, backend)
+    if backend == 'pytorch':
+        return path
+    if backend == 'onnx_int8':
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No existe {path}; ejecuta primero: python quantization.py images/<lote>")
+        return path
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(weights):
+        return path
+    print(f"DEBUG: Exportando {weights} a {backend}...")
+    exported = YOLO(weights).export(format=BACKEND_FORMATS[backend], imgsz=EXPORT_IMGSZ)
+    print(f"DEBUG: {weights} exportado a {exported}.")
+    return str(exported)
+
+
+def read_quantization_gate():
+    """
+    Retorna el resultado de la última validación INT8 o None si nunca se ejecutó.
+    """
+    if not os.path.exists(QUANTIZATION_GATE_FILE):
+        return None
+    with open(QUANTIZATION_GATE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def int8_artifacts(weights):
+    """
+    Fechas de modificación de los pesos .pt y de su modelo INT8, tal como se guardan
+    en int8_gate.json para saber si la validación sigue correspondiendo a esos archivos.
+    """
+    int8_path = exported_path(weights, 'onnx_int8')
+    return {
+        'int8': int8_path,
+        'pesos_mtime': os.path.getmtime(weights),
+        'int8_mtime': os.path.getmtime(int8_path) if os.path.exists(int8_path) else None,
+    }
+
+
+def int8_gate_approved(weights):
+    """
+    True si la última validación INT8 fue aprobada con un umbral de al menos
+    QUANTIZATION_MIN_AGREEMENT y ni los pesos .pt ni el modelo INT8 cambiaron desde entonces.
+    """
+    gate = read_quantization_gate()
+    if not gate or not gate.get('aprobado'):
+        return False
+    if gate.get('umbral', 0.0) < QUANTIZATION_MIN_AGREEMENT or gate.get('concordancia', 0.0) < QUANTIZATION_MIN_AGREEMENT:
+        return False
+    recorded = gate.get('artefactos', {}).get(weights)
+    return recorded is not None and recorded == int8_artifacts(weights)
+
+
+def load_model(weights, backend='pytorch'):
+    """
+    Carga un modelo con el backend indicado, exportándolo primero si hace falta.
+    Los modelos exportados se cargan con YOLO igual que los .pt, así que predict()
+    y los resultados tienen la misma forma en todos los backends.
+    El modelo INT8 solo se usa si pasó la validación de concordancia; si no, se usa el ONNX completo.
+    """
+    if backend == 'onnx_int8' and not int8_gate_approved(weights):
+        print(f"ADVERTENCIA: El modelo INT8 de {weights} no está aprobado por {QUANTIZATION_GATE_FILE}; se usa el backend onnx.")
+        backend = 'onnx'
+    path = ensure_exported(weights, backend)
+    if backend == 'pytorch':
+        return YOLO(path)
+    return YOLO(path, task='detect')
@@ -0,0 +1,72 @@
+import time
+import threading
+
+
+def collect_batch(grabber, batch_size, max_wait_ms):
+    """
+    Junta hasta `batch_size` frames distintos del thread de captura, esperando como
+    máximo `max_wait_ms` milisegundos desde el primero. Con batch_size=1 equivale a
+    pedir un solo frame.
+    Retorna una lista de (secuencia, timestamp, frame); vacía si la cámara no entregó nada.
+    """
+    first = grabber.get_latest()
+    if first is None:
+        return []
+    batch = [first]
+    deadline = time.time() + max_wait_ms / 1000.0
+    while len(batch) < batch_size:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        captured = grabber.get_latest(timeout=remaining)
+        if captured is None:
+            break
+        batch.append(captured)
+    return batch
+
+
+class BatchStats:
+    """
+    Acumula fps y latencia de la inferencia por configuración de batch
+    (tamaño de batch y espera máxima), para comparar los ajustes en la línea.
+    La latencia se mide desde la captura de cada frame hasta que su resultado está listo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._settings = {}
+
+    def record(self, batch_size, max_wait_ms, capture_timestamps, cycle_start, inference_s):
+        done = time.time()
+        key = f"batch={batch_size},wait={max_wait_ms}ms"
+        with self._lock:
+            s = self._settings.setdefault(key, {
+                'batches': 0, 'frames': 0, 'wall_s': 0.0, 'inference_s': 0.0,
+                'latency_sum_s': 0.0, 'latency_max_s': 0.0
+            })
+            s['batches'] += 1
+            s['frames'] += len(capture_timestamps)
+            s['wall_s'] += done - cycle_start
+            s['inference_s'] += inference_s
+            for ts in capture_timestamps:
+                latency = done - ts
+                s['latency_sum_s'] += latency
+                s['latency_max_s'] = max(s['latency_max_s'], latency)
+
+    def get_report(self):
+        """
+        Retorna {configuración: {'fps', 'latencia_promedio_ms', 'latencia_max_ms', ...}}.
+        """
+        report = {}
+        with self._lock:
+            for key, s in self._settings.items():
+                frames = s['frames']
+                report[key] = {
+                    'batches': s['batches'],
+                    'frames': frames,
+                    'fps': round(frames / s['wall_s'], 2) if s['wall_s'] > 0 else 0.0,
+                    'inferencia_por_frame_ms': round(s['inference_s'] / frames * 1000, 2) if frames else 0.0,
+                    'latencia_promedio_ms': round(s['latency_sum_s'] / frames * 1000, 2) if frames else 0.0,
+                    'latencia_max_ms': round(s['latency_max_s'] * 1000, 2),
+                }
+        return report
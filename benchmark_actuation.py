@@ -0,0 +1,83 @@
+"""
+Mide el rendimiento de la actuación (planificador + protocolo binario) contra el Arduino emulado.
+
+Uso:
+    python benchmark_actuation.py [--mangos 200] [--rate 10] [--baudrate 9600] [--port /dev/ttyACM0]
+
+Envía la secuencia de pines de cada mango (pin de detección y línea de tiempo de la decisión)
+a la tasa indicada y reporta frames escritos, comandos agrupados, la latencia cola -> cable
+y el tiempo de ida y vuelta hasta el ack. Sin --port usa arduino_emulator.py sobre una pty.
+"""
+import sys
+import time
+import random
+import argparse
+from arduino import ArduinoLink
+from arduino_emulator import ArduinoEmulator
+from actuation import decision_timeline, run_timeline
+
+PINS = {'deteccion': 7, 'exportable': 12, 'no_exportable': 13}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la actuación serial")
+    parser.add_argument('--mangos', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=10.0, help="Mangos por segundo")
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--offset', type=float, default=0.05, help="offset_s de la línea de tiempo")
+    parser.add_argument('--dwell', type=float, default=0.2, help="dwell_s de la línea de tiempo")
+    parser.add_argument('--port', help="Puerto de una placa real en lugar del emulador")
+    args = parser.parse_args()
+
+    emulator = None
+    if args.port:
+        port = args.port
+    else:
+        emulator = ArduinoEmulator(baudrate=args.baudrate).start()
+        port = emulator.port
+    link = ArduinoLink(port, args.baudrate)
+    link.connect(reset_wait_s=2.0 if args.port else 0.1)
+    if not link.is_open():
+        print(f"ERROR: No se pudo abrir {port}")
+        return 1
+
+    def send(pin_role, state, delay=0.0, on_written=None, owner=None):
+        link.schedule(PINS[pin_role], state, delay, on_written, owner)
+
+    timeline = {'offset_s': args.offset, 'dwell_s': args.dwell}
+    start = time.monotonic()
+    for idx in range(args.mangos):
+        target = start + idx / args.rate
+        time.sleep(max(0.0, target - time.monotonic()))
+        send('deteccion', 'H')
+        send('deteccion', 'L', 1.0 / args.rate / 2)
+        run_timeline(decision_timeline(random.random() < 0.5, timeline), send)
+    commands = args.mangos * 5
+
+    # Esperar a que salgan los comandos diferidos y lleguen sus acks
+    deadline = time.monotonic() + args.offset + args.dwell + 5.0
+    while time.monotonic() < deadline:
+        stats = link.get_stats()
+        # Los LOW de una activación reemplazada por la del mango siguiente no salen
+        if stats['comandos_enviados'] + stats['comandos_reemplazados'] >= commands and stats['frames_sin_ack'] == 0:
+            break
+        time.sleep(0.05)
+    elapsed = time.monotonic() - start
+    stats = link.get_stats()
+
+    print(f"Puerto: {port}{' (emulado)' if emulator else ''}, {args.baudrate} baudios")
+    print(f"Mangos: {args.mangos} a {args.rate:.1f}/s  |  comandos: {stats['comandos_enviados']}/{commands} en {elapsed:.2f}s")
+    print(f"Frames escritos: {stats['escrituras']}  |  comandos agrupados: {stats['comandos_agrupados']}"
+          f"  |  comandos reemplazados: {stats['comandos_reemplazados']}")
+    print(f"Acks: {stats['acks']}  rechazos: {stats['rechazos']}  reenvíos: {stats['reenvios']}  perdidos: {stats['frames_perdidos']}")
+    for name, key in (("Cola -> cable", 'latencia_ms'), ("Ida y vuelta", 'ida_y_vuelta_ms')):
+        lat = stats[key]
+        print(f"{name:<14} promedio {lat['promedio']} ms   p95 {lat['p95']} ms   max {lat['max']} ms")
+    if emulator is not None:
+        print(f"Emulador: {emulator.frames_received} frames, {emulator.commands_applied} comandos aplicados, pines {emulator.pins}")
+        emulator.stop()
+    return 0 if stats['frames_perdidos'] == 0 and stats['rechazos'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Compara los backends de inferencia en CPU sobre los mismos frames.
+
+Uso:
+    python benchmark_backends.py images/<lote> [--backends pytorch onnx openvino] [--max-frames 200]
+
+Para cada modelo y backend reporta la latencia por frame (promedio, p50, p95) y la
+concordancia con PyTorch: porcentaje de frames con la misma clase principal (la de
+mayor confianza, o 'no detections') y con el mismo conjunto de clases detectadas.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import cv2
+import numpy as np
+from models import MODEL_FILES
+from backends import BACKEND_FORMATS, load_model
+from config import PREDICT_CONF
+
+
+def load_frames(directory, max_frames):
+    """
+    Lee las fotos JPEG del directorio (recursivo), como las que se guardan en images/<lote>/.
+    Se ignoran los gráficos generados para los reportes.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, '**', '*.jpg'), recursive=True))
+    paths = [p for p in paths if not os.path.basename(p).endswith(('-Pie.jpg', '-Bar.jpg'))]
+    frames = []
+    for path in paths[:max_frames]:
+        frame = cv2.imread(path)
+        if frame is not None:
+            frames.append(frame)
+    return frames
+
+
+def frame_classes(result):
+    """
+    Retorna (clase principal, conjunto de clases) de un resultado de YOLO.
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes.cls) == 0:
+        return 'no detections', frozenset()
+    cls = boxes.cls.cpu().numpy().astype(int)
+    conf = boxes.conf.cpu().numpy()
+    top = result.names[int(cls[int(np.argmax(conf))])]
+    return top, frozenset(result.names[int(c)] for c in cls)
+
+
+def run_backend(weights, backend, frames):
+    """
+    Ejecuta un modelo con un backend frame por frame.
+    Retorna (latencias en segundos, [(clase principal, conjunto de clases)] por frame).
+    """
+    model = load_model(weights, backend)
+    model.predict(frames[0], conf=PREDICT_CONF, verbose=False)  # Calentamiento
+    latencies = []
+    classes = []
+    for frame in frames:
+        start = time.perf_counter()
+        results = model.predict(frame, conf=PREDICT_CONF, verbose=False)
+        latencies.append(time.perf_counter() - start)
+        classes.append(frame_classes(results[0]))
+    return latencies, classes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia y concordancia de los backends de inferencia en CPU")
+    parser.add_argument('directory', help="Directorio con fotos capturadas, ej: images/12345")
+    parser.add_argument('--backends', nargs='+', default=list(BACKEND_FORMATS), choices=list(BACKEND_FORMATS))
+    parser.add_argument('--max-frames', type=int, default=200)
+    args = parser.parse_args()
+
+    frames = load_frames(args.directory, args.max_frames)
+    if not frames:
+        print(f"ERROR: No se encontraron fotos JPEG en {args.directory}")
+        return 1
+    print(f"Frames de prueba: {len(frames)}")
+
+    backends = ['pytorch'] + [b for b in args.backends if b != 'pytorch']
+    for name, weights in MODEL_FILES.items():
+        print(f"\nModelo {weights}")
+        print(f"{'backend':<10} {'prom ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'clase %':>9} {'conjunto %':>11}")
+        reference = None
+        for backend in backends:
+            try:
+                latencies, classes = run_backend(weights, backend, frames)
+            except Exception as e:
+                print(f"{backend:<10} ERROR: {e}")
+                continue
+            if backend == 'pytorch':
+                reference = classes
+            lat_ms = np.array(latencies) * 1000
+            if reference is not None:
+                same_top = sum(1 for a, b in zip(classes, reference) if a[0] == b[0]) / len(frames) * 100
+                same_set = sum(1 for a, b in zip(classes, reference) if a[1] == b[1]) / len(frames) * 100
+                agreement = f"{same_top:>9.1f} {same_set:>11.1f}"
+            else:
+                agreement = f"{'-':>9} {'-':>11}"
+            print(f"{backend:<10} {lat_ms.mean():>9.2f} {np.percentile(lat_ms, 50):>9.2f} "
+                  f"{np.percentile(lat_ms, 95):>9.2f} {agreement}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
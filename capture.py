@@ -0,0 +1,117 @@
+import time
+import threading
+from collections import deque
+
+# Lecturas fallidas seguidas de la cámara antes de dar la captura por perdida
+MAX_READ_ERRORS = 30
+# Frames recientes de los que se guarda el tiempo monotónico de lectura (ver capture_times)
+TIMING_HISTORY = 256
+
+
+class FrameGrabber:
+    """
+    Thread dedicado a leer frames de la cámara y dejarlos en un buffer circular acotado.
+    Si el buffer está lleno se descarta el frame más antiguo, de modo que la inferencia
+    siempre trabaja con lo más reciente de la banda y nunca con frames atrasados.
+    Cada frame se entrega como (secuencia, timestamp, frame); el inicio y fin de su
+    camera.read() en time.monotonic() se consultan con capture_times(secuencia).
+    """
+
+    def __init__(self, camera, max_frames=2):
+        self.camera = camera
+        self.max_frames = max_frames
+        self._frames = deque(maxlen=max_frames)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._seq = 0
+        self._capture_times = {}  # secuencia -> (inicio, fin) de camera.read(), monotónico
+        self._timing_order = deque()
+        self.failed = False
+        # Contadores expuestos en /camera_status
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.read_errors = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread and self._thread.is_alive() and threading.current_thread() != self._thread:
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def is_running(self):
+        return self._running and not self.failed
+
+    def _run(self):
+        consecutive_errors = 0
+        while self._running:
+            read_start = time.monotonic()
+            success, frame = self.camera.read()
+            read_end = time.monotonic()
+            if not success:
+                self.read_errors += 1
+                consecutive_errors += 1
+                if consecutive_errors >= MAX_READ_ERRORS:
+                    print("ERROR: La cámara dejó de entregar frames. Deteniendo captura.")
+                    self.failed = True
+                    break
+                time.sleep(0.01)
+                continue
+            consecutive_errors = 0
+            with self._cond:
+                self._seq += 1
+                if len(self._frames) == self.max_frames:
+                    # deque(maxlen) descarta el más antiguo al agregar
+                    self.frames_dropped += 1
+                self._frames.append((self._seq, time.time(), frame))
+                self._capture_times[self._seq] = (read_start, read_end)
+                self._timing_order.append(self._seq)
+                if len(self._timing_order) > TIMING_HISTORY:
+                    self._capture_times.pop(self._timing_order.popleft(), None)
+                self.frames_captured += 1
+                self._cond.notify_all()
+        with self._cond:
+            self._cond.notify_all()
+
+    def get_latest(self, timeout=1.0):
+        """
+        Retorna el frame más reciente (secuencia, timestamp, frame) y descarta los anteriores.
+        Espera hasta `timeout` segundos si no hay un frame nuevo. Retorna None si no llegó ninguno.
+        """
+        with self._cond:
+            if not self._frames:
+                self._cond.wait_for(lambda: self._frames or not self.is_running(), timeout=timeout)
+            if not self._frames:
+                return None
+            latest = self._frames.pop()
+            # Los frames que quedaban atrás nunca se van a clasificar
+            self.frames_dropped += len(self._frames)
+            self._frames.clear()
+            return latest
+
+    def capture_times(self, seq):
+        """
+        (inicio, fin) de la lectura del frame con esa secuencia, en time.monotonic(),
+        o None si ya salió del historial.
+        """
+        with self._cond:
+            return self._capture_times.get(seq)
+
+    def get_stats(self):
+        with self._cond:
+            depth = len(self._frames)
+        return {
+            "queue_depth": depth,
+            "queue_size": self.max_frames,
+            "frames_captured": self.frames_captured,
+            "frames_dropped": self.frames_dropped,
+            "read_errors": self.read_errors,
+        }
@@ -0,0 +1,84 @@
+import heapq
+import cv2
+import numpy as np
+
+# Varianza del Laplaciano con la que la nitidez cuenta la mitad en el puntaje (~ límite usual de imagen borrosa)
+SHARPNESS_REFERENCE = 100.0
+
+
+class CaptureSelector:
+    """
+    Elige las mejores fotos de un mango durante su ciclo, en lugar de tomarlas en segundos fijos.
+
+    Cada frame clasificado se ofrece con la confianza máxima de sus detecciones. El puntaje es
+    confianza * nitidez, con la nitidez (varianza del Laplaciano sobre el frame reducido)
+    llevada a 0-1. Se guardan los k mejores en un heap acotado; un frame casi igual a uno ya
+    guardado (miniatura en gris con diferencia media menor a min_difference) solo lo reemplaza
+    si tiene mejor puntaje. Las fotos se codifican y guardan recién al terminar el ciclo.
+    """
+
+    def __init__(self, k=4, min_difference=12.0, sharpness_width=160, thumb_size=32):
+        self.k = k
+        self.min_difference = min_difference
+        self.sharpness_width = sharpness_width
+        self.thumb_size = thumb_size
+        self._heap = []          # (puntaje, seq, frame, miniatura), el peor arriba
+        self.offered = 0
+        self.scored = 0
+        self.duplicates = 0
+
+    def reset(self):
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _score(self, frame, confidence):
+        height, width = frame.shape[:2]
+        small_h = max(1, int(height * self.sharpness_width / width))
+        gray = cv2.cvtColor(cv2.resize(frame, (self.sharpness_width, small_h), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+        thumb = cv2.resize(gray, (self.thumb_size, self.thumb_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+        return confidence * sharpness / (sharpness + SHARPNESS_REFERENCE), thumb
+
+    def offer(self, seq, frame, confidence):
+        """
+        Ofrece un frame (seq: número de captura) con la confianza máxima de sus detecciones.
+        Retorna True si quedó entre los seleccionados.
+        """
+        self.offered += 1
+        if confidence <= 0.0:
+            return False  # Sin detecciones: el mango no está a la vista
+        # El puntaje nunca supera la confianza: si no alcanza al peor guardado no se calcula la nitidez
+        if len(self._heap) >= self.k and confidence <= self._heap[0][0]:
+            return False
+        self.scored += 1
+        score, thumb = self._score(frame, confidence)
+        for idx, (kept_score, _seq, _frame, kept_thumb) in enumerate(self._heap):
+            if np.abs(thumb - kept_thumb).mean() < self.min_difference:
+                self.duplicates += 1
+                if score <= kept_score:
+                    return False
+                self._heap[idx] = (score, seq, frame, thumb)
+                heapq.heapify(self._heap)
+                return True
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (score, seq, frame, thumb))
+            return True
+        if score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (score, seq, frame, thumb))
+            return True
+        return False
+
+    def selected_frames(self):
+        """Frames seleccionados en orden de captura."""
+        return [frame for _score, _seq, frame, _thumb in sorted(self._heap, key=lambda entry: entry[1])]
+
+    def get_stats(self):
+        return {
+            "ofrecidos": self.offered,
+            "evaluados": self.scored,
+            "duplicados": self.duplicates,
+            "seleccionados": len(self._heap),
+            "puntajes": sorted((round(entry[0], 3) for entry in self._heap), reverse=True),
+        }
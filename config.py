@@ -0,0 +1,116 @@
+# ----------------------
+# Configuración del pipeline de detección
+# ----------------------
+
+# Modo de inferencia:
+#   'secuencial':  una etapa por modelo (exportabilidad 7s, madurez 5s, defectos 5s)
+#   'concurrente': cada frame pasa por los tres modelos a la vez en el pool de inferencia
+INFERENCE_MODE = 'secuencial'
+FRAMES_PER_MANGO = 30   # Frames a analizar por mango en modo concurrente
+PREDICT_CONF = 0.85     # Confianza mínima de las predicciones YOLO
+# Backend de inferencia en CPU: 'pytorch' (pesos .pt), 'onnx' (ONNX Runtime), 'openvino'
+# u 'onnx_int8' (ONNX cuantizado con python quantization.py images/<lote>).
+# La primera vez se exporta cada modelo y el artefacto queda junto a los pesos (ver backends.py).
+# Para comparar latencia y concordancia: python benchmark_backends.py images/<lote>
+INFERENCE_BACKEND = 'pytorch'
+# Concordancia mínima de la decisión por mango (INT8 vs. precisión completa) para habilitar 'onnx_int8'
+QUANTIZATION_MIN_AGREEMENT = 0.99
+CAPTURE_QUEUE_SIZE = 2  # Frames que guarda el buffer de captura antes de descartar el más antiguo
+# Preprocesamiento compartido: cada batch se convierte a tensor una sola vez y los modelos con el
+# mismo tamaño de entrada reutilizan ese tensor. MODEL_IMGSZ fija el tamaño de entrada por modelo
+# (solo con el backend 'pytorch'; los modelos exportados usan el tamaño de la exportación).
+# No aplica con INFERENCE_WORKERS > 0: los workers preprocesan por su cuenta.
+SHARED_PREPROCESSING = False
+MODEL_IMGSZ = {'exportabilidad': 640, 'madurez': 640, 'defectos': 320}
+# Recorte del mango: exportabilidad localiza el mango y madurez/defectos analizan solo ese recorte
+# (con ROI_MARGIN de margen a cada lado). Requiere SHARED_PREPROCESSING.
+ROI_CROP = False
+ROI_MARGIN = 0.15
+# Workers de inferencia en procesos separados (0 = inferencia en threads del mismo proceso).
+# Los frames viajan por slots de memoria compartida; cada worker carga su propia copia de los modelos.
+INFERENCE_WORKERS = 0
+INFERENCE_SHM_SLOTS = 4  # Batches que pueden estar en vuelo a la vez entre todas las líneas
+INFERENCE_TASK_TIMEOUT_S = 30.0  # Espera máxima por un slot libre o por los resultados de un batch en los workers
+# Inferencia por lotes: se juntan hasta BATCH_SIZE frames (o lo que llegue en BATCH_MAX_WAIT_MS)
+# y se pasan en una sola llamada a predict. BATCH_SIZE = 1 desactiva el batching.
+BATCH_SIZE = 1
+BATCH_MAX_WAIT_MS = 100
+# Salida temprana: una etapa termina cuando su mayoría ya no puede invertirse con los frames
+# restantes, o cuando la cota inferior de Wilson de la mayoría alcanza EARLY_EXIT_CONFIDENCE_BOUND
+# (None desactiva la cota). Nunca antes de EARLY_EXIT_MIN_FRAMES frames.
+EARLY_EXIT = False
+EARLY_EXIT_MIN_FRAMES = 5
+EARLY_EXIT_CONFIDENCE_BOUND = 0.95
+# Cascada: si una etapa ya decidió que el mango no es exportable, las etapas restantes se omiten
+# (quedan marcadas como 'omitida' en stage_results) y el mango libera la línea antes.
+# No depende de EARLY_EXIT: en modo concurrente una etapa cuenta como decidida en contra cuando su
+# mayoría ya no puede invertirse con los frames restantes (desde EARLY_EXIT_MIN_FRAMES frames).
+CASCADE = False
+# Modo continuo: disparador de presencia que abre un nuevo ID de mango.
+#   'frame_diff': diferencia de frames contra el fondo de la banda vacía
+#   'serial':     sensor conectado al Arduino (frame binario PRESENCE_FRAME, ver serial_protocol.py)
+PRESENCE_TRIGGER = 'frame_diff'
+# Compuerta de presencia: los frames sin objeto en la región de interés no pasan por YOLO
+# ni se guardan como detecciones, solo se cuentan. Aprende el fondo del primer frame,
+# así que la cámara debe iniciarse con la banda vacía.
+PRESENCE_GATE = False
+PRESENCE_ROI = None  # (x, y, ancho, alto) en fracciones del frame, ej: (0.2, 0.1, 0.6, 0.8); None = frame completo
+# Fotos de cada mango:
+#   'mejores': las PHOTOS_PER_MANGO más nítidas y con mayor confianza del ciclo, descartando casi
+#              duplicados (diferencia media de miniaturas en gris < PHOTO_MIN_DIFFERENCE, escala 0-255);
+#              se guardan al terminar el ciclo
+#   'tiempos': una foto en cada uno de los segundos fijos 4, 8, 12 y 16 (o su equivalente en frames)
+PHOTO_MODE = 'mejores'
+PHOTOS_PER_MANGO = 4
+PHOTO_MIN_DIFFERENCE = 12.0
+# Volcado de detecciones: el buffer compacto de cada línea se guarda en la BD en segundo plano
+# al llegar a este número de filas o cuando su fila más antigua tiene esta antigüedad (segundos).
+# /save_detections guarda lo que quede pendiente al cerrar el lote.
+DETECTION_FLUSH_ROWS = 50000
+DETECTION_FLUSH_SECONDS = 60
+# Diario de detecciones: cada batch se escribe también a un archivo binario de solo escritura
+# al final (un directorio por línea), con fsync en grupo cada JOURNAL_FSYNC_INTERVAL_S segundos.
+# Si el proceso se cae antes de guardar, al iniciar se recuperan esas detecciones en la BD.
+# None = sin diario.
+JOURNAL_DIR = 'journal'
+JOURNAL_FSYNC_INTERVAL_S = 0.2
+# Escritor único de la BD: agrupa los trabajos encolados (detecciones, resultados de etapa, fotos)
+# en una sola transacción de hasta DB_GROUP_COMMIT_MAX_JOBS trabajos, esperando como máximo
+# DB_GROUP_COMMIT_WAIT_MS a que lleguen más tras el primero.
+DB_GROUP_COMMIT_MAX_JOBS = 64
+DB_GROUP_COMMIT_WAIT_MS = 50
+# Conexiones SQLite persistentes (ver SQLiteConnectionManager en database.py): las consultas de los
+# reportes usan conexiones de solo lectura de un pool que guarda hasta DB_READ_POOL_SIZE libres, y las
+# escrituras una sola conexión dedicada. Cada conexión cachea DB_STATEMENT_CACHE_SIZE sentencias preparadas.
+DB_READ_POOL_SIZE = 8
+DB_STATEMENT_CACHE_SIZE = 128
+
+# ----------------------
+# Líneas (bandas) atendidas por este proceso
+# ----------------------
+# Cada línea tiene su propia cámara, lote/ID, buffer de detecciones, stream y pines del Arduino.
+# Varias líneas pueden compartir un mismo Arduino (mismo puerto) usando pines distintos, siempre que
+# todos estén en ARDUINO_OUTPUT_PINS y en OUTPUT_PINS del firmware (arduino/arduino.ino).
+# Los modelos se cargan una sola vez y se comparten entre todas las líneas.
+# Ajusta el puerto COM según tu Arduino (ej. 'COM3' en Windows, '/dev/ttyACM0' en Linux)
+LANES = {
+    '1': {
+        'camera_index': 1,
+        'serial_port': 'COM7',
+        'pins': {'deteccion': 7, 'exportable': 12, 'no_exportable': 13},
+    },
+}
+# Pines de salida que acepta el firmware (OUTPUT_PINS en arduino/arduino.ino); se validan al iniciar
+ARDUINO_OUTPUT_PINS = (7, 12, 13)
+DEFAULT_LANE = '1'  # Línea usada por los endpoints cuando no se indica ?lane=
+SERIAL_BAUDRATE = 9600
+# Protocolo binario con el Arduino (serial_protocol.py): cada frame de comandos espera un ack;
+# si no llega en SERIAL_ACK_TIMEOUT_S se reenvía hasta SERIAL_ACK_RETRIES veces.
+SERIAL_ACK_TIMEOUT_S = 0.25
+SERIAL_ACK_RETRIES = 1
+# Línea de tiempo de actuación de cada mango, desde el LOW del pin de detección:
+#   offset_s: segundos hasta activar el pin de la decisión (exportable / no exportable)
+#   dwell_s:  segundos que ese pin queda en HIGH antes de volver a LOW
+# Ajustar según la velocidad de la banda y la distancia de la cámara a la compuerta.
+# Una línea puede tener su propia línea de tiempo con la clave 'timeline' en LANES.
+ACTUATION_TIMELINE = {'offset_s': 1.0, 'dwell_s': 5.0}
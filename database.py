@@ -1,48 +1,282 @@
 import base64
 import sqlite3
 import os
+import pathlib
+import threading
+import contextlib
 from datetime import datetime
+from config import DB_READ_POOL_SIZE, DB_STATEMENT_CACHE_SIZE
+
+# Segundos que una conexión espera un lock de la BD antes de fallar
+DB_BUSY_TIMEOUT_S = 10.0
 
 #Ruta de la BD
 def get_db_path():
     """Retorna la ruta al archivo de la base de datos"""
     return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'detections.db')
 
+class SQLiteConnectionManager:
+    """
+    Conexiones SQLite persistentes para una BD. Abrir una conexión por consulta descarta
+    la caché de páginas y las sentencias preparadas en cada llamada, así que:
+
+    - Las consultas (reportes) toman una conexión de solo lectura de un pool (acquire) y la
+      devuelven al terminar (release); el bloque reader() hace las dos cosas y la devuelve aunque
+      la consulta falle. El pool guarda hasta read_pool_size conexiones libres;
+      si todas están ocupadas se abre otra, y la que sobra al devolverse se cierra.
+      Cada conexión la usa un solo thread a la vez (la tiene quien la tomó del pool).
+    - Las escrituras usan una sola conexión dedicada (writer), en modo WAL para que los
+      reportes no bloqueen al escritor ni al revés; el lock la serializa entre threads.
+
+    Cada conexión guarda hasta statement_cache sentencias preparadas (por texto SQL), que se
+    reutilizan mientras la conexión siga abierta.
+    """
+
+    def __init__(self, db_path, read_pool_size=DB_READ_POOL_SIZE, statement_cache=DB_STATEMENT_CACHE_SIZE):
+        self.db_path = db_path
+        self.read_pool_size = read_pool_size
+        self.statement_cache = statement_cache
+        self._idle = []  # LIFO: se reutiliza primero la conexión con la caché más reciente
+        self._idle_lock = threading.Lock()
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self.read_opened = 0
+        self.read_reused = 0
+        self.read_closed = 0
+
+    def _connect(self, read_only):
+        if read_only:
+            conn = sqlite3.connect(pathlib.Path(self.db_path).as_uri() + '?mode=ro', uri=True,
+                                   timeout=DB_BUSY_TIMEOUT_S, check_same_thread=False,
+                                   cached_statements=self.statement_cache)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT_S, check_same_thread=False,
+                                   cached_statements=self.statement_cache)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def acquire(self):
+        """Toma una conexión de solo lectura del pool (o abre una si no hay libres)."""
+        with self._idle_lock:
+            if self._idle:
+                self.read_reused += 1
+                return self._idle.pop()
+            self.read_opened += 1
+        return self._connect(read_only=True)
+
+    def release(self, conn, cursor=None):
+        """
+        Devuelve una conexión tomada con acquire. Cerrar el cursor termina la lectura en curso,
+        así quien tome la conexión después no ve una instantánea vieja de la BD.
+        """
+        if cursor is not None:
+            cursor.close()
+        if conn.in_transaction:
+            conn.rollback()
+        with self._idle_lock:
+            if len(self._idle) < self.read_pool_size:
+                self._idle.append(conn)
+                return
+            self.read_closed += 1
+        conn.close()
+
+    @contextlib.contextmanager
+    def reader(self):
+        """
+        Cursor de una conexión de solo lectura del pool, que vuelve al pool al salir del bloque
+        (también si la consulta lanza una excepción).
+        """
+        conn = self.acquire()
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            self.release(conn, cursor)
+
+    @contextlib.contextmanager
+    def writer(self):
+        """
+        Conexión de escritura dedicada, con el lock de escritura tomado mientras dura el bloque.
+        Si el bloque falla se hace rollback, así la conexión compartida no queda con una transacción a medias.
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    def close(self):
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def get_stats(self):
+        with self._idle_lock:
+            idle = len(self._idle)
+        return {
+            "lectura_libres": idle,
+            "lectura_abiertas": self.read_opened,
+            "lectura_reutilizadas": self.read_reused,
+            "lectura_cerradas": self.read_closed,
+            "escritura_abierta": self._writer is not None,
+        }
+
+# Administradores de conexiones por ruta de BD
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_connection_manager(db_path=None):
+    """Retorna el administrador de conexiones de la BD (la de get_db_path() por defecto), creándolo la primera vez."""
+    db_path = db_path or get_db_path()
+    with _managers_lock:
+        if db_path not in _managers:
+            _managers[db_path] = SQLiteConnectionManager(db_path)
+        return _managers[db_path]
+
+def read_cursor():
+    """Bloque con un cursor de solo lectura del pool: with read_cursor() as cursor: ..."""
+    return get_connection_manager().reader()
+
+def write_connection():
+    """Bloque con la conexión de escritura dedicada: with write_connection() as conn: ..."""
+    return get_connection_manager().writer()
+
 #Inicialización de la BD
 def init_db():
     """Inicializa la base de datos y crea las tablas necesarias si no existen"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    # Crear tabla de detecciones
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS detections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lote_number INTEGER,
-            item_id INTEGER,
-            detection_date DATE,
-            detection_time TIME,
-            model_name TEXT,
-            detection_type TEXT,
-            confidence REAL
-        )
-    ''')
-    
-    # Crear nueva tabla para imágenes capturadas (ahora con columna BLOB para la imagen)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS captured_images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lote_number INTEGER,
-            item_id INTEGER,
-            capture_date DATE,
-            capture_time TIME,
-            image_path TEXT UNIQUE,
-            image_blob BLOB
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        
+        # Crear tabla de detecciones
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                lote_number INTEGER,
+                item_id INTEGER,
+                detection_date DATE,
+                detection_time TIME,
+                model_name TEXT,
+                detection_type TEXT,
+                confidence REAL
+            )
+        ''')
+        
+        # Crear nueva tabla para imágenes capturadas (ahora con columna BLOB para la imagen)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS captured_images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                lote_number INTEGER,
+                item_id INTEGER,
+                capture_date DATE,
+                capture_time TIME,
+                image_path TEXT UNIQUE,
+                image_blob BLOB
+            )
+        ''')
+        
+        # Crear tabla con el resultado de cada etapa (modelo) por mango: motivo de fin y frames usados
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stage_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                lote_number INTEGER,
+                item_id INTEGER,
+                model_name TEXT,
+                stop_reason TEXT,
+                frames_used INTEGER,
+                duration REAL
+            )
+        ''')
+        
+        # Crear tabla con el desglose de latencia (ms) de cada mango, desde la lectura de su frame decisivo
+        # hasta que el pin de la decisión sale por el serial (ver latency_trace.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS latency_traces (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                lote_number INTEGER,
+                item_id INTEGER,
+                capture_ms REAL,
+                queue_wait_ms REAL,
+                inference_ms REAL,
+                vote_ms REAL,
+                serial_enqueue_ms REAL,
+                timeline_offset_ms REAL,
+                serial_write_ms REAL,
+                total_ms REAL
+            )
+        ''')
+        
+        # Crear tabla con los segmentos del diario de detecciones (detection_journal.py) ya guardados:
+        # se escriben en el mismo commit que sus filas, así recuperar el diario no las duplica
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal_segments (
+                segment TEXT PRIMARY KEY,
+                committed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        conn.commit()
+
+#Sentencias de escritura: las usan las funciones save_* y el escritor en segundo plano (db_writer.py),
+#que las agrupa en una sola transacción
+def insert_detections(cursor, detections_list):
+    """Inserta detecciones [lote, id, fecha, hora, modelo, tipo_deteccion, confianza] con el cursor dado"""
+    cursor.executemany(
+        'INSERT INTO detections (lote_number, item_id, detection_date, detection_time, model_name, detection_type, confidence) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        detections_list
+    )
+
+def insert_stage_results(cursor, stage_results_list):
+    """Inserta resultados de etapa [lote, id, modelo, motivo_fin, frames_usados, duracion] con el cursor dado"""
+    cursor.executemany(
+        'INSERT INTO stage_results (lote_number, item_id, model_name, stop_reason, frames_used, duration) VALUES (?, ?, ?, ?, ?, ?)',
+        stage_results_list
+    )
+
+def insert_journal_segments(cursor, segments):
+    """Marca como guardados los segmentos del diario cuyas filas van en la misma transacción"""
+    cursor.executemany('INSERT OR IGNORE INTO journal_segments (segment) VALUES (?)', [(segment,) for segment in segments])
+
+def get_committed_journal_segments(segments):
+    """
+    Retorna el subconjunto de segments (rutas de segmentos del diario) cuyas filas ya están en la BD.
+    """
+    if not segments:
+        return set()
+    with read_cursor() as cursor:
+        placeholders = ', '.join('?' for _ in segments)
+        cursor.execute(f'SELECT segment FROM journal_segments WHERE segment IN ({placeholders})', list(segments))
+        committed = {row[0] for row in cursor.fetchall()}
+    return committed
+
+def forget_journal_segments(directory):
+    """Borra las marcas de los segmentos de un diario; se llama cuando ya no le quedan segmentos en disco"""
+    prefix = os.path.join(directory, '')
+    with write_connection() as conn:
+        conn.execute('DELETE FROM journal_segments WHERE substr(segment, 1, ?) = ?', (len(prefix), prefix))
+        conn.commit()
+
+def insert_image(cursor, lote_number, item_id, capture_date, capture_time, image_path, image_blob):
+    """Inserta una imagen capturada (ruta y BLOB) con el cursor dado"""
+    cursor.execute(
+        'INSERT INTO captured_images (lote_number, item_id, capture_date, capture_time, image_path, image_blob) VALUES (?, ?, ?, ?, ?, ?)',
+        (lote_number, item_id, capture_date, capture_time, image_path, image_blob)
+    )
+
+def insert_latency_trace(cursor, lote_number, item_id, breakdown):
+    """Inserta el desglose de latencia de un mango (dict de MangoLatencyTrace.breakdown()) con el cursor dado"""
+    cursor.execute(
+        'INSERT INTO latency_traces (lote_number, item_id, capture_ms, queue_wait_ms, inference_ms, vote_ms, serial_enqueue_ms, timeline_offset_ms, serial_write_ms, total_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (lote_number, item_id, breakdown['capture'], breakdown['queue_wait'], breakdown['inference'], breakdown['vote'],
+         breakdown['serial_enqueue'], breakdown['timeline_offset'], breakdown['serial_write'], breakdown['total'])
+    )
 
 #Guardado de las detecciones
 def save_detections_db(detections_list):
@@ -56,16 +290,26 @@ def save_detections_db(detections_list):
     if not detections_list:
         return
         
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.executemany(
-        'INSERT INTO detections (lote_number, item_id, detection_date, detection_time, model_name, detection_type, confidence) VALUES (?, ?, ?, ?, ?, ?, ?)',
-        detections_list
-    )
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        insert_detections(cursor, detections_list)
+        conn.commit()
+
+def save_stage_results_db(stage_results_list):
+    """
+    Guarda el resultado de las etapas de cada mango en la base de datos
     
-    conn.commit()
-    conn.close()
+    Args:
+        stage_results_list: Lista de resultados en formato
+        [lote, id, modelo, motivo_fin, frames_usados, duracion]
+    """
+    if not stage_results_list:
+        return
+        
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        insert_stage_results(cursor, stage_results_list)
+        conn.commit()
 
 def save_image_db(lote_number, item_id, image_path):
     """
@@ -76,8 +320,6 @@ def save_image_db(lote_number, item_id, image_path):
         item_id (int): ID del mango.
         image_path (str): Ruta relativa o absoluta del archivo de imagen.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
     current_time = datetime.now()
     capture_date = current_time.strftime('%Y-%m-%d')
     capture_time = current_time.strftime('%H:%M:%S')
@@ -89,11 +331,10 @@ def save_image_db(lote_number, item_id, image_path):
         # Leer la imagen como binario (BLOB)
         with open(image_path, 'rb') as f:
             image_blob = f.read()
-        cursor.execute(
-            'INSERT INTO captured_images (lote_number, item_id, capture_date, capture_time, image_path, image_blob) VALUES (?, ?, ?, ?, ?, ?)',
-            (lote_number, item_id, capture_date, capture_time, image_path, image_blob)
-        )
-        conn.commit()
+        with write_connection() as conn:
+            cursor = conn.cursor()
+            insert_image(cursor, lote_number, item_id, capture_date, capture_time, image_path, image_blob)
+            conn.commit()
         print(f"DEBUG: Imagen {image_path} guardada exitosamente en la base de datos como BLOB.")
     except sqlite3.IntegrityError as e:
         # Esto se activaría si image_path ya existe debido a la restricción UNIQUE
@@ -101,19 +342,15 @@ def save_image_db(lote_number, item_id, image_path):
     except Exception as e:
         # Captura cualquier otra excepción durante el proceso de guardado
         print(f"ERROR: Error general al guardar la imagen en la base de datos: {e}")
-    finally:
-        conn.close()
 
 def get_images_by_lote_and_id(lote_number, item_id):
     """
     Obtiene las imágenes (BLOB) asociadas a un lote y un ID específico.
     Devuelve una lista de imágenes codificadas en base64 (para mostrar en HTML).
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('''SELECT image_blob FROM captured_images WHERE lote_number = ? AND item_id = ? ORDER BY id ASC''', (int(lote_number), int(item_id)))
-    blobs = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('''SELECT image_blob FROM captured_images WHERE lote_number = ? AND item_id = ? ORDER BY id ASC''', (int(lote_number), int(item_id)))
+        blobs = [row[0] for row in cursor.fetchall()]
     # Convertir cada blob a base64 para mostrar en HTML
     images_base64 = []
     for blob in blobs:
@@ -121,15 +358,39 @@ def get_images_by_lote_and_id(lote_number, item_id):
             images_base64.append(base64.b64encode(blob).decode('utf-8'))
     return images_base64
 
+def get_captured_image_blobs(lote_number=None):
+    """
+    Obtiene las fotos capturadas como (lote, ID, BLOB JPEG), de un lote o de todos.
+    Se usa para calibrar y validar los modelos cuantizados con capturas reales.
+    """
+    with read_cursor() as cursor:
+        if lote_number is None:
+            cursor.execute('SELECT lote_number, item_id, image_blob FROM captured_images ORDER BY id ASC')
+        else:
+            cursor.execute('SELECT lote_number, item_id, image_blob FROM captured_images WHERE lote_number = ? ORDER BY id ASC', (int(lote_number),))
+        rows = [row for row in cursor.fetchall() if row[2]]
+    return rows
+
+def get_latency_traces_lote(lote_number):
+    """
+    Retorna el desglose de latencia de cada mango de un lote como lista de dicts
+    con las mismas claves que MangoLatencyTrace.breakdown().
+    """
+    with read_cursor() as cursor:
+        cursor.execute(
+            'SELECT capture_ms, queue_wait_ms, inference_ms, vote_ms, serial_enqueue_ms, timeline_offset_ms, serial_write_ms, total_ms FROM latency_traces WHERE lote_number = ?',
+            (lote_number,)
+        )
+        keys = ('capture', 'queue_wait', 'inference', 'vote', 'serial_enqueue', 'timeline_offset', 'serial_write', 'total')
+        rows = [dict(zip(keys, row)) for row in cursor.fetchall()]
+    return rows
+
 def get_lotes():
     """Obtiene todos los números de lote únicos de la base de datos"""
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT DISTINCT lote_number FROM detections ORDER BY lote_number')
-    lotes = [str(row[0]) for row in cursor.fetchall()]
-    
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT DISTINCT lote_number FROM detections ORDER BY lote_number')
+        lotes = [str(row[0]) for row in cursor.fetchall()]
+        
     return lotes
 
 #Funciones para lotes
@@ -141,11 +402,9 @@ def get_num_mangos_procesados(lote_number):
     Returns:
         int: cantidad de item_id únicos para ese lote
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(DISTINCT item_id) FROM detections WHERE lote_number = ?', (int(lote_number),))
-    count = cursor.fetchone()[0]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT COUNT(DISTINCT item_id) FROM detections WHERE lote_number = ?', (int(lote_number),))
+        count = cursor.fetchone()[0]
     return count
 
 def get_num_detecciones_lote(lote_number):
@@ -156,11 +415,9 @@ def get_num_detecciones_lote(lote_number):
     Returns:
         int: cantidad de registros para ese lote
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM detections WHERE lote_number = ?', (int(lote_number),))
-    count = cursor.fetchone()[0]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM detections WHERE lote_number = ?', (int(lote_number),))
+        count = cursor.fetchone()[0]
     return count
 
 def get_num_exportables_no_exportables(lote_number):
@@ -172,46 +429,52 @@ def get_num_exportables_no_exportables(lote_number):
     Returns:
         dict: {'exportable': int, 'no_exportable': int}
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
+                    SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'exportabilidad.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
-                SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                SUM(CASE WHEN T2.detection_type = 'exportable' AND T1.exportable_count > T1.no_exportable_count THEN 1 ELSE 0 END) AS exportables,
+                SUM(CASE WHEN T2.detection_type = 'no_exportable' AND T1.no_exportable_count > T1.exportable_count THEN 1 ELSE 0 END) AS no_exportables
             FROM
-                detections
+                item_votes AS T1
+            JOIN
+                detections AS T2 ON T1.item_id = T2.item_id
             WHERE
-                lote_number = ?
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN T2.detection_type = 'exportable' AND T1.exportable_count > T1.no_exportable_count THEN 1 ELSE 0 END) AS exportables,
-            SUM(CASE WHEN T2.detection_type = 'no_exportable' AND T1.no_exportable_count > T1.exportable_count THEN 1 ELSE 0 END) AS no_exportables
-        FROM
-            item_votes AS T1
-        JOIN
-            detections AS T2 ON T1.item_id = T2.item_id
-        WHERE
-            T2.lote_number = ?;
-        """
-        
-        cursor.execute(query, (int(lote_number), int(lote_number)))
-        result = cursor.fetchone()
-
-        exportable = result[0] if result[0] is not None else 0
-        no_exportable = result[1] if result[1] is not None else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        exportable = 0
-        no_exportable = 0
-    finally:
-        conn.close()
+                T2.lote_number = ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM stage_results AS omitidas
+                    WHERE omitidas.lote_number = T2.lote_number AND omitidas.item_id = T2.item_id
+                    AND omitidas.model_name = 'exportabilidad.pt' AND omitidas.stop_reason = 'omitida'
+                );
+            """
+            
+            cursor.execute(query, (int(lote_number), int(lote_number)))
+            result = cursor.fetchone()
+
+            exportable = result[0] if result[0] is not None else 0
+            no_exportable = result[1] if result[1] is not None else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            exportable = 0
+            no_exportable = 0
 
     return {'exportable': exportable, 'no_exportable': no_exportable}
 
@@ -224,46 +487,52 @@ def get_num_verdes_maduros(lote_number):
     Returns:
         dict: {'mango_verde': int, 'mango_maduro': int}
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count,
+                    SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'madurez.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count,
-                SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count
+                SUM(CASE WHEN T2.detection_type = 'mango_verde' AND T1.verde_count > T1.maduro_count THEN 1 ELSE 0 END) AS verdes,
+                SUM(CASE WHEN T2.detection_type = 'mango_maduro' AND T1.maduro_count > T1.verde_count THEN 1 ELSE 0 END) AS maduros
             FROM
-                detections
+                item_votes AS T1
+            JOIN
+                detections AS T2 ON T1.item_id = T2.item_id
             WHERE
-                lote_number = ?
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN T2.detection_type = 'mango_verde' AND T1.verde_count > T1.maduro_count THEN 1 ELSE 0 END) AS verdes,
-            SUM(CASE WHEN T2.detection_type = 'mango_maduro' AND T1.maduro_count > T1.verde_count THEN 1 ELSE 0 END) AS maduros
-        FROM
-            item_votes AS T1
-        JOIN
-            detections AS T2 ON T1.item_id = T2.item_id
-        WHERE
-            T2.lote_number = ?;
-        """
-        
-        cursor.execute(query, (int(lote_number), int(lote_number)))
-        result = cursor.fetchone()
-
-        mango_verde = result[0] if result[0] is not None else 0
-        mango_maduro = result[1] if result[1] is not None else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        mango_verde = 0
-        mango_maduro = 0
-    finally:
-        conn.close()
+                T2.lote_number = ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM stage_results AS omitidas
+                    WHERE omitidas.lote_number = T2.lote_number AND omitidas.item_id = T2.item_id
+                    AND omitidas.model_name = 'madurez.pt' AND omitidas.stop_reason = 'omitida'
+                );
+            """
+            
+            cursor.execute(query, (int(lote_number), int(lote_number)))
+            result = cursor.fetchone()
+
+            mango_verde = result[0] if result[0] is not None else 0
+            mango_maduro = result[1] if result[1] is not None else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            mango_verde = 0
+            mango_maduro = 0
 
     return {'mango_verde': mango_verde, 'mango_maduro': mango_maduro}
 
@@ -276,46 +545,52 @@ def get_num_con_defectos_sin_defectos(lote_number):
     Returns:
         dict: {'mango_con_defectos': int, 'mango_sin_defectos': int}
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count,
+                    SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'defectos.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count,
-                SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count
+                SUM(CASE WHEN T2.detection_type = 'mango_con_defectos' AND T1.con_defectos_count > T1.sin_defectos_count THEN 1 ELSE 0 END) AS con_defectos,
+                SUM(CASE WHEN T2.detection_type = 'mango_sin_defectos' AND T1.sin_defectos_count > T1.con_defectos_count THEN 1 ELSE 0 END) AS sin_defectos
             FROM
-                detections
+                item_votes AS T1
+            JOIN
+                detections AS T2 ON T1.item_id = T2.item_id
             WHERE
-                lote_number = ?
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN T2.detection_type = 'mango_con_defectos' AND T1.con_defectos_count > T1.sin_defectos_count THEN 1 ELSE 0 END) AS con_defectos,
-            SUM(CASE WHEN T2.detection_type = 'mango_sin_defectos' AND T1.sin_defectos_count > T1.con_defectos_count THEN 1 ELSE 0 END) AS sin_defectos
-        FROM
-            item_votes AS T1
-        JOIN
-            detections AS T2 ON T1.item_id = T2.item_id
-        WHERE
-            T2.lote_number = ?;
-        """
-        
-        cursor.execute(query, (int(lote_number), int(lote_number)))
-        result = cursor.fetchone()
-
-        mango_con_defectos = result[0] if result[0] is not None else 0
-        mango_sin_defectos = result[1] if result[1] is not None else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        mango_con_defectos = 0
-        mango_sin_defectos = 0
-    finally:
-        conn.close()
+                T2.lote_number = ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM stage_results AS omitidas
+                    WHERE omitidas.lote_number = T2.lote_number AND omitidas.item_id = T2.item_id
+                    AND omitidas.model_name = 'defectos.pt' AND omitidas.stop_reason = 'omitida'
+                );
+            """
+            
+            cursor.execute(query, (int(lote_number), int(lote_number)))
+            result = cursor.fetchone()
+
+            mango_con_defectos = result[0] if result[0] is not None else 0
+            mango_sin_defectos = result[1] if result[1] is not None else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            mango_con_defectos = 0
+            mango_sin_defectos = 0
 
     return {'mango_con_defectos': mango_con_defectos, 'mango_sin_defectos': mango_sin_defectos}
 
@@ -327,11 +602,9 @@ def get_fecha_procesado_lote(lote_number):
     Returns:
         str: fecha (YYYY-MM-DD) o None si no hay registros
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT detection_date FROM detections WHERE lote_number = ? ORDER BY detection_date ASC LIMIT 1', (int(lote_number),))
-    row = cursor.fetchone()
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT detection_date FROM detections WHERE lote_number = ? ORDER BY detection_date ASC LIMIT 1', (int(lote_number),))
+        row = cursor.fetchone()
     return row[0] if row else None
 
 def get_confianza_promedio_lote(lote_number):
@@ -342,11 +615,9 @@ def get_confianza_promedio_lote(lote_number):
     Returns:
         float: porcentaje de confianza promedio (ej: 93.37)
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND confidence > 0', (int(lote_number),))
-    confidences = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND confidence > 0', (int(lote_number),))
+        confidences = [row[0] for row in cursor.fetchall()]
     if confidences:
         avg = sum(confidences) / len(confidences)
         return round(avg * 100, 2)
@@ -360,11 +631,9 @@ def get_confianza_promedio_exportabilidad(lote_number):
     Returns:
         float: porcentaje de confianza promedio (ej: 93.37)
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND model_name = ? AND confidence > 0', (int(lote_number), 'exportabilidad.pt'))
-    confidences = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND model_name = ? AND confidence > 0', (int(lote_number), 'exportabilidad.pt'))
+        confidences = [row[0] for row in cursor.fetchall()]
     if confidences:
         avg = sum(confidences) / len(confidences)
         return round(avg * 100, 2)
@@ -378,11 +647,9 @@ def get_confianza_promedio_madurez(lote_number):
     Returns:
         float: porcentaje de confianza promedio (ej: 93.37)
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND model_name = ? AND confidence > 0', (int(lote_number), 'madurez.pt'))
-    confidences = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND model_name = ? AND confidence > 0', (int(lote_number), 'madurez.pt'))
+        confidences = [row[0] for row in cursor.fetchall()]
     if confidences:
         avg = sum(confidences) / len(confidences)
         return round(avg * 100, 2)
@@ -396,11 +663,9 @@ def get_confianza_promedio_defectos(lote_number):
     Returns:
         float: porcentaje de confianza promedio (ej: 93.37)
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND model_name = ? AND confidence > 0', (int(lote_number), 'defectos.pt'))
-    confidences = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND model_name = ? AND confidence > 0', (int(lote_number), 'defectos.pt'))
+        confidences = [row[0] for row in cursor.fetchall()]
     if confidences:
         avg = sum(confidences) / len(confidences)
         return round(avg * 100, 2)
@@ -415,40 +680,41 @@ def get_cantidad_mangos_exportables_lote(lote_number):
     Returns:
         int: Cantidad de mangos únicos de tipo 'exportable'.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
+                    SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'exportabilidad.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'exportabilidad.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
-                SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                COUNT(item_id)
             FROM
-                detections
+                item_votes
             WHERE
-                lote_number = ? AND model_name = 'exportabilidad.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            COUNT(item_id)
-        FROM
-            item_votes
-        WHERE
-            exportable_count > no_exportable_count;
-        """
-        
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
-        cantidad = result[0] if result else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        cantidad = 0
-    finally:
-        conn.close()
+                exportable_count > no_exportable_count;
+            """
+            
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
+            cantidad = result[0] if result else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            cantidad = 0
 
     return cantidad
 
@@ -461,40 +727,41 @@ def get_cantidad_mangos_no_exportables_lote(lote_number):
     Returns:
         int: Cantidad de mangos únicos de tipo 'no_exportable'.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
+                    SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'exportabilidad.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'exportabilidad.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
-                SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                COUNT(item_id)
             FROM
-                detections
+                item_votes
             WHERE
-                lote_number = ? AND model_name = 'exportabilidad.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            COUNT(item_id)
-        FROM
-            item_votes
-        WHERE
-            no_exportable_count > exportable_count;
-        """
-        
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
-        cantidad = result[0] if result else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        cantidad = 0
-    finally:
-        conn.close()
+                no_exportable_count > exportable_count;
+            """
+            
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
+            cantidad = result[0] if result else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            cantidad = 0
 
     return cantidad
 
@@ -507,40 +774,41 @@ def get_cantidad_mangos_maduros_lote(lote_number):
     Returns:
         int: Cantidad de mangos únicos de tipo 'mango_maduro'.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count,
+                    SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'madurez.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'madurez.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count,
-                SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count
+                COUNT(item_id)
             FROM
-                detections
+                item_votes
             WHERE
-                lote_number = ? AND model_name = 'madurez.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            COUNT(item_id)
-        FROM
-            item_votes
-        WHERE
-            maduro_count > verde_count;
-        """
-        
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
-        cantidad = result[0] if result else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        cantidad = 0
-    finally:
-        conn.close()
+                maduro_count > verde_count;
+            """
+            
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
+            cantidad = result[0] if result else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            cantidad = 0
 
     return cantidad
 
@@ -553,40 +821,41 @@ def get_cantidad_mangos_verdes_lote(lote_number):
     Returns:
         int: Cantidad de mangos únicos de tipo 'mango_verde'.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count,
+                    SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'madurez.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'madurez.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count,
-                SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count
+                COUNT(item_id)
             FROM
-                detections
+                item_votes
             WHERE
-                lote_number = ? AND model_name = 'madurez.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            COUNT(item_id)
-        FROM
-            item_votes
-        WHERE
-            verde_count > maduro_count;
-        """
-        
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
-        cantidad = result[0] if result else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        cantidad = 0
-    finally:
-        conn.close()
+                verde_count > maduro_count;
+            """
+            
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
+            cantidad = result[0] if result else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            cantidad = 0
 
     return cantidad
 
@@ -599,40 +868,41 @@ def get_cantidad_mangos_con_defecto_lote(lote_number):
     Returns:
         int: Cantidad de mangos únicos de tipo 'mango_con_defectos'.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count,
+                    SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'defectos.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'defectos.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count,
-                SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count
+                COUNT(item_id)
             FROM
-                detections
+                item_votes
             WHERE
-                lote_number = ? AND model_name = 'defectos.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            COUNT(item_id)
-        FROM
-            item_votes
-        WHERE
-            con_defectos_count > sin_defectos_count;
-        """
-        
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
-        cantidad = result[0] if result else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        cantidad = 0
-    finally:
-        conn.close()
+                con_defectos_count > sin_defectos_count;
+            """
+            
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
+            cantidad = result[0] if result else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            cantidad = 0
 
     return cantidad
 
@@ -645,40 +915,41 @@ def get_cantidad_mangos_sin_defecto_lote(lote_number):
     Returns:
         int: Cantidad de mangos únicos de tipo 'mango_sin_defectos'.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count,
+                    SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'defectos.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'defectos.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count,
-                SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count
+                COUNT(item_id)
             FROM
-                detections
+                item_votes
             WHERE
-                lote_number = ? AND model_name = 'defectos.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            COUNT(item_id)
-        FROM
-            item_votes
-        WHERE
-            sin_defectos_count > con_defectos_count;
-        """
-        
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
-        cantidad = result[0] if result else 0
-        
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        cantidad = 0
-    finally:
-        conn.close()
+                sin_defectos_count > con_defectos_count;
+            """
+            
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
+            cantidad = result[0] if result else 0
+            
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            cantidad = 0
 
     return cantidad
 
@@ -687,258 +958,264 @@ def get_porcentaje_mangos_exportables_lote(lote_number):
     Retorna el porcentaje de mangos únicos clasificados como exportables
     para un lote dado, usando la lógica de mayoría de votos por item_id.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
+                    SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'exportabilidad.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'exportabilidad.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
-                SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                SUM(CASE WHEN exportable_count > no_exportable_count THEN 1 ELSE 0 END) AS exportable_mangos,
+                SUM(CASE WHEN no_exportable_count > exportable_count THEN 1 ELSE 0 END) AS no_exportable_mangos
             FROM
-                detections
-            WHERE
-                lote_number = ? AND model_name = 'exportabilidad.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN exportable_count > no_exportable_count THEN 1 ELSE 0 END) AS exportable_mangos,
-            SUM(CASE WHEN no_exportable_count > exportable_count THEN 1 ELSE 0 END) AS no_exportable_mangos
-        FROM
-            item_votes;
-        """
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
+                item_votes;
+            """
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
 
-        exportable_mangos = result[0] if result and result[0] is not None else 0
-        no_exportable_mangos = result[1] if result and result[1] is not None else 0
-        total_mangos = exportable_mangos + no_exportable_mangos
-        
-        return round((exportable_mangos / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
+            exportable_mangos = result[0] if result and result[0] is not None else 0
+            no_exportable_mangos = result[1] if result and result[1] is not None else 0
+            total_mangos = exportable_mangos + no_exportable_mangos
+            
+            return round((exportable_mangos / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
 
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        return 0.0
-    finally:
-        conn.close()
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            return 0.0
 
 def get_porcentaje_mangos_no_exportables_lote(lote_number):
     """
     Retorna el porcentaje de mangos únicos clasificados como no exportables
     para un lote dado, usando la lógica de mayoría de votos por item_id.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
+                    SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'exportabilidad.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'exportabilidad.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'exportable' THEN 1 ELSE 0 END) AS exportable_count,
-                SUM(CASE WHEN detection_type = 'no_exportable' THEN 1 ELSE 0 END) AS no_exportable_count
+                SUM(CASE WHEN exportable_count > no_exportable_count THEN 1 ELSE 0 END) AS exportable_mangos,
+                SUM(CASE WHEN no_exportable_count > exportable_count THEN 1 ELSE 0 END) AS no_exportable_mangos
             FROM
-                detections
-            WHERE
-                lote_number = ? AND model_name = 'exportabilidad.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN exportable_count > no_exportable_count THEN 1 ELSE 0 END) AS exportable_mangos,
-            SUM(CASE WHEN no_exportable_count > exportable_count THEN 1 ELSE 0 END) AS no_exportable_mangos
-        FROM
-            item_votes;
-        """
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
+                item_votes;
+            """
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
 
-        exportable_mangos = result[0] if result and result[0] is not None else 0
-        no_exportable_mangos = result[1] if result and result[1] is not None else 0
-        total_mangos = exportable_mangos + no_exportable_mangos
-        
-        return round((no_exportable_mangos / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
+            exportable_mangos = result[0] if result and result[0] is not None else 0
+            no_exportable_mangos = result[1] if result and result[1] is not None else 0
+            total_mangos = exportable_mangos + no_exportable_mangos
+            
+            return round((no_exportable_mangos / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
 
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        return 0.0
-    finally:
-        conn.close()
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            return 0.0
 
 def get_porcentaje_mangos_verdes_lote(lote_number):
     """
     Retorna el porcentaje de mangos únicos clasificados como verdes
     para un lote dado, usando la lógica de mayoría de votos por item_id.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count,
+                    SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'madurez.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'madurez.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count,
-                SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count
+                SUM(CASE WHEN verde_count > maduro_count THEN 1 ELSE 0 END) AS mangos_verdes,
+                SUM(CASE WHEN maduro_count > verde_count THEN 1 ELSE 0 END) AS mangos_maduros
             FROM
-                detections
-            WHERE
-                lote_number = ? AND model_name = 'madurez.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN verde_count > maduro_count THEN 1 ELSE 0 END) AS mangos_verdes,
-            SUM(CASE WHEN maduro_count > verde_count THEN 1 ELSE 0 END) AS mangos_maduros
-        FROM
-            item_votes;
-        """
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
+                item_votes;
+            """
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
 
-        mangos_verdes = result[0] if result and result[0] is not None else 0
-        mangos_maduros = result[1] if result and result[1] is not None else 0
-        total_mangos = mangos_verdes + mangos_maduros
-        
-        return round((mangos_verdes / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
+            mangos_verdes = result[0] if result and result[0] is not None else 0
+            mangos_maduros = result[1] if result and result[1] is not None else 0
+            total_mangos = mangos_verdes + mangos_maduros
+            
+            return round((mangos_verdes / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
 
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        return 0.0
-    finally:
-        conn.close()
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            return 0.0
 
 def get_porcentaje_mangos_maduros_lote(lote_number):
     """
     Retorna el porcentaje de mangos únicos clasificados como maduros
     para un lote dado, usando la lógica de mayoría de votos por item_id.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count,
+                    SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'madurez.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'madurez.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_verde' THEN 1 ELSE 0 END) AS verde_count,
-                SUM(CASE WHEN detection_type = 'mango_maduro' THEN 1 ELSE 0 END) AS maduro_count
+                SUM(CASE WHEN verde_count > maduro_count THEN 1 ELSE 0 END) AS mangos_verdes,
+                SUM(CASE WHEN maduro_count > verde_count THEN 1 ELSE 0 END) AS mangos_maduros
             FROM
-                detections
-            WHERE
-                lote_number = ? AND model_name = 'madurez.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN verde_count > maduro_count THEN 1 ELSE 0 END) AS mangos_verdes,
-            SUM(CASE WHEN maduro_count > verde_count THEN 1 ELSE 0 END) AS mangos_maduros
-        FROM
-            item_votes;
-        """
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
+                item_votes;
+            """
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
 
-        mangos_verdes = result[0] if result and result[0] is not None else 0
-        mangos_maduros = result[1] if result and result[1] is not None else 0
-        total_mangos = mangos_verdes + mangos_maduros
-        
-        return round((mangos_maduros / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
+            mangos_verdes = result[0] if result and result[0] is not None else 0
+            mangos_maduros = result[1] if result and result[1] is not None else 0
+            total_mangos = mangos_verdes + mangos_maduros
+            
+            return round((mangos_maduros / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
 
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        return 0.0
-    finally:
-        conn.close()
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            return 0.0
 
 def get_porcentaje_mangos_con_defecto_lote(lote_number):
     """
     Retorna el porcentaje de mangos únicos clasificados con defecto
     para un lote dado, usando la lógica de mayoría de votos por item_id.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count,
+                    SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'defectos.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'defectos.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count,
-                SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count
+                SUM(CASE WHEN con_defectos_count > sin_defectos_count THEN 1 ELSE 0 END) AS mangos_con_defecto,
+                SUM(CASE WHEN sin_defectos_count > con_defectos_count THEN 1 ELSE 0 END) AS mangos_sin_defecto
             FROM
-                detections
-            WHERE
-                lote_number = ? AND model_name = 'defectos.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN con_defectos_count > sin_defectos_count THEN 1 ELSE 0 END) AS mangos_con_defecto,
-            SUM(CASE WHEN sin_defectos_count > con_defectos_count THEN 1 ELSE 0 END) AS mangos_sin_defecto
-        FROM
-            item_votes;
-        """
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
+                item_votes;
+            """
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
 
-        mangos_con_defecto = result[0] if result and result[0] is not None else 0
-        mangos_sin_defecto = result[1] if result and result[1] is not None else 0
-        total_mangos = mangos_con_defecto + mangos_sin_defecto
-        
-        return round((mangos_con_defecto / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
+            mangos_con_defecto = result[0] if result and result[0] is not None else 0
+            mangos_sin_defecto = result[1] if result and result[1] is not None else 0
+            total_mangos = mangos_con_defecto + mangos_sin_defecto
+            
+            return round((mangos_con_defecto / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
 
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        return 0.0
-    finally:
-        conn.close()
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            return 0.0
 
 def get_porcentaje_mangos_sin_defecto_lote(lote_number):
     """
     Retorna el porcentaje de mangos únicos clasificados sin defecto
     para un lote dado, usando la lógica de mayoría de votos por item_id.
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-
-    try:
-        query = """
-        WITH item_votes AS (
+    with read_cursor() as cursor:
+        try:
+            query = """
+            WITH item_votes AS (
+                SELECT
+                    item_id,
+                    SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count,
+                    SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count
+                FROM
+                    detections
+                WHERE
+                    lote_number = ? AND model_name = 'defectos.pt'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM stage_results AS omitidas
+                        WHERE omitidas.lote_number = detections.lote_number AND omitidas.item_id = detections.item_id
+                        AND omitidas.model_name = 'defectos.pt' AND omitidas.stop_reason = 'omitida'
+                    )
+                GROUP BY
+                    item_id
+            )
             SELECT
-                item_id,
-                SUM(CASE WHEN detection_type = 'mango_con_defectos' THEN 1 ELSE 0 END) AS con_defectos_count,
-                SUM(CASE WHEN detection_type = 'mango_sin_defectos' THEN 1 ELSE 0 END) AS sin_defectos_count
+                SUM(CASE WHEN con_defectos_count > sin_defectos_count THEN 1 ELSE 0 END) AS mangos_con_defecto,
+                SUM(CASE WHEN sin_defectos_count > con_defectos_count THEN 1 ELSE 0 END) AS mangos_sin_defecto
             FROM
-                detections
-            WHERE
-                lote_number = ? AND model_name = 'defectos.pt'
-            GROUP BY
-                item_id
-        )
-        SELECT
-            SUM(CASE WHEN con_defectos_count > sin_defectos_count THEN 1 ELSE 0 END) AS mangos_con_defecto,
-            SUM(CASE WHEN sin_defectos_count > con_defectos_count THEN 1 ELSE 0 END) AS mangos_sin_defecto
-        FROM
-            item_votes;
-        """
-        cursor.execute(query, (int(lote_number),))
-        result = cursor.fetchone()
+                item_votes;
+            """
+            cursor.execute(query, (int(lote_number),))
+            result = cursor.fetchone()
 
-        mangos_con_defecto = result[0] if result and result[0] is not None else 0
-        mangos_sin_defecto = result[1] if result and result[1] is not None else 0
-        total_mangos = mangos_con_defecto + mangos_sin_defecto
-        
-        return round((mangos_sin_defecto / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
+            mangos_con_defecto = result[0] if result and result[0] is not None else 0
+            mangos_sin_defecto = result[1] if result and result[1] is not None else 0
+            total_mangos = mangos_con_defecto + mangos_sin_defecto
+            
+            return round((mangos_sin_defecto / total_mangos) * 100, 2) if total_mangos > 0 else 0.0
 
-    except sqlite3.Error as e:
-        print(f"Error en la base de datos: {e}")
-        return 0.0
-    finally:
-        conn.close()
+        except sqlite3.Error as e:
+            print(f"Error en la base de datos: {e}")
+            return 0.0
 
 def get_ids_lote(lote_number):
     """
@@ -948,14 +1225,42 @@ def get_ids_lote(lote_number):
     Returns:
         list: lista de item_id únicos para ese lote
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT DISTINCT item_id FROM detections WHERE lote_number = ? ORDER BY item_id', (int(lote_number),))
-    ids = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT DISTINCT item_id FROM detections WHERE lote_number = ? ORDER BY item_id', (int(lote_number),))
+        ids = [row[0] for row in cursor.fetchall()]
     return ids
 
+def get_cantidad_mangos_etapa_omitida_lote(lote_number, model_name):
+    """
+    Retorna la cantidad de mangos de un lote en los que la etapa de un modelo se omitió
+    en cascada (otra etapa ya había decidido que el mango no es exportable).
+    Args:
+        lote_number (str o int): Número de lote seleccionado por el usuario
+        model_name (str): Nombre del modelo (ej: 'madurez.pt')
+    Returns:
+        int: cantidad de mangos con la etapa omitida
+    """
+    with read_cursor() as cursor:
+        cursor.execute("SELECT COUNT(DISTINCT item_id) FROM stage_results WHERE lote_number = ? AND model_name = ? AND stop_reason = 'omitida'", (int(lote_number), model_name))
+        count = cursor.fetchone()[0]
+    return count
+
 #Funciones para datos de forma unitaria
+def get_etapa_omitida_mango(lote_number, item_id, model_name):
+    """
+    Indica si la etapa de un modelo se omitió en cascada para un lote e item_id dados.
+    Args:
+        lote_number (str o int): Número de lote seleccionado por el usuario
+        item_id (str o int): ID seleccionado por el usuario
+        model_name (str): Nombre del modelo (ej: 'madurez.pt')
+    Returns:
+        bool: True si la etapa quedó marcada como omitida
+    """
+    with read_cursor() as cursor:
+        cursor.execute("SELECT 1 FROM stage_results WHERE lote_number = ? AND item_id = ? AND model_name = ? AND stop_reason = 'omitida' LIMIT 1", (int(lote_number), int(item_id), model_name))
+        row = cursor.fetchone()
+    return row is not None
+
 def get_fecha_deteccion_lote_id(lote_number, item_id):
     """
     Retorna la fecha más antigua de detección para un lote y item_id dados.
@@ -965,11 +1270,9 @@ def get_fecha_deteccion_lote_id(lote_number, item_id):
     Returns:
         str: fecha (YYYY-MM-DD) más antigua o None si no hay registros
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT detection_date FROM detections WHERE lote_number = ? AND item_id = ? ORDER BY detection_date ASC LIMIT 1', (int(lote_number), int(item_id)))
-    row = cursor.fetchone()
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT detection_date FROM detections WHERE lote_number = ? AND item_id = ? ORDER BY detection_date ASC LIMIT 1', (int(lote_number), int(item_id)))
+        row = cursor.fetchone()
     return row[0] if row else None
 
 def get_exportabilidad_mango(lote_number, item_id):
@@ -979,13 +1282,15 @@ def get_exportabilidad_mango(lote_number, item_id):
         lote_number (str o int): Número de lote seleccionado por el usuario
         item_id (str o int): ID seleccionado por el usuario
     Returns:
-        str: 'Exportable', 'No Exportable', 'Nulo' o 'Sin datos suficientes'
+        str: 'Exportable', 'No Exportable', 'Nulo', 'Omitida' o 'Sin datos suficientes'
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('''SELECT detection_type FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ?''', (int(lote_number), int(item_id), 'exportabilidad.pt'))
-    resultados = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    # Etapa omitida en cascada: sus detecciones parciales (si las hay) no cuentan
+    if get_etapa_omitida_mango(lote_number, item_id, 'exportabilidad.pt'):
+        return 'Omitida'
+
+    with read_cursor() as cursor:
+        cursor.execute('''SELECT detection_type FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ?''', (int(lote_number), int(item_id), 'exportabilidad.pt'))
+        resultados = [row[0] for row in cursor.fetchall()]
 
     if not resultados:
         return 'Sin datos suficientes'
@@ -1016,13 +1321,15 @@ def get_madurez_mango(lote_number, item_id):
         lote_number (str o int): Número de lote seleccionado por el usuario
         item_id (str o int): ID seleccionado por el usuario
     Returns:
-        str: 'Verde', 'Maduro', 'Nulo' o 'Sin datos suficientes'
+        str: 'Verde', 'Maduro', 'Nulo', 'Omitida' o 'Sin datos suficientes'
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('''SELECT detection_type FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ?''', (int(lote_number), int(item_id), 'madurez.pt'))
-    resultados = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    # Etapa omitida en cascada: sus detecciones parciales (si las hay) no cuentan
+    if get_etapa_omitida_mango(lote_number, item_id, 'madurez.pt'):
+        return 'Omitida'
+
+    with read_cursor() as cursor:
+        cursor.execute('''SELECT detection_type FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ?''', (int(lote_number), int(item_id), 'madurez.pt'))
+        resultados = [row[0] for row in cursor.fetchall()]
 
     if not resultados:
         return 'Sin datos suficientes'
@@ -1053,13 +1360,15 @@ def get_defectos_mango(lote_number, item_id):
         lote_number (str o int): Número de lote seleccionado por el usuario
         item_id (str o int): ID seleccionado por el usuario
     Returns:
-        str: 'No', 'Si', 'Nulo' o 'Sin datos suficientes'
+        str: 'No', 'Si', 'Nulo', 'Omitida' o 'Sin datos suficientes'
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('''SELECT detection_type FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ?''', (int(lote_number), int(item_id), 'defectos.pt'))
-    resultados = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    # Etapa omitida en cascada: sus detecciones parciales (si las hay) no cuentan
+    if get_etapa_omitida_mango(lote_number, item_id, 'defectos.pt'):
+        return 'Omitida'
+
+    with read_cursor() as cursor:
+        cursor.execute('''SELECT detection_type FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ?''', (int(lote_number), int(item_id), 'defectos.pt'))
+        resultados = [row[0] for row in cursor.fetchall()]
 
     if not resultados:
         return 'Sin datos suficientes'
@@ -1092,11 +1401,9 @@ def get_confianza_promedio_exportabilidad_mango(lote_number, item_id):
     Returns:
         float: porcentaje de confianza promedio (ej: 93.37)
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ? AND confidence > 0', (int(lote_number), int(item_id), 'exportabilidad.pt'))
-    confidences = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ? AND confidence > 0', (int(lote_number), int(item_id), 'exportabilidad.pt'))
+        confidences = [row[0] for row in cursor.fetchall()]
     if confidences:
         avg = sum(confidences) / len(confidences)
         return round(avg * 100, 2)
@@ -1111,11 +1418,9 @@ def get_confianza_promedio_madurez_mango(lote_number, item_id):
     Returns:
         float: porcentaje de confianza promedio (ej: 93.37)
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ? AND confidence > 0', (int(lote_number), int(item_id), 'madurez.pt'))
-    confidences = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ? AND confidence > 0', (int(lote_number), int(item_id), 'madurez.pt'))
+        confidences = [row[0] for row in cursor.fetchall()]
     if confidences:
         avg = sum(confidences) / len(confidences)
         return round(avg * 100, 2)
@@ -1130,11 +1435,9 @@ def get_confianza_promedio_defectos_mango(lote_number, item_id):
     Returns:
         float: porcentaje de confianza promedio (ej: 93.37)
     """
-    conn = sqlite3.connect(get_db_path())
-    cursor = conn.cursor()
-    cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ? AND confidence > 0', (int(lote_number), int(item_id), 'defectos.pt'))
-    confidences = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_cursor() as cursor:
+        cursor.execute('SELECT confidence FROM detections WHERE lote_number = ? AND item_id = ? AND model_name = ? AND confidence > 0', (int(lote_number), int(item_id), 'defectos.pt'))
+        confidences = [row[0] for row in cursor.fetchall()]
     if confidences:
         avg = sum(confidences) / len(confidences)
         return round(avg * 100, 2)
@@ -0,0 +1,180 @@
+import os
+import time
+import queue
+import sqlite3
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import Future
+import cv2
+from database import (get_connection_manager, insert_detections, insert_stage_results, insert_image, insert_latency_trace,
+                      insert_journal_segments)
+from config import DB_GROUP_COMMIT_MAX_JOBS, DB_GROUP_COMMIT_WAIT_MS
+
+# Cantidad de commits recientes con que se calculan las estadísticas de latencia
+LATENCY_WINDOW = 200
+
+
+class DatabaseWriter:
+    """
+    Único thread que escribe en la BD. Usa la conexión de escritura dedicada de la BD
+    (ver SQLiteConnectionManager en database.py) y consume una cola de trabajos (lotes de detecciones, resultados de etapa, fotos): toma
+    los trabajos que llegan juntos (hasta DB_GROUP_COMMIT_MAX_JOBS o DB_GROUP_COMMIT_WAIT_MS)
+    y los guarda en una sola transacción, con un solo commit.
+
+    Los threads de captura solo encolan; cada submit_* retorna un Future que se completa
+    cuando el commit del grupo terminó (o con la excepción si falló).
+    """
+
+    def __init__(self, db_path=None, max_jobs=DB_GROUP_COMMIT_MAX_JOBS, wait_ms=DB_GROUP_COMMIT_WAIT_MS):
+        self.connections = get_connection_manager(db_path)
+        self.max_jobs = max_jobs
+        self.wait_s = wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self.commits = 0
+        self.jobs_committed = 0
+        self.failed_commits = 0
+        self._commit_latencies = deque(maxlen=LATENCY_WINDOW)  # segundos por commit de grupo
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _submit(self, kind, *args):
+        future = Future()
+        self._queue.put((kind, args, future))
+        return future
+
+    def submit_detections(self, detections_list, stage_results_list=(), journal_segments=()):
+        """
+        Encola detecciones [lote, id, fecha, hora, modelo, tipo, confianza] y resultados de etapa.
+        journal_segments: segmentos del diario con esas filas; quedan marcados en el mismo commit.
+        """
+        return self._submit('detections', detections_list, stage_results_list, journal_segments)
+
+    def submit_image(self, lote_number, item_id, image_path, frame):
+        """
+        Encola una foto: el writer la codifica a JPEG una sola vez en memoria y guarda esos
+        bytes en image_path y como BLOB en captured_images, sin volver a leer el archivo.
+        """
+        return self._submit('image', lote_number, item_id, image_path, frame)
+
+    def submit_latency_trace(self, lote_number, item_id, breakdown):
+        """Encola el desglose de latencia de un mango (tabla latency_traces)."""
+        return self._submit('latency', lote_number, item_id, breakdown)
+
+    def _write_job(self, cursor, kind, args):
+        if kind == 'detections':
+            detections_list, stage_results_list, journal_segments = args
+            insert_detections(cursor, detections_list)
+            if stage_results_list:
+                insert_stage_results(cursor, stage_results_list)
+            if journal_segments:
+                insert_journal_segments(cursor, journal_segments)
+        elif kind == 'latency':
+            insert_latency_trace(cursor, *args)
+        elif kind == 'image':
+            lote_number, item_id, image_path, frame = args
+            ok, encoded = cv2.imencode('.jpg', frame)
+            if not ok:
+                print(f"ERROR: No se pudo codificar la imagen {image_path}.")
+                return
+            image_blob = encoded.tobytes()
+            os.makedirs(os.path.dirname(image_path), exist_ok=True)
+            with open(image_path, 'wb') as f:
+                f.write(image_blob)
+            current_time = datetime.datetime.now()
+            try:
+                insert_image(cursor, lote_number, item_id, current_time.strftime('%Y-%m-%d'),
+                             current_time.strftime('%H:%M:%S'), image_path, image_blob)
+            except sqlite3.IntegrityError as e:
+                # Solo se descarta esta sentencia; el resto del grupo sigue en la transacción
+                print(f"ERROR: sqlite3.IntegrityError al guardar imagen {image_path}: {e}. La imagen ya existe o hay un conflicto de clave única.")
+
+    def _collect_group(self):
+        """
+        Espera el primer trabajo y junta los que lleguen hasta completar el grupo.
+        """
+        group = [self._queue.get()]
+        deadline = time.time() + self.wait_s
+        while len(group) < self.max_jobs:
+            remaining = deadline - time.time()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            group.append(job)
+        return group
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            group = self._collect_group()
+            jobs = [job for job in group if job is not None]
+            stopping = len(jobs) < len(group)  # None: pedido de detención encolado por stop()
+            if not jobs:
+                continue
+            start = time.perf_counter()
+            try:
+                # El lock de la conexión de escritura se toma por grupo: init_db y las funciones
+                # save_* de database.py pueden escribir entre un grupo y el siguiente
+                with self.connections.writer() as conn:
+                    cursor = conn.cursor()
+                    for kind, args, _future in jobs:
+                        self._write_job(cursor, kind, args)
+                    conn.commit()
+            except Exception as e:
+                self.failed_commits += 1
+                print(f"ERROR: Escritor de BD: falló el commit de {len(jobs)} trabajos: {e}")
+                for _kind, _args, future in jobs:
+                    future.set_exception(e)
+                continue
+            self._commit_latencies.append(time.perf_counter() - start)
+            self.commits += 1
+            self.jobs_committed += len(jobs)
+            for _kind, _args, future in jobs:
+                future.set_result(None)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def get_stats(self):
+        latencies = sorted(self._commit_latencies)
+        return {
+            "cola": self.queue_depth(),
+            "commits": self.commits,
+            "trabajos_guardados": self.jobs_committed,
+            "trabajos_por_commit": round(self.jobs_committed / self.commits, 2) if self.commits else 0.0,
+            "commits_fallidos": self.failed_commits,
+            "latencia_commit_ms": {
+                "promedio": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2) if latencies else None,
+                "max": round(latencies[-1] * 1000, 2) if latencies else None,
+            },
+        }
+
+    def stop(self):
+        """Termina de escribir lo encolado y detiene el thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+        self._thread = None
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_db_writer():
+    """
+    Retorna el escritor de BD del proceso (uno solo para todas las líneas), iniciándolo si hace falta.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = DatabaseWriter().start()
+        return _writer
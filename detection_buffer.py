@@ -0,0 +1,152 @@
+import time
+import datetime
+import threading
+from array import array
+import numpy as np
+from detection_columns import NO_DETECTIONS
+from detection_journal import encode_batch
+
+
+def format_rows(lote, item_id, timestamp, model, class_code, confidence, model_names, class_names):
+    """
+    Genera las filas [lote, ID, fecha, hora, modelo, clase, confianza] de save_detections_db
+    a partir de columnas con códigos. La fecha y la hora se formatean una vez por segundo.
+    lote / item_id: columnas o un valor para todas las filas; model: columna de códigos o un código.
+    """
+    formatted = {}  # segundo -> (fecha, hora)
+    for i in range(len(timestamp)):
+        second = int(timestamp[i])
+        date_time = formatted.get(second)
+        if date_time is None:
+            moment = datetime.datetime.fromtimestamp(second)
+            date_time = formatted[second] = (moment.strftime('%Y-%m-%d'), moment.strftime('%H:%M:%S'))
+        row_lote = lote[i] if hasattr(lote, '__len__') else lote
+        row_id = item_id[i] if hasattr(item_id, '__len__') else item_id
+        row_model = model[i] if hasattr(model, '__len__') else model
+        yield [None if row_lote < 0 else int(row_lote), None if row_id < 0 else int(row_id), date_time[0], date_time[1],
+               model_names[row_model], class_names[class_code[i]], float(confidence[i])]
+
+
+def rows_from_journal(batches):
+    """
+    Filas de save_detections_db a partir de los batches leídos de un diario (ver detection_journal.read_segment).
+    """
+    for lote, item_id, model_name, class_names, timestamps, class_codes, confidences in batches:
+        yield from format_rows(lote, item_id, timestamps, 0, class_codes, confidences, [model_name], class_names)
+
+
+class DetectionBuffer:
+    """
+    Buffer de detecciones en columnas compactas (array.array): lote, ID, timestamp de
+    captura (epoch), código de modelo, código de clase y confianza. Los nombres de modelo
+    y de clase se guardan una sola vez en tablas de códigos; la fecha y la hora en texto
+    se arman recién al volcar a la BD, con una cache por segundo.
+    Cada fila ocupa 8 + 8 + 8 + 1 + 2 + 4 = 31 bytes.
+    Con journal (DetectionJournal), cada batch se escribe también al diario en disco.
+    """
+
+    def __init__(self, flush_rows=None, flush_seconds=None, journal=None):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.journal = journal
+        self._lock = threading.Lock()
+        self._model_names = []     # código -> nombre de modelo (.pt)
+        self._model_codes = {}
+        self._class_names = []     # código -> nombre de clase
+        self._class_codes = {}
+        self._class_lookup = {}    # modelo -> array id de clase del modelo -> código
+        self._reset_columns()
+        self._oldest_row_time = None
+        self.rows_flushed = 0      # Filas ya volcadas a la BD en el lote actual
+
+    def _reset_columns(self):
+        self._lote = array('q')
+        self._item_id = array('q')
+        self._timestamp = array('d')
+        self._model = array('b')
+        self._class = array('h')
+        self._confidence = array('f')
+
+    def _intern(self, names, codes, name):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def _class_code_lookup(self, model_name, class_names):
+        """
+        Array que traduce los ids de clase de un modelo a los códigos del buffer.
+        """
+        size = max(class_names, default=-1) + 1
+        lookup = self._class_lookup.get(model_name)
+        if lookup is None or len(lookup) != size:
+            lookup = np.array([self._intern(self._class_names, self._class_codes, class_names.get(i, ''))
+                               for i in range(size)], dtype=np.int16)
+            self._class_lookup[model_name] = lookup
+        return lookup
+
+    def __len__(self):
+        return len(self._lote)
+
+    def add_columns(self, lote, item_id, model_name, columns):
+        """
+        Añade las detecciones de un batch (DetectionColumns). Los frames sin detecciones
+        quedan como 'no detections' con confianza 0.
+        """
+        empty = columns.empty_frames()
+        rows = len(columns) + len(empty)
+        if rows == 0:
+            return
+        with self._lock:
+            model_code = self._intern(self._model_names, self._model_codes, model_name)
+            no_detection_code = self._intern(self._class_names, self._class_codes, NO_DETECTIONS)
+            lookup = self._class_code_lookup(model_name, columns.names)
+            class_codes = np.concatenate([lookup[columns.class_id], np.full(len(empty), no_detection_code, dtype=np.int16)])
+            timestamps = np.concatenate([columns.timestamp, columns.frame_timestamps[empty]])
+            confidences = np.concatenate([columns.confidence, np.zeros(len(empty), dtype=np.float32)])
+
+            self._lote.frombytes(np.full(rows, lote if lote is not None else -1, dtype=np.int64).tobytes())
+            self._item_id.frombytes(np.full(rows, item_id if item_id is not None else -1, dtype=np.int64).tobytes())
+            self._timestamp.frombytes(timestamps.astype(np.float64).tobytes())
+            self._model.frombytes(np.full(rows, model_code, dtype=np.int8).tobytes())
+            self._class.frombytes(class_codes.astype(np.int16).tobytes())
+            self._confidence.frombytes(confidences.astype(np.float32).tobytes())
+            if self.journal is not None:
+                self.journal.append(encode_batch(lote if lote is not None else -1, item_id if item_id is not None else -1,
+                                                 model_name, self._class_names, timestamps, class_codes, confidences))
+            if self._oldest_row_time is None:
+                self._oldest_row_time = time.time()
+
+    def should_flush(self):
+        """
+        True si el buffer superó el umbral de filas o su fila más antigua supera el umbral de tiempo.
+        """
+        if self.flush_rows is not None and len(self) >= self.flush_rows:
+            return True
+        oldest = self._oldest_row_time
+        return self.flush_seconds is not None and oldest is not None and time.time() - oldest >= self.flush_seconds
+
+    def drain(self):
+        """
+        Retira todas las filas del buffer. Retorna (filas, cantidad, segmentos): un generador de
+        [lote, ID, fecha, hora, modelo, clase, confianza] (el formato de save_detections_db) y los
+        segmentos del diario con esas filas, que se pueden descartar una vez guardadas.
+        """
+        with self._lock:
+            segments = self.journal.rotate() if self.journal is not None else []
+            lote, item_id, timestamp = self._lote, self._item_id, self._timestamp
+            model, class_code, confidence = self._model, self._class, self._confidence
+            model_names, class_names = list(self._model_names), list(self._class_names)
+            self._reset_columns()
+            self._oldest_row_time = None
+            self.rows_flushed += len(lote)
+        rows = format_rows(lote, item_id, timestamp, model, class_code, confidence, model_names, class_names)
+        return rows, len(lote), segments
+
+    def rows_in_lote(self):
+        """Filas del lote actual: las ya volcadas más las pendientes."""
+        return self.rows_flushed + len(self)
+
+    def start_new_lote(self):
+        self.rows_flushed = 0
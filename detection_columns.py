@@ -0,0 +1,85 @@
+import numpy as np
+
+# Clase que se guarda cuando un frame no tiene detecciones
+NO_DETECTIONS = 'no detections'
+
+
+def to_numpy(values):
+    """
+    Convierte un tensor de torch (CPU o GPU) o un array a numpy.
+    """
+    if hasattr(values, 'cpu'):
+        return values.cpu().numpy()
+    return np.asarray(values)
+
+
+class DetectionColumns:
+    """
+    Detecciones de un modelo sobre un batch de frames, en columnas de numpy:
+    índice de frame, id de clase, confianza y timestamp de captura (epoch).
+    Se construyen en un solo paso por frame, sin recorrer las cajas una por una.
+    """
+    __slots__ = ('names', 'num_frames', 'frame_timestamps', 'frame_index', 'class_id', 'confidence')
+
+    def __init__(self, names, frame_timestamps, frame_index, class_id, confidence):
+        self.names = names
+        self.num_frames = len(frame_timestamps)
+        self.frame_timestamps = frame_timestamps
+        self.frame_index = frame_index
+        self.class_id = class_id
+        self.confidence = confidence
+
+    @classmethod
+    def from_results(cls, results, capture_timestamps):
+        """
+        results: un resultado YOLO (o CompactResult) por frame; capture_timestamps: epoch de captura de cada frame.
+        """
+        class_ids, confidences, frame_index = [], [], []
+        for idx, result in enumerate(results):
+            boxes = result.boxes
+            if boxes is None or len(boxes) == 0:
+                continue
+            frame_cls = to_numpy(boxes.cls).astype(np.int16)
+            class_ids.append(frame_cls)
+            confidences.append(to_numpy(boxes.conf).astype(np.float32))
+            frame_index.append(np.full(len(frame_cls), idx, dtype=np.int16))
+        if class_ids:
+            class_id = np.concatenate(class_ids)
+            confidence = np.concatenate(confidences)
+            frame_idx = np.concatenate(frame_index)
+        else:
+            class_id = np.empty(0, dtype=np.int16)
+            confidence = np.empty(0, dtype=np.float32)
+            frame_idx = np.empty(0, dtype=np.int16)
+        return cls(results[0].names if len(results) else {}, np.asarray(capture_timestamps, dtype=np.float64),
+                   frame_idx, class_id, confidence)
+
+    def __len__(self):
+        return len(self.class_id)
+
+    @property
+    def timestamp(self):
+        """Timestamp de captura de cada detección."""
+        return self.frame_timestamps[self.frame_index]
+
+    def class_index(self, class_name):
+        """Id de una clase en este modelo, o -1 si el modelo no la tiene."""
+        for class_id, name in self.names.items():
+            if name == class_name:
+                return class_id
+        return -1
+
+    def count_per_frame(self, class_name):
+        """Cantidad de detecciones de una clase en cada frame del batch."""
+        mask = self.class_id == self.class_index(class_name)
+        return np.bincount(self.frame_index[mask], minlength=self.num_frames)
+
+    def max_confidence_per_frame(self):
+        """Confianza máxima de las detecciones de cada frame del batch (0 si no tiene)."""
+        best = np.zeros(self.num_frames, dtype=np.float32)
+        np.maximum.at(best, self.frame_index, self.confidence)
+        return best
+
+    def empty_frames(self):
+        """Índices de los frames del batch sin ninguna detección."""
+        return np.flatnonzero(np.bincount(self.frame_index, minlength=self.num_frames) == 0)
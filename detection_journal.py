@@ -0,0 +1,204 @@
+import os
+import glob
+import time
+import zlib
+import struct
+import threading
+import numpy as np
+
+# Cabecera de cada registro: marca, largo del contenido y CRC32 del contenido
+RECORD_HEADER = struct.Struct('<2sII')
+RECORD_MAGIC = b'DJ'
+# Contenido: lote, ID, cantidad de filas, largo del nombre de modelo, cantidad de clases
+BATCH_HEADER = struct.Struct('<qqIBH')
+SEGMENT_PATTERN = 'segment_*.bin'
+
+
+def encode_batch(lote, item_id, model_name, class_names, timestamps, class_codes, confidences):
+    """
+    Registro binario de un batch de detecciones de un modelo: cabecera, nombre del modelo,
+    nombres de clase y las tres columnas (timestamp float64, código de clase int16, confianza float32).
+    class_codes son índices en class_names.
+    """
+    model_bytes = model_name.encode('utf-8')
+    names = b''.join(struct.pack('<B', len(name)) + name for name in (n.encode('utf-8') for n in class_names))
+    payload = b''.join([
+        BATCH_HEADER.pack(lote, item_id, len(timestamps), len(model_bytes), len(class_names)),
+        model_bytes,
+        names,
+        np.asarray(timestamps, dtype='<f8').tobytes(),
+        np.asarray(class_codes, dtype='<i2').tobytes(),
+        np.asarray(confidences, dtype='<f4').tobytes(),
+    ])
+    return RECORD_HEADER.pack(RECORD_MAGIC, len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_batch(payload):
+    """
+    Inverso de encode_batch. Retorna (lote, ID, modelo, [clases], timestamps, códigos, confianzas).
+    """
+    lote, item_id, rows, model_len, num_classes = BATCH_HEADER.unpack_from(payload, 0)
+    offset = BATCH_HEADER.size
+    model_name = payload[offset:offset + model_len].decode('utf-8')
+    offset += model_len
+    class_names = []
+    for _ in range(num_classes):
+        name_len = payload[offset]
+        class_names.append(payload[offset + 1:offset + 1 + name_len].decode('utf-8'))
+        offset += 1 + name_len
+    timestamps = np.frombuffer(payload, dtype='<f8', count=rows, offset=offset)
+    offset += rows * 8
+    class_codes = np.frombuffer(payload, dtype='<i2', count=rows, offset=offset)
+    offset += rows * 2
+    confidences = np.frombuffer(payload, dtype='<f4', count=rows, offset=offset)
+    return lote, item_id, model_name, class_names, timestamps, class_codes, confidences
+
+
+def read_segment(path):
+    """
+    Lee los registros completos de un segmento. Se detiene en el primer registro
+    truncado o con CRC inválido (la escritura que estaba en curso al caerse el proceso).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    batches = []
+    while offset + RECORD_HEADER.size <= len(data):
+        magic, length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if magic != RECORD_MAGIC or len(payload) < length or zlib.crc32(payload) != crc:
+            print(f"ADVERTENCIA: Registro incompleto en {path} (byte {offset}); se descarta el resto del segmento.")
+            break
+        batches.append(decode_batch(payload))
+        offset = start + length
+    return batches
+
+
+class DetectionJournal:
+    """
+    Diario binario de solo escritura al final con las detecciones de una línea, para no
+    perderlas si el proceso se cae antes de guardarlas en la BD.
+
+    Los registros se escriben al archivo al llegar y un thread hace fsync en grupo cada
+    fsync_interval_s, así que una caída pierde como máximo ese intervalo. Al volcar el
+    buffer a la BD se cierra el segmento actual (rotate) y, una vez guardadas las filas,
+    se borran los segmentos cerrados (discard). Al iniciar, replay() lee los segmentos
+    que quedaron de una ejecución anterior.
+
+    El nombre de cada segmento lleva la hora en que se abrió, así no se repite aunque la
+    numeración vuelva a empezar al borrarse todos: la BD guarda esos nombres en el mismo
+    commit que sus filas y replay() omite los que ya están guardados.
+    """
+
+    def __init__(self, directory, fsync_interval_s=0.2):
+        self.directory = directory
+        self.fsync_interval_s = fsync_interval_s
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment_path = None
+        self._segment_bytes = 0
+        self._dirty = False
+        self.records_written = 0
+        self.fsyncs = 0
+        self._running = True
+        self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self._sync_thread.start()
+
+    def existing_segments(self):
+        """Segmentos presentes en disco, en orden de creación."""
+        return sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+
+    def _open_segment(self):
+        segments = self.existing_segments()
+        number = int(os.path.basename(segments[-1])[8:16]) + 1 if segments else 1
+        self._segment_path = os.path.join(self.directory, f"segment_{number:08d}_{time.time_ns()}.bin")
+        self._file = open(self._segment_path, 'ab')
+        self._segment_bytes = 0
+
+    def append(self, record):
+        """
+        Escribe un registro (ver encode_batch) al final del segmento actual.
+        Queda en el archivo de inmediato y en disco con el siguiente fsync del grupo.
+        """
+        with self._lock:
+            if self._file is None:
+                self._open_segment()
+            self._file.write(record)
+            self._file.flush()
+            self._segment_bytes += len(record)
+            self._dirty = True
+            self.records_written += 1
+
+    def _sync(self):
+        with self._lock:
+            if not self._dirty or self._file is None:
+                return
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            self.fsyncs += 1
+
+    def _sync_loop(self):
+        while self._running:
+            time.sleep(self.fsync_interval_s)
+            try:
+                self._sync()
+            except Exception as e:
+                print(f"ERROR: fsync del diario {self.directory}: {e}")
+
+    def rotate(self):
+        """
+        Cierra el segmento actual (con fsync) y lo retorna en una lista (vacía si no había).
+        Los registros siguientes van a un segmento nuevo.
+        """
+        with self._lock:
+            if self._file is None:
+                return []
+            if self._dirty:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+                self.fsyncs += 1
+            self._file.close()
+            closed = self._segment_path
+            self._file = None
+            self._segment_path = None
+            self._segment_bytes = 0
+            return [closed]
+
+    def discard(self, segments):
+        """Borra segmentos cuyas filas ya están guardadas en la BD."""
+        for path in segments:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def replay(self, committed=()):
+        """
+        Retorna los batches de los segmentos que quedaron en disco (ver read_segment) y la
+        lista de esos segmentos, para borrarlos con discard() después de guardarlos. Incluye
+        los de una ejecución anterior y los de volcados que fallaron en esta.
+        Los segmentos en committed ya están en la BD (el proceso se cayó antes de borrarlos):
+        no se leen, pero se retornan igual para que discard() los borre.
+        """
+        self.rotate()
+        segments = self.existing_segments()
+        batches = []
+        for path in segments:
+            if path not in committed:
+                batches.extend(read_segment(path))
+        return batches, segments
+
+    def close(self):
+        self._running = False
+        self.rotate()
+
+    def get_stats(self):
+        return {
+            "directorio": self.directory,
+            "registros": self.records_written,
+            "fsyncs": self.fsyncs,
+            "bytes_segmento_actual": self._segment_bytes,
+            "segmentos": len(self.existing_segments()),
+        }
@@ -0,0 +1,326 @@
+import time
+import queue
+import threading
+import itertools
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import cv2
+import numpy as np
+
+# Tamaño máximo de un frame que cabe en un slot de memoria compartida (el de la cámara)
+MAX_FRAME_SHAPE = (480, 640, 3)
+# Cada cuántos segundos el dispatcher revisa, si no llegan resultados, que los workers sigan vivos
+WORKER_CHECK_INTERVAL_S = 1.0
+
+
+class CompactBoxes:
+    """
+    Cajas de un frame devueltas por un worker. Expone cls, conf y xyxy como arrays
+    de numpy, con la misma forma de acceso que las Boxes de YOLO que usa process_results.
+    """
+    __slots__ = ('xyxy', 'conf', 'cls')
+
+    def __init__(self, data):
+        # data: array (N, 6) con x1, y1, x2, y2, confianza, clase
+        self.xyxy = data[:, :4]
+        self.conf = data[:, 4]
+        self.cls = data[:, 5]
+
+    def __len__(self):
+        return len(self.cls)
+
+
+class CompactResult:
+    """
+    Resultado de un frame devuelto por un worker: nombres de clase y cajas, sin el
+    objeto Results de YOLO. plot() dibuja las cajas sobre el frame original del proceso principal.
+    """
+    __slots__ = ('names', 'boxes', 'orig_img')
+
+    def __init__(self, names, data, orig_img):
+        self.names = names
+        self.boxes = CompactBoxes(data)
+        self.orig_img = orig_img
+
+    def plot(self):
+        annotated = self.orig_img.copy()
+        for (x1, y1, x2, y2), confidence, class_id in zip(self.boxes.xyxy, self.boxes.conf, self.boxes.cls):
+            p1, p2 = (int(x1), int(y1)), (int(x2), int(y2))
+            cv2.rectangle(annotated, p1, p2, (0, 0, 255), 2)
+            cv2.putText(annotated, f"{self.names[int(class_id)]} {confidence:.2f}", (p1[0], max(p1[1] - 5, 15)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+        return annotated
+
+
+def _worker_main(slot_names, slot_shape, model_files, backend, task_queue, result_queue):
+    """
+    Proceso worker: carga sus propios modelos, se conecta a los slots de memoria compartida
+    y ejecuta las tareas (slot, cantidad de frames, modelo, confianza) que recibe.
+    Responde con arrays (N, 6) por frame en lugar de objetos Results.
+    """
+    from models import ModelRegistry
+
+    registry = ModelRegistry(model_files, backend=backend)
+    registry.preload()
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    slot_arrays = [np.ndarray(slot_shape, dtype=np.uint8, buffer=slot.buf) for slot in slots]
+    result_queue.put(('ready', None, registry.get_timings()))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, slot_idx, frame_shapes, model_name, conf = task
+        try:
+            frames = [slot_arrays[slot_idx][i, :h, :w] for i, (h, w, _c) in enumerate(frame_shapes)]
+            results = registry.predict(model_name, frames, conf=conf, verbose=False)
+            records = [
+                np.concatenate([r.boxes.xyxy.cpu().numpy(),
+                                r.boxes.conf.cpu().numpy()[:, None],
+                                r.boxes.cls.cpu().numpy()[:, None]], axis=1).astype(np.float32)
+                for r in results
+            ]
+            result_queue.put(('result', task_id, (results[0].names, records)))
+        except Exception as e:
+            result_queue.put(('error', task_id, str(e)))
+
+    del slot_arrays
+    for slot in slots:
+        slot.close()
+
+
+class ProcessInferencePool:
+    """
+    Pool de procesos para la inferencia YOLO, fuera del GIL del servidor Flask y del
+    thread de detección. Cada batch de frames se copia una sola vez a un slot de memoria
+    compartida y todos los modelos que lo analizan leen del mismo slot; por la cola solo
+    viajan índices y los resultados compactos (cajas como arrays).
+
+    Nada bloquea para siempre: esperar un slot libre y cada resultado (ver results())
+    tiene un límite de task_timeout_s, y si un worker muere el dispatcher falla las tareas
+    pendientes, libera sus slots y lanza un worker nuevo en su lugar.
+    """
+
+    def __init__(self, model_files, num_workers=2, num_slots=4, max_batch=1, max_frame_shape=MAX_FRAME_SHAPE,
+                 backend='pytorch', task_timeout_s=30.0):
+        self.model_files = dict(model_files)
+        self.backend = backend
+        self.num_workers = num_workers
+        self.task_timeout_s = task_timeout_s
+        self.slot_shape = (max_batch,) + tuple(max_frame_shape)
+        self._ctx = mp.get_context('spawn')
+        self._slots = [shared_memory.SharedMemory(create=True, size=int(np.prod(self.slot_shape)))
+                       for _ in range(num_slots)]
+        self._slot_arrays = [np.ndarray(self.slot_shape, dtype=np.uint8, buffer=slot.buf) for slot in self._slots]
+        self._free_slots = queue.Queue()
+        for idx in range(num_slots):
+            self._free_slots.put(idx)
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._workers = []
+        self._pending = {}     # task_id -> (future, slot_idx, frames)
+        self._slot_refs = {}   # slot_idx -> tareas pendientes que leen el slot
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._dispatcher = None
+        self.worker_timings = []
+        self.tasks_done = 0
+        self.tasks_failed = 0
+        self.workers_restarted = 0
+        self.wait_slot_s = 0.0
+
+    def start(self):
+        """
+        Lanza los workers y espera a que todos tengan sus modelos cargados.
+        Si un worker muere mientras carga (modelo inválido, sin memoria) no se relanza:
+        se detiene el pool y se lanza RuntimeError con su código de salida.
+        """
+        for _ in range(self.num_workers):
+            self._workers.append(self._start_worker())
+        ready = 0
+        try:
+            while ready < self.num_workers:
+                try:
+                    _kind, _task_id, timings = self._result_queue.get(timeout=WORKER_CHECK_INTERVAL_S)
+                except queue.Empty:
+                    self._check_workers(respawn=False)
+                    continue
+                self.worker_timings.append(timings)
+                ready += 1
+        except RuntimeError:
+            self.stop()
+            raise
+        self._dispatcher = threading.Thread(target=self._dispatch_results, daemon=True)
+        self._dispatcher.start()
+        print(f"DEBUG: {self.num_workers} workers de inferencia listos con {len(self._slots)} slots de memoria compartida.")
+        return self
+
+    def _start_worker(self):
+        slot_names = [slot.name for slot in self._slots]
+        worker = self._ctx.Process(target=_worker_main, daemon=True,
+                                   args=(slot_names, self.slot_shape, self.model_files, self.backend,
+                                         self._task_queue, self._result_queue))
+        worker.start()
+        return worker
+
+    def submit_batch(self, frames, model_names, conf):
+        """
+        Copia los frames a un slot libre y encola una tarea por modelo.
+        Retorna [(nombre_modelo, Future)]; cada Future entrega una lista de CompactResult, uno por frame.
+        """
+        if len(frames) > self.slot_shape[0]:
+            raise ValueError(f"El batch ({len(frames)} frames) no cabe en un slot de {self.slot_shape[0]} frames")
+        # Los frames se validan antes de tomar un slot, así un frame inválido no lo deja ocupado
+        max_h, max_w, channels = self.slot_shape[1:]
+        for frame in frames:
+            if frame.ndim != 3 or frame.shape[0] > max_h or frame.shape[1] > max_w or frame.shape[2] != channels:
+                raise ValueError(f"El frame {frame.shape} no cabe en un slot de {self.slot_shape[1:]}")
+
+        wait_start = time.perf_counter()
+        try:
+            slot_idx = self._free_slots.get(timeout=self.task_timeout_s)
+        except queue.Empty:
+            raise RuntimeError(f"Ningún slot de memoria compartida se liberó en {self.task_timeout_s}s")
+        self.wait_slot_s += time.perf_counter() - wait_start
+
+        task_ids = []
+        try:
+            slot_array = self._slot_arrays[slot_idx]
+            frame_shapes = []
+            for i, frame in enumerate(frames):
+                h, w, c = frame.shape
+                slot_array[i, :h, :w] = frame
+                frame_shapes.append((h, w, c))
+
+            futures = []
+            with self._lock:
+                self._slot_refs[slot_idx] = len(model_names)
+                for name in model_names:
+                    task_id = next(self._task_ids)
+                    future = Future()
+                    self._pending[task_id] = (future, slot_idx, frames)
+                    task_ids.append(task_id)
+                    futures.append((name, future))
+                    self._task_queue.put((task_id, slot_idx, frame_shapes, name, conf))
+        except BaseException:
+            # La copia o el encolado fallaron: el slot vuelve a quedar libre (las tareas ya encoladas
+            # se descartan al llegar su resultado)
+            with self._lock:
+                for task_id in task_ids:
+                    self._pending.pop(task_id, None)
+                self._slot_refs.pop(slot_idx, None)
+            self._free_slots.put(slot_idx)
+            raise
+        return futures
+
+    def results(self, futures):
+        """
+        Espera los resultados de submit_batch como [(nombre_modelo, resultados)], con un límite
+        de task_timeout_s para el batch (concurrent.futures.TimeoutError si se cumple). Las tareas
+        vencidas se descartan y su slot se libera; si el worker responde después, se ignora.
+        """
+        deadline = time.monotonic() + self.task_timeout_s
+        try:
+            return [(name, future.result(timeout=max(0.0, deadline - time.monotonic()))) for name, future in futures]
+        except FutureTimeoutError:
+            abandoned = {future for _name, future in futures}
+            with self._lock:
+                for task_id, (future, _slot_idx, _frames) in list(self._pending.items()):
+                    if future in abandoned:
+                        self._release_task(task_id)
+                        self.tasks_failed += 1
+            raise
+
+    def _release_task(self, task_id):
+        """
+        Quita una tarea pendiente y libera su slot si ya nadie lo lee. Retorna (future, frames) o
+        None si la tarea ya no estaba (se dio por fallida o se descartó). Se llama con self._lock tomado.
+        """
+        entry = self._pending.pop(task_id, None)
+        if entry is None:
+            return None
+        future, slot_idx, frames = entry
+        if slot_idx in self._slot_refs:
+            self._slot_refs[slot_idx] -= 1
+            if self._slot_refs[slot_idx] == 0:
+                # Ningún worker sigue leyendo el slot: queda libre para el siguiente batch
+                del self._slot_refs[slot_idx]
+                self._free_slots.put(slot_idx)
+        return future, frames
+
+    def _check_workers(self, respawn=True):
+        """
+        Reemplaza los workers muertos. Sus tareas no van a responder y no se sabe cuáles eran,
+        así que todas las pendientes fallan (la línea reintenta con el siguiente batch).
+        Con respawn=False (arranque del pool) lanza RuntimeError en lugar de reemplazarlos.
+        """
+        dead = [idx for idx, worker in enumerate(self._workers) if not worker.is_alive()]
+        if not dead:
+            return
+        if not respawn:
+            worker = self._workers[dead[0]]
+            raise RuntimeError(f"El worker de inferencia {worker.pid} terminó al cargar los modelos (código {worker.exitcode})")
+        with self._lock:
+            failed = [self._release_task(task_id) for task_id in list(self._pending)]
+            self.tasks_failed += len(failed)
+        for future, _frames in failed:
+            future.set_exception(RuntimeError("Un worker de inferencia terminó inesperadamente"))
+        for idx in dead:
+            print(f"ERROR: El worker de inferencia {self._workers[idx].pid} terminó (código {self._workers[idx].exitcode}); se lanza otro.")
+            self._workers[idx] = self._start_worker()
+            self.workers_restarted += 1
+
+    def _dispatch_results(self):
+        while True:
+            try:
+                kind, task_id, payload = self._result_queue.get(timeout=WORKER_CHECK_INTERVAL_S)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            if kind == 'stop':
+                break
+            if kind == 'ready':
+                # Un worker de reemplazo terminó de cargar sus modelos
+                continue
+            with self._lock:
+                released = self._release_task(task_id)
+                self.tasks_done += 1
+            if released is None:
+                continue
+            future, frames = released
+            if kind == 'error':
+                future.set_exception(RuntimeError(payload))
+            else:
+                names, records = payload
+                future.set_result([CompactResult(names, data, frame) for data, frame in zip(records, frames)])
+            self._check_workers()
+
+    def get_stats(self):
+        return {
+            "workers": self.num_workers,
+            "workers_vivos": sum(1 for worker in self._workers if worker.is_alive()),
+            "slots": len(self._slots),
+            "slots_libres": self._free_slots.qsize(),
+            "tareas_completadas": self.tasks_done,
+            "tareas_fallidas": self.tasks_failed,
+            "workers_reiniciados": self.workers_restarted,
+            "espera_slot_s": round(self.wait_slot_s, 3),
+            "tiempos_carga": self.worker_timings,
+        }
+
+    def stop(self):
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers = []
+        if self._dispatcher is not None:
+            self._result_queue.put(('stop', None, None))
+            self._dispatcher.join(timeout=5)
+            self._dispatcher = None
+        self._slot_arrays = []
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
+        self._slots = []
@@ -0,0 +1,888 @@
+import os
+import cv2
+import math
+import numpy as np
+import time
+import random
+import functools
+import threading
+from db_writer import get_db_writer
+from database import get_committed_journal_segments, forget_journal_segments
+from arduino import get_arduino_link
+from capture import FrameGrabber
+from batching import collect_batch, BatchStats
+from presence import FrameDiffPresence, SerialPresence
+from voting import (
+    StageVote, STOP_TIME, STOP_FRAMES, STOP_SKIPPED, STOP_MAJORITY,
+    MangoVoteAggregator
+)
+from config import (
+    INFERENCE_MODE, FRAMES_PER_MANGO, PREDICT_CONF, CAPTURE_QUEUE_SIZE,
+    BATCH_SIZE, BATCH_MAX_WAIT_MS, EARLY_EXIT, EARLY_EXIT_MIN_FRAMES, EARLY_EXIT_CONFIDENCE_BOUND,
+    CASCADE, PRESENCE_TRIGGER, PRESENCE_GATE, PRESENCE_ROI, SERIAL_BAUDRATE,
+    SHARED_PREPROCESSING, MODEL_IMGSZ, ROI_CROP, ROI_MARGIN, INFERENCE_BACKEND,
+    DETECTION_FLUSH_ROWS, DETECTION_FLUSH_SECONDS, JOURNAL_DIR, JOURNAL_FSYNC_INTERVAL_S,
+    PHOTO_MODE, PHOTOS_PER_MANGO, PHOTO_MIN_DIFFERENCE, ACTUATION_TIMELINE
+)
+from backends import EXPORT_IMGSZ
+from preprocessing import SharedPreprocessor
+from detection_columns import DetectionColumns
+from detection_buffer import DetectionBuffer, rows_from_journal
+from detection_journal import DetectionJournal
+from capture_selector import CaptureSelector
+from actuation import decision_timeline, run_timeline
+from latency_trace import MangoLatencyTrace, LatencyTracker
+
+MODEL_STAGE_CONCURRENT = 5
+
+# Números de lote e ID compartidos por todas las líneas, para que no se repitan entre bandas
+used_lote_numbers = set()  # Números de lote ya usados
+used_id_numbers = set()    # Números de ID ya usados
+_numbers_lock = threading.Lock()
+
+
+def generate_unique_number(used_set):
+    """
+    Genera un número único de 5 dígitos que no se haya usado antes.
+    Se utiliza para lotes e IDs de mangos.
+    """
+    with _numbers_lock:
+        while True:
+            number = random.randint(10000, 99999)
+            if number not in used_set:
+                used_set.add(number)
+                return number
+
+
+class Lane:
+    """
+    Una línea (banda) de clasificación: cámara, thread de detección, lote/ID, buffer de
+    detecciones, stream de video y pines del Arduino propios. Los modelos y el pool de
+    inferencia se reciben del proceso y se comparten con las demás líneas.
+    process_pool: ProcessInferencePool opcional; si se indica, la inferencia corre en sus workers.
+    """
+
+    def __init__(self, lane_id, camera_index, serial_port, pins, model_registry, inference_pool, process_pool=None, timeline=None):
+        self.lane_id = lane_id
+        self.camera_index = camera_index
+        self.pins = pins
+        self.model_registry = model_registry
+        self.inference_pool = inference_pool
+        self.process_pool = process_pool
+        self.arduino = get_arduino_link(serial_port, SERIAL_BAUDRATE)
+        # fps y latencia por configuración de batch (ver /inference_stats)
+        self.batch_stats = BatchStats()
+        self.preprocessor = None
+        if SHARED_PREPROCESSING:
+            model_imgsz = MODEL_IMGSZ if INFERENCE_BACKEND == 'pytorch' else {name: EXPORT_IMGSZ for name in MODEL_IMGSZ}
+            self.preprocessor = SharedPreprocessor(
+                model_imgsz,
+                roi_locator='exportabilidad' if ROI_CROP else None,
+                roi_models=('madurez', 'defectos') if ROI_CROP else (),
+                roi_margin=ROI_MARGIN)
+        # Tiempos de la decisión respecto del LOW del pin de detección (velocidad de banda / distancia a la compuerta)
+        self.timeline = dict(ACTUATION_TIMELINE, **(timeline or {}))
+        # Escritor único de la BD (compartido por todas las líneas): el loop de captura solo encola
+        self.db_writer = get_db_writer()
+        self.flush_lock = threading.Lock()
+        # Desglose de latencia captura -> serial de cada mango (ver /latency_stats)
+        self.latency_tracker = LatencyTracker(self.db_writer)
+
+        # Control de la cámara y detección
+        self.camera = None
+        self.frame_grabber = None # Thread de captura que alimenta a la inferencia con el frame más reciente
+        self.camera_running = False
+        self.output_frame = None
+        self.lock = threading.Lock()
+        self.detection_thread = None
+        self.detection_start_time = None # Tiempo de inicio para la etapa actual del modelo
+        self.overall_detection_start_time = None # Tiempo de inicio para toda la detección
+        self.model_stage = 0 # 0: no iniciado, 1: exportabilidad, 2: madurez, 3: defectos, 4: finalizado, 5: concurrente
+        self.current_model_name = "" # Nombre del modelo de la etapa actual (sin .pt), vacío si no hay etapa activa
+        self.continuous_mode = False    # Modo continuo: la cámara y los modelos quedan activos entre mangos
+        self.waiting_for_mango = False  # Modo continuo: esperando que el disparador de presencia abra un nuevo ID
+        self.presence_trigger = None    # FrameDiffPresence o SerialPresence según PRESENCE_TRIGGER
+        # Compuerta rápida (sin retardo al abrir) delante de la inferencia (PRESENCE_GATE), que mantiene la puerta
+        # abierta unos frames tras perder el objeto. Es una sola por línea y dura entre sesiones: su fondo es la
+        # banda vacía que vio mientras se esperaba un mango, no el mango que está a la vista al iniciar.
+        self.presence_gate = FrameDiffPresence(frames_on=1, frames_off=3, roi=PRESENCE_ROI) if PRESENCE_GATE else None
+        self.frames_gated = 0           # Frames descartados por la compuerta de presencia en la sesión
+
+        # Control de lotes e IDs
+        self.current_lote = None        # Lote actual
+        self.current_id = None          # ID actual
+        self.journal = None             # Diario en disco de las detecciones aún no guardadas
+        if JOURNAL_DIR:
+            self.journal = DetectionJournal(os.path.join(JOURNAL_DIR, f"lane_{lane_id}"), JOURNAL_FSYNC_INTERVAL_S)
+        self.detections_buffer = DetectionBuffer(DETECTION_FLUSH_ROWS, DETECTION_FLUSH_SECONDS, self.journal)  # Detecciones pendientes de guardar
+        self.stage_results_buffer = []  # Resultado de cada etapa por mango (motivo de fin, frames usados)
+        self.last_stage_reports = {}    # Estado de los votos por etapa del último mango, para /camera_status
+        self.mango_votes = None         # MangoVoteAggregator del mango en curso, para /camera_status
+        self.capture_selector = None    # CaptureSelector de las fotos del mango en curso (PHOTO_MODE 'mejores')
+
+    def generate_lote(self):
+        """
+        Genera un nuevo código de lote único y lo asigna como lote actual.
+        """
+        self.current_lote = generate_unique_number(used_lote_numbers)
+        return self.current_lote
+
+    def generate_id(self):
+        """
+        Genera un nuevo código de ID único y lo asigna como ID actual.
+        """
+        self.current_id = generate_unique_number(used_id_numbers)
+        print(f"DEBUG: Línea {self.lane_id}: nuevo ID generado: {self.current_id}.")
+        return self.current_id
+
+    def send_arduino_signal(self, pin_role, state, delay=0.0, on_written=None, owner=None):
+        """
+        Envía una señal al pin de esta línea ('deteccion', 'exportable' o 'no_exportable'),
+        dentro de delay segundos. No bloquea: el comando sale por el thread escritor del puerto.
+        owner: activación de la línea de tiempo a la que pertenece (ver run_timeline).
+        """
+        self.arduino.schedule(self.pins[pin_role], state, delay, on_written, owner)
+
+    def latency_trace(self, grabber, decisive_marks, lote, item_id):
+        """
+        Crea el MangoLatencyTrace del mango a partir de su frame decisivo.
+        decisive_marks: (secuencia, inicio de inferencia, fin de inferencia) del último batch clasificado.
+        Retorna None si no hubo inferencia o el frame ya no está en el historial del grabber.
+        """
+        if decisive_marks is None:
+            return None
+        seq, dequeued, inference_end = decisive_marks
+        read_times = grabber.capture_times(seq)
+        if read_times is None:
+            return None
+        return MangoLatencyTrace(lote, item_id, read_times[0], read_times[1], dequeued, inference_end)
+
+    def analyze_and_send_signals_to_arduino(self, mango_votes, lote, item_id, trace=None):
+        """
+        Decide si el mango de un lote e ID específicos es exportable y envía señales a Arduino.
+        mango_votes: MangoVoteAggregator con los votos acumulados del mango.
+        trace: MangoLatencyTrace del mango; se completa cuando el pin de la decisión sale por el puerto.
+        """
+        print(f"DEBUG: Iniciando análisis de detecciones para Lote: {lote}, ID: {item_id}")
+
+        # Recuento por modelo ya acumulado durante la detección (ver voting.py)
+        counts = mango_votes.counts()
+        print(f"DEBUG: Recuento de detecciones: {counts}")
+
+        # Exportable solo si exportable > no_exportable, verde > maduro y sin_defecto > con_defecto
+        is_exportable_candidate = mango_votes.is_exportable()
+
+        # Priorizamos la lógica del pin exportable. Si no es exportable, por defecto se activa el pin no exportable.
+        # Los pasos se entregan al planificador del puerto con sus tiempos; aquí no se espera nada.
+        steps = decision_timeline(is_exportable_candidate, self.timeline)
+        on_activate_written = None
+        if trace is not None:
+            trace.decided = time.monotonic()
+            on_activate_written = functools.partial(self.latency_tracker.on_written, trace)
+        run_timeline(steps, self.send_arduino_signal, on_activate_written)
+        if is_exportable_candidate:
+            print(f"DECISION: Mango probablemente exportable. Señal HIGH en Pin {self.pins['exportable']}: {steps}.")
+        else:
+            print(f"DECISION: Mango probablemente NO exportable. Señal HIGH en Pin {self.pins['no_exportable']}: {steps}.")
+
+    def flush_detections(self):
+        """
+        Encola en el escritor de BD las detecciones y resultados de etapa pendientes.
+        Retorna (future, cantidad de detecciones); el future se completa con el commit.
+        """
+        with self.flush_lock:
+            rows, count, segments = self.detections_buffer.drain()
+            stage_results, self.stage_results_buffer = self.stage_results_buffer, []
+            future = self.db_writer.submit_detections(rows, stage_results, segments)
+        future.add_done_callback(lambda done: self._flush_done(done, count, segments))
+        return future, count
+
+    def _flush_done(self, future, count, segments):
+        if future.exception() is not None:
+            # Los segmentos quedan en disco y se recuperan al próximo inicio
+            print(f"ERROR: Línea {self.lane_id}: error al volcar detecciones: {future.exception()}")
+            return
+        if self.journal is not None:
+            # Ya están en la BD: el diario de esas filas deja de hacer falta
+            self.journal.discard(segments)
+        if count:
+            print(f"DEBUG: Línea {self.lane_id}: volcadas {count} detecciones a la base de datos.")
+
+    def recover_journal(self):
+        """
+        Guarda en la BD las detecciones que quedaron en el diario de una ejecución anterior
+        (o de un volcado que falló) y luego borra esos segmentos. Se llama al iniciar.
+        Los segmentos que ya se guardaron (el proceso se cayó entre el commit y el borrado)
+        no se vuelven a insertar: sus nombres quedaron en journal_segments con el mismo commit.
+        """
+        if self.journal is None:
+            return 0
+        committed = get_committed_journal_segments(self.journal.existing_segments())
+        batches, segments = self.journal.replay(committed)
+        if not segments:
+            return 0
+        count = sum(len(batch[4]) for batch in batches)
+        pending = [segment for segment in segments if segment not in committed]
+        if pending:
+            self.db_writer.submit_detections(rows_from_journal(batches), (), pending).result()
+        self.journal.discard(segments)
+        # Sin segmentos en disco las marcas de este diario ya no hacen falta
+        forget_journal_segments(self.journal.directory)
+        print(f"DEBUG: Línea {self.lane_id}: recuperadas {count} detecciones del diario ({len(segments)} segmentos).")
+        return count
+
+    def maybe_flush_detections(self):
+        """
+        Encola un volcado si el buffer superó el umbral de filas o de tiempo.
+        """
+        if self.detections_buffer.should_flush():
+            self.flush_detections()
+
+    def save_detections_to_db(self):
+        """
+        Guarda en la base de datos las detecciones que aún quedan en el buffer y cierra
+        la cuenta del lote. Retorna el total de detecciones guardadas en el lote.
+        """
+        if self.detections_buffer.rows_in_lote() == 0:
+            print("No hay detecciones para guardar")
+            return 0
+        if self.current_lote is None:
+            raise ValueError("No hay un lote activo para guardar las detecciones")
+        try:
+            future, _count = self.flush_detections()
+            future.result()  # Esperar el commit antes de responder
+            total = self.detections_buffer.rows_in_lote()
+            print(f"Guardadas {total} detecciones en la base de datos")
+            self.detections_buffer.start_new_lote()
+            return total
+        except Exception as e:
+            print(f"Error al guardar las detecciones: {e}")
+            raise
+
+    def init_camera(self):
+        """
+        Inicializa la cámara web de la línea para la captura de video.
+        Configura la resolución y retorna el objeto cámara.
+        """
+        try:
+            if self.camera is not None:
+                self.camera.release()
+            self.camera = cv2.VideoCapture(self.camera_index)
+            if not self.camera.isOpened():
+                raise Exception("No se pudo abrir la cámara")
+            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            # Buffer mínimo en el driver: el thread de captura se encarga de descartar frames viejos
+            self.camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            return self.camera
+        except Exception as e:
+            print(f"Error al inicializar la cámara {self.camera_index} (línea {self.lane_id}): {str(e)}")
+            self.camera = None
+            return None
+
+    def stop_detection(self):
+        """
+        Detiene la detección y reinicia variables de control.
+        """
+        print(f"Deteniendo detección de la línea {self.lane_id}...")
+        self.camera_running = False
+        self.continuous_mode = False
+        self.waiting_for_mango = False
+        if isinstance(self.presence_trigger, SerialPresence):
+            self.presence_trigger.stop()
+        self.presence_trigger = None
+        self.model_stage = 0
+        self.current_model_name = ""
+        self.output_frame = None
+
+    def release_camera(self):
+        """
+        Libera los recursos de la cámara y detiene el thread de detección si está activo.
+        """
+        print(f"Liberando recursos de la cámara de la línea {self.lane_id}...")
+        if self.frame_grabber is not None:
+            self.frame_grabber.stop()
+            self.frame_grabber = None
+        if self.camera is not None:
+            self.camera.release()
+            self.camera = None
+        if self.detection_thread and self.detection_thread.is_alive() and threading.current_thread() != self.detection_thread:
+            self.detection_thread.join(timeout=5)
+            self.detection_thread = None
+        self.camera_running = False
+        print("Cámara y thread de detección detenidos.")
+
+    def process_results(self, results, model_name, capture_timestamps):
+        """
+        Convierte los resultados de YOLO de un batch (un resultado por frame) en columnas
+        de numpy y los añade al buffer para su posterior guardado.
+        capture_timestamps: epoch de captura de cada frame.
+        Retorna las DetectionColumns para el voto de la etapa.
+        """
+        columns = DetectionColumns.from_results(results, capture_timestamps)
+        # Añadir al buffer en lugar de guardar directamente
+        self.detections_buffer.add_columns(self.current_lote, self.current_id, model_name, columns)
+        return columns
+
+    def predict_all_models(self, frames, model_names=None):
+        """
+        Ejecuta los modelos (por defecto los tres) sobre los mismos frames en paralelo usando el pool de inferencia,
+        o en los workers del pool de procesos si está configurado.
+        Retorna una lista [(nombre_modelo, resultados)] en el orden del registro de modelos,
+        con un resultado por frame.
+        """
+        if model_names is None:
+            model_names = list(self.model_registry.model_files)
+        if self.process_pool is not None:
+            return self.process_pool.results(self.process_pool.submit_batch(frames, model_names, PREDICT_CONF))
+        if self.preprocessor is not None:
+            # Un tensor por combinación de recorte y tamaño de entrada, compartido entre modelos
+            inputs = self.preprocessor.prepare_batch(frames, model_names)
+        else:
+            inputs = {name: frames for name in model_names}
+        if len(model_names) == 1:
+            # Un solo modelo (modo secuencial): se ejecuta en este mismo thread
+            name = model_names[0]
+            model_results = [(name, self.model_registry.predict(name, inputs[name], conf=PREDICT_CONF))]
+        else:
+            futures = [
+                (name, self.inference_pool.submit(self.model_registry.predict, name, inputs[name], conf=PREDICT_CONF))
+                for name in model_names
+            ]
+            model_results = [(name, future.result()) for name, future in futures]
+        if self.preprocessor is not None:
+            for name, results in model_results:
+                self.preprocessor.update_roi(name, results, frames[-1].shape)
+        return model_results
+
+    def annotate_results(self, model_name, results, frame):
+        """
+        Frame para el stream con las cajas del último resultado de un modelo.
+        Con preprocesamiento compartido las cajas están en el espacio del tensor y se
+        dibujan de vuelta sobre el frame original.
+        """
+        if self.preprocessor is not None and self.process_pool is None:
+            return self.preprocessor.annotate(model_name, results[-1], frame)
+        return results[-1].plot()
+
+    def record_stage_result(self, vote, lote, item_id, default_reason):
+        """
+        Cierra el voto de una etapa y lo deja en el buffer de resultados de etapa.
+        default_reason se usa si la etapa no terminó por salida temprana.
+        """
+        vote.stop(default_reason)
+        self.stage_results_buffer.append([lote, item_id, self.model_registry.weights_name(vote.model_name),
+                                          vote.stop_reason, vote.frames_used, round(vote.duration_s, 3)])
+        self.last_stage_reports[vote.model_name] = vote.report()
+        print(f"DEBUG: Etapa {vote.model_name} terminada por '{vote.stop_reason}' con {vote.frames_used} frames en {vote.duration_s:.2f}s.")
+
+    def skip_remaining_stages(self, model_names, lote, item_id):
+        """
+        Marca como omitidas en cascada las etapas que aún no se ejecutaron para el mango.
+        """
+        for model_name in model_names:
+            self.record_stage_result(StageVote(model_name), lote, item_id, STOP_SKIPPED)
+
+    def save_selected_captures(self, lote, item_id):
+        """
+        Encola en el escritor de BD las fotos elegidas por el selector para el mango y lo reinicia.
+        """
+        selector = self.capture_selector
+        if selector is None:
+            return
+        frames = selector.selected_frames()
+        for number, frame in enumerate(frames, start=1):
+            image_path = os.path.join('images', str(lote), f"{lote}-{item_id}-{number}.jpg")
+            self.db_writer.submit_image(lote, item_id, image_path, frame)
+        print(f"DEBUG: {len(frames)} fotos seleccionadas para el mango {item_id}: {selector.get_stats()['puntajes']}")
+        selector.reset()
+
+    def publish_frame(self, frame):
+        """
+        Codifica el frame en JPEG y lo deja como frame actual del stream de la línea.
+        """
+        with self.lock:
+            ret, buffer = cv2.imencode('.jpg', frame)
+            if ret:
+                self.output_frame = buffer.tobytes()
+
+    def wait_for_mango(self, grabber):
+        """
+        Modo continuo: procesa un frame mientras la banda espera un mango, sin inferencia.
+        Publica el frame en el stream y retorna True cuando llega un mango nuevo: solo en el paso
+        de ausente a presente del disparador, no mientras el mismo mango siga a la vista.
+        """
+        captured = grabber.get_latest()
+        if captured is None:
+            return False
+        _seq, _capture_ts, frame = captured
+        # La compuerta también ve la banda vacía mientras se espera, así aprende su fondo antes del mango
+        if self.presence_gate is not None:
+            self.presence_gate.update(frame)
+        arrived = False
+        if self.presence_trigger:
+            self.presence_trigger.update(frame)
+            arrived = self.presence_trigger.consume_arrival()
+        display_frame = frame.copy()
+        cv2.putText(display_frame, f"Lote: {self.current_lote} | Esperando mango...",
+                     (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+        self.publish_frame(display_frame)
+        return arrived
+
+    def generate_frames_thread(self):
+        try:
+            self.model_stage = 0
+            print(f"DEBUG: Inicia el thread de generación de frames de la línea {self.lane_id}.")
+            # Referencia local: release_camera() puede poner el atributo en None mientras el thread termina
+            grabber = self.frame_grabber
+
+            # Definir los tiempos de duración para cada etapa del modelo
+            duration_stage1 = 7  # Segundos para el modelo de exportabilidad
+            duration_stage_others = 5 # Segundos para los modelos de madurez y defectos
+            total_processing_duration = duration_stage1 + (2 * duration_stage_others) # 7 + 5 + 5 = 17 seconds
+
+            # Tiempos para tomar las 4 fotos (en segundos desde el inicio)
+            photo_capture_times = [4, 8, 12, 16]
+            photos_taken = [False, False, False, False]  # Controla si ya se tomó cada foto
+            # En modo concurrente el ciclo se mide en frames: las fotos se reparten a lo largo de FRAMES_PER_MANGO
+            photo_capture_frames = [FRAMES_PER_MANGO * (idx + 1) // 5 for idx in range(4)]
+            frames_processed = 0  # Frames analizados para el mango actual
+            decisive_marks = None  # (secuencia, inicio y fin de inferencia) del último batch clasificado del mango
+            stage_votes = {}      # Voto por etapa del mango actual (StageVote por modelo)
+            cascade_finished = False  # Una etapa ya rechazó el mango y el resto se omitió
+
+            # Votos acumulados del mango actual
+            mango_votes = self.mango_votes = MangoVoteAggregator()
+            if PHOTO_MODE == 'mejores':
+                self.capture_selector = CaptureSelector(PHOTOS_PER_MANGO, PHOTO_MIN_DIFFERENCE)
+
+            # Mantener un registro del ID del mango cuyos votos se están acumulando
+            local_processing_mango_id = None
+
+            while self.camera_running:
+                if not self.camera or not self.camera.isOpened() or not grabber or not grabber.is_running():
+                    print("ERROR: La cámara no está disponible o se cerró inesperadamente.")
+                    self.stop_detection()
+                    break
+
+                # El umbral de tiempo del buffer se revisa en cada vuelta, no solo tras una inferencia:
+                # una línea esperando mango o con la compuerta descartando frames también vuelca
+                self.maybe_flush_detections()
+
+                # Modo continuo: sin inferencia hasta que el disparador de presencia detecte un mango.
+                # La decisión del mango anterior ya quedó planificada en el ArduinoLink (run_timeline) y sale a su tiempo.
+                if self.continuous_mode and self.waiting_for_mango:
+                    if self.wait_for_mango(grabber):
+                        self.generate_id()
+                        self.overall_detection_start_time = time.time()
+                        self.detection_start_time = time.time()
+                        self.waiting_for_mango = False
+                        print(f"DEBUG: Modo continuo: mango detectado en la banda, nuevo ID {self.current_id}.")
+                    continue
+
+                current_time = time.time()
+
+                # Tiempo transcurrido para la etapa actual del modelo
+                elapsed_time_current_stage = current_time - (self.detection_start_time if self.detection_start_time is not None else current_time)
+                # Tiempo transcurrido desde el inicio general de la detección
+                elapsed_time_overall = current_time - (self.overall_detection_start_time if self.overall_detection_start_time is not None else current_time)
+
+                # Si el ID actual ha cambiado, significa que un nuevo mango está comenzando.
+                # Esto reinicia los votos y establece el ID de procesamiento local.
+                if local_processing_mango_id != self.current_id:
+                    if mango_votes.total_detections > 0:
+                        # Si había detecciones para un mango anterior que no fue procesado explícitamente
+                        print(f"ADVERTENCIA: Mango {local_processing_mango_id} no fue analizado localmente antes de cambiar a {self.current_id}. Analizando ahora.")
+                        # Ensure the detection pin is LOW before starting analysis for the previous mango, if it wasn't already.
+                        self.send_arduino_signal('deteccion', 'L')
+                        self.analyze_and_send_signals_to_arduino(mango_votes, self.current_lote, local_processing_mango_id,
+                                                                 self.latency_trace(grabber, decisive_marks, self.current_lote, local_processing_mango_id))
+                    if local_processing_mango_id is not None:
+                        self.save_selected_captures(self.current_lote, local_processing_mango_id)
+                    mango_votes = self.mango_votes = MangoVoteAggregator()
+                    local_processing_mango_id = self.current_id
+                    print(f"DEBUG: Nuevo mango ({self.current_id}) detectado, reiniciando los votos del mango.")
+                    # Resetear el control de fotos para el nuevo mango
+                    photos_taken = [False, False, False, False]
+                    frames_processed = 0
+                    decisive_marks = None
+                    stage_votes = {}
+                    cascade_finished = False
+                    self.last_stage_reports.clear()
+                    if self.preprocessor is not None:
+                        self.preprocessor.reset_roi()
+                    # Send HIGH to the detection pin when a new mango's processing cycle starts
+                    self.send_arduino_signal('deteccion', 'H')
+                    print(f"DEBUG: Signal HIGH to Pin {self.pins['deteccion']} (detection started for new mango).")
+
+                # Lógica para detener el proceso después de que haya transcurrido el tiempo total de procesamiento.
+                # Esto asegura que el análisis final se realice y luego el sistema se detenga.
+                # En modo concurrente el ciclo termina al completar FRAMES_PER_MANGO frames.
+                # Con salida temprana el ciclo también termina cuando las etapas ya decidieron.
+                # Con la compuerta de presencia los frames descartados no cuentan, así que el ciclo
+                # también se corta al cumplirse el tiempo total de las etapas secuenciales.
+                concurrent_timed_out = False
+                if cascade_finished:
+                    cycle_finished = True
+                elif INFERENCE_MODE == 'concurrente':
+                    concurrent_timed_out = self.overall_detection_start_time is not None and elapsed_time_overall >= total_processing_duration
+                    cycle_finished = frames_processed >= FRAMES_PER_MANGO or concurrent_timed_out or (
+                        bool(stage_votes) and all(vote.stop_reason for vote in stage_votes.values()))
+                else:
+                    cycle_finished = self.overall_detection_start_time is not None and elapsed_time_overall >= total_processing_duration
+                    if self.model_stage == 3 and (elapsed_time_current_stage >= duration_stage_others or stage_votes['defectos'].stop_reason):
+                        cycle_finished = True
+                if cycle_finished:
+                    # Registrar cómo terminó cada etapa que aún no se cerró
+                    for vote in stage_votes.values():
+                        if vote.model_name not in self.last_stage_reports:
+                            self.record_stage_result(vote, self.current_lote, local_processing_mango_id,
+                                                     STOP_FRAMES if INFERENCE_MODE == 'concurrente' and not concurrent_timed_out else STOP_TIME)
+
+                    if concurrent_timed_out:
+                        print(f"DEBUG: Tiempo total ({total_processing_duration}s) transcurrido con {frames_processed}/{FRAMES_PER_MANGO} frames analizados para mango ID: {local_processing_mango_id}. Finalizando ciclo de detección.")
+                    elif INFERENCE_MODE == 'concurrente':
+                        print(f"DEBUG: {frames_processed} frames analizados por los 3 modelos en {elapsed_time_overall:.2f}s para mango ID: {local_processing_mango_id}. Finalizando ciclo de detección.")
+                    else:
+                        print(f"DEBUG: Tiempo total de procesamiento ({total_processing_duration}s) transcurrido para mango ID: {local_processing_mango_id}. Finalizando ciclo de detección.")
+
+                    # Send LOW to the detection pin before analysis and stopping
+                    self.send_arduino_signal('deteccion', 'L')
+                    print(f"DEBUG: Signal LOW to Pin {self.pins['deteccion']} (detection finished for this mango).")
+                    # Las fotos elegidas durante el ciclo se codifican y guardan una sola vez, al final
+                    self.save_selected_captures(self.current_lote, local_processing_mango_id)
+
+                    if self.continuous_mode:
+                        # La decisión queda planificada y el ciclo vuelve a esperar el siguiente mango
+                        if mango_votes.total_detections > 0:
+                            self.analyze_and_send_signals_to_arduino(mango_votes, self.current_lote, local_processing_mango_id,
+                                                                 self.latency_trace(grabber, decisive_marks, self.current_lote, local_processing_mango_id))
+                        else:
+                            print(f"DEBUG: No se detectaron objetos para el mango {local_processing_mango_id}.")
+                        mango_votes = self.mango_votes = MangoVoteAggregator()
+                        local_processing_mango_id = None
+                        self.model_stage = 0
+                        self.current_model_name = ""
+                        self.overall_detection_start_time = None
+                        self.detection_start_time = None
+                        self.waiting_for_mango = True
+                        continue
+
+                    # Realizar análisis inmediato para el mango actual antes de detener
+                    if mango_votes.total_detections > 0:
+                        print(f"DEBUG: Mango {local_processing_mango_id} procesado completamente por los 3 modelos. Iniciando análisis local de Arduino.")
+                        self.analyze_and_send_signals_to_arduino(mango_votes, self.current_lote, local_processing_mango_id,
+                                                                 self.latency_trace(grabber, decisive_marks, self.current_lote, local_processing_mango_id))
+                    else:
+                        print(f"DEBUG: No se detectaron objetos para el mango {local_processing_mango_id} a lo largo de las etapas de los modelos (antes de detener).")
+
+                    local_processing_mango_id = None
+
+                    self.stop_detection() # Esto establecerá camera_running en False
+                    print("DEBUG: Detección detenida por tiempo total transcurrido.")
+                    break # Salir del bucle while para terminar el thread
+
+                # Transiciones de etapa del modelo y asignación de current_model_name
+                if self.model_stage == 0 and INFERENCE_MODE == 'concurrente':
+                    self.model_stage = MODEL_STAGE_CONCURRENT
+                    self.current_model_name = ""
+                    self.detection_start_time = time.time()
+                    if self.overall_detection_start_time is None:
+                        self.overall_detection_start_time = time.time()
+                    stage_votes = {name: StageVote(name) for name in self.model_registry.model_files}
+                    print("DEBUG: Modo concurrente: los 3 modelos analizan cada frame.")
+
+                elif self.model_stage == 0:
+                    self.model_stage = 1
+                    self.detection_start_time = time.time() # Establecer el inicio para esta etapa
+                    # overall_detection_start_time ya se inicializa al iniciar la sesión (safety check)
+                    if self.overall_detection_start_time is None:
+                        self.overall_detection_start_time = time.time()
+                    stage_votes['exportabilidad'] = StageVote('exportabilidad')
+                    print("DEBUG: Etapa de exportabilidad iniciada.")
+                    self.current_model_name = "exportabilidad"
+
+                elif self.model_stage == 1 and (elapsed_time_current_stage >= duration_stage1 or stage_votes['exportabilidad'].stop_reason):
+                    print(f"DEBUG: Cambiando a modelo de madurez. Tiempo transcurrido en etapa: {elapsed_time_current_stage:.2f}s")
+                    self.record_stage_result(stage_votes['exportabilidad'], self.current_lote, self.current_id, STOP_TIME)
+                    if CASCADE and stage_votes['exportabilidad'].rejects():
+                        print("DEBUG: Cascada: exportabilidad ya rechazó el mango, se omiten madurez y defectos.")
+                        self.skip_remaining_stages(['madurez', 'defectos'], self.current_lote, self.current_id)
+                        cascade_finished = True
+                        continue
+                    self.model_stage = 2
+                    stage_votes['madurez'] = StageVote('madurez')
+                    self.detection_start_time = current_time # Reiniciar el tiempo para la nueva etapa
+                    self.current_model_name = "madurez"
+
+                elif self.model_stage == 2 and (elapsed_time_current_stage >= duration_stage_others or stage_votes['madurez'].stop_reason):
+                    print(f"DEBUG: Cambiando a modelo de defectos. Tiempo transcurrido en etapa: {elapsed_time_current_stage:.2f}s")
+                    self.record_stage_result(stage_votes['madurez'], self.current_lote, self.current_id, STOP_TIME)
+                    if CASCADE and stage_votes['madurez'].rejects():
+                        print("DEBUG: Cascada: madurez ya rechazó el mango, se omite defectos.")
+                        self.skip_remaining_stages(['defectos'], self.current_lote, self.current_id)
+                        cascade_finished = True
+                        continue
+                    self.model_stage = 3
+                    stage_votes['defectos'] = StageVote('defectos')
+                    self.detection_start_time = current_time # Reiniciar el tiempo para la nueva etapa
+                    self.current_model_name = "defectos"
+
+                if not self.camera_running:
+                    print("DEBUG: camera_running es False, saliendo del bucle de frames (después de transiciones de modelo).")
+                    break
+
+                # Siempre los frames más recientes del thread de captura (uno solo si BATCH_SIZE = 1)
+                cycle_start = time.time()
+                captured_batch = collect_batch(grabber, BATCH_SIZE, BATCH_MAX_WAIT_MS)
+                if not captured_batch:
+                    print("ERROR: Error al leer frame de la cámara principal. Deteniendo detección.")
+                    self.stop_detection()
+                    break
+                frame = captured_batch[-1][2]
+
+                # Modo continuo: el disparador sigue viendo la banda durante el ciclo, así sabe cuándo sale
+                # el mango actual y anota la llegada del siguiente aunque ocurra antes de volver a esperar
+                if self.continuous_mode and self.presence_trigger is not None:
+                    for _seq, _capture_ts, captured_frame in captured_batch:
+                        self.presence_trigger.update(captured_frame)
+
+                # Compuerta de presencia: solo los frames con objeto en la región de interés van a YOLO
+                if self.presence_gate is not None and (self.current_model_name or self.model_stage == MODEL_STAGE_CONCURRENT):
+                    gated_batch = [captured for captured in captured_batch if self.presence_gate.update(captured[2])]
+                    self.frames_gated += len(captured_batch) - len(gated_batch)
+                    if not gated_batch:
+                        self.publish_frame(frame)
+                        continue
+                    captured_batch = gated_batch
+                batch_frames = [captured_frame for _seq, _capture_ts, captured_frame in captured_batch]
+                frame = batch_frames[-1]
+
+                if self.current_model_name or self.model_stage == MODEL_STAGE_CONCURRENT:
+                    try:
+                        inference_start = time.time()
+                        inference_start_mono = time.monotonic()
+                        if self.model_stage == MODEL_STAGE_CONCURRENT:
+                            # Los modelos cuya etapa ya decidió dejan de ejecutarse
+                            pending_models = [name for name, vote in stage_votes.items() if not vote.stop_reason]
+                            model_results = self.predict_all_models(batch_frames, pending_models)
+                        else:
+                            model_results = self.predict_all_models(batch_frames, [self.current_model_name])
+                        self.batch_stats.record(BATCH_SIZE, BATCH_MAX_WAIT_MS, [ts for _seq, ts, _f in captured_batch],
+                                                cycle_start, time.time() - inference_start)
+                        decisive_marks = (captured_batch[-1][0], inference_start_mono, time.monotonic())
+                        frames_processed += len(captured_batch)
+
+                        # Cada resultado del batch se guarda con la hora de captura de su propio frame
+                        frame_confidence = None
+                        capture_timestamps = [capture_ts for _seq, capture_ts, _frame in captured_batch]
+                        for model_name, results in model_results:
+                            # Columnas del batch al buffer de la línea (con el nombre .pt del modelo) y al voto de la etapa
+                            columns = self.process_results(results, self.model_registry.weights_name(model_name),
+                                                           capture_timestamps)
+                            stage_votes[model_name].add_columns(columns)
+                            # Votos del mango con el nombre simplificado del modelo
+                            mango_votes.add_columns(model_name, columns)
+                            if self.capture_selector is not None:
+                                frame_confidence = columns.max_confidence_per_frame() if frame_confidence is None else \
+                                    np.maximum(frame_confidence, columns.max_confidence_per_frame())
+
+                        if self.capture_selector is not None:
+                            # Candidatas a foto: cada frame clasificado con la mejor confianza de sus detecciones
+                            for (seq, _capture_ts, captured_frame), confidence in zip(captured_batch, frame_confidence.tolist()):
+                                self.capture_selector.offer(seq, captured_frame, confidence)
+
+                        if self.model_stage == MODEL_STAGE_CONCURRENT:
+                            remaining_frames = max(0, FRAMES_PER_MANGO - frames_processed)
+                            if EARLY_EXIT:
+                                for model_name, _results in model_results:
+                                    stage_votes[model_name].check_early_exit(remaining_frames, EARLY_EXIT_MIN_FRAMES, EARLY_EXIT_CONFIDENCE_BOUND)
+                            # Cascada (con o sin EARLY_EXIT): un modelo ya decidido en contra detiene a los que siguen pendientes
+                            if CASCADE:
+                                rejecting = [vote for vote in stage_votes.values() if vote.rejection_decided(remaining_frames, EARLY_EXIT_MIN_FRAMES)]
+                                if rejecting:
+                                    for vote in rejecting:
+                                        vote.stop(STOP_MAJORITY)
+                                    for vote in stage_votes.values():
+                                        if not vote.stop_reason:
+                                            vote.stop(STOP_SKIPPED)
+                                            print(f"DEBUG: Cascada: se omite el resto de la etapa {vote.model_name}.")
+                        elif EARLY_EXIT:
+                            # Frames que aún caben en la etapa, estimados con el ritmo observado en ella
+                            vote = stage_votes[self.current_model_name]
+                            stage_elapsed = time.time() - self.detection_start_time
+                            stage_duration = duration_stage1 if self.model_stage == 1 else duration_stage_others
+                            stage_fps = vote.frames / stage_elapsed if stage_elapsed > 0 else 0.0
+                            remaining_frames = math.ceil(stage_fps * max(0.0, stage_duration - stage_elapsed))
+                            vote.check_early_exit(remaining_frames, EARLY_EXIT_MIN_FRAMES, EARLY_EXIT_CONFIDENCE_BOUND)
+
+                        # Se dibujan las cajas del primer modelo (exportabilidad en modo concurrente) sobre el último frame
+                        annotated_frame = self.annotate_results(model_results[0][0], model_results[0][1], frame)
+
+                        # Texto para la visualización en el frame
+                        modelo_texto = ""
+                        if self.model_stage == MODEL_STAGE_CONCURRENT:
+                            modelo_texto = "Modelos: exportabilidad + madurez + defectos"
+                        elif self.model_stage == 1:
+                            modelo_texto = "Modelo: exportabilidad.pt"
+                        elif self.model_stage == 2:
+                            modelo_texto = "Modelo: madurez.pt"
+                        elif self.model_stage == 3:
+                            modelo_texto = "Modelo: defectos.pt"
+
+                        # Calcular el tiempo restante basado en la etapa actual
+                        tiempo_restante_etapa = 0
+                        if self.model_stage == 1:
+                            tiempo_restante_etapa = duration_stage1 - elapsed_time_current_stage
+                        elif self.model_stage in [2, 3]:
+                            tiempo_restante_etapa = duration_stage_others - elapsed_time_current_stage
+
+                        # Asegurarse de que tiempo_restante_etapa no sea negativo para la visualización
+                        tiempo_restante_etapa = max(0, tiempo_restante_etapa)
+                        texto_etapa = f"{modelo_texto} - Etapa Restante: {tiempo_restante_etapa:.1f}s"
+                        if self.model_stage == MODEL_STAGE_CONCURRENT:
+                            texto_etapa = f"{modelo_texto} - Frames: {frames_processed}/{FRAMES_PER_MANGO}"
+
+                        # Tiempo total restante para la detección completa (hasta los 17 segundos)
+                        tiempo_total_restante = total_processing_duration - elapsed_time_overall
+                        tiempo_total_restante = max(0, tiempo_total_restante)
+                        texto_total = f"Total Restante: {tiempo_total_restante:.1f}s"
+                        if self.model_stage == MODEL_STAGE_CONCURRENT:
+                            texto_total = f"Tiempo Transcurrido: {elapsed_time_overall:.1f}s"
+
+                        # Mostrar información de la línea, lote e ID en el frame
+                        cv2.putText(annotated_frame, f"Linea: {self.lane_id} | Lote: {self.current_lote} | ID: {self.current_id}",
+                                     (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+                        cv2.putText(annotated_frame, texto_etapa,
+                                     (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                        cv2.putText(annotated_frame, texto_total,
+                                     (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+
+                        self.publish_frame(annotated_frame)
+                    except Exception as e:
+                        print(f"ERROR: Error en la predicción del modelo: {str(e)}")
+                        continue
+                else:
+                    self.publish_frame(frame)
+
+                # Modo 'tiempos': 4 fotos en los tiempos definidos, con el último frame
+                # del batch recién clasificado, sin leer otro frame de la cámara
+                for idx, capture_time in enumerate(photo_capture_times if PHOTO_MODE == 'tiempos' else ()):
+                    if INFERENCE_MODE == 'concurrente':
+                        capture_due = frames_processed >= photo_capture_frames[idx]
+                    else:
+                        capture_due = self.overall_detection_start_time is not None and elapsed_time_overall >= capture_time
+                    if not photos_taken[idx] and capture_due:
+                        print(f"DEBUG: Condición para tomar foto {idx+1} cumplida. Tiempo total: {elapsed_time_overall:.2f}s.")
+                        image_dir = os.path.join('images', str(self.current_lote))
+                        image_filename = f"{self.current_lote}-{self.current_id}-{idx+1}.jpg"
+                        image_path = os.path.join(image_dir, image_filename)
+                        # El escritor de BD codifica el JPEG una vez y guarda los mismos bytes en disco y como BLOB
+                        self.db_writer.submit_image(self.current_lote, self.current_id, image_path, frame)
+                        photos_taken[idx] = True
+                        print(f"DEBUG: Foto {idx+1} encolada para guardar en disco y DB: {image_path}")
+
+        except Exception as e:
+            print(f"ERROR: Error crítico en generate_frames_thread (línea {self.lane_id}): {str(e)}")
+            self.stop_detection()
+        finally:
+            print(f"DEBUG: Thread de detección de la línea {self.lane_id} finalizado (finally block).")
+
+    def generate(self):
+        """
+        Stream MJPEG de la línea.
+        """
+        while self.camera_running:
+            with self.lock:
+                if self.output_frame is not None:
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + self.output_frame + b'\r\n')
+                else:
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + b'\r\n') # Frame vacío si no hay nada
+            time.sleep(0.1)
+
+    def start(self, continuous):
+        """
+        Inicia la cámara y el thread de detección. En modo normal procesa un solo mango
+        con un ID nuevo; en modo continuo queda esperando mangos en la banda.
+        Retorna el diccionario de respuesta para el endpoint.
+        """
+        if self.camera_running:
+            return {"status": "warning", "message": "La cámara ya está en funcionamiento"}
+
+        # Asegurarnos de que los recursos anteriores estén liberados
+        self.release_camera()
+
+        if self.init_camera() is None:
+            return {"status": "error", "message": "No se pudo inicializar la cámara"}
+        self.frame_grabber = FrameGrabber(self.camera, max_frames=CAPTURE_QUEUE_SIZE).start()
+
+        # Generar códigos: nuevo lote si no existe, siempre nuevo ID
+        if self.current_lote is None:
+            self.generate_lote()
+            print(f"DEBUG: Línea {self.lane_id}: nuevo lote generado: {self.current_lote}")
+
+        if continuous:
+            # El ID se genera al detectar cada mango
+            if PRESENCE_TRIGGER == 'serial':
+                self.presence_trigger = SerialPresence(self.arduino)
+            else:
+                self.presence_trigger = FrameDiffPresence(roi=PRESENCE_ROI)
+            self.continuous_mode = True
+            self.waiting_for_mango = True
+        else:
+            self.continuous_mode = False
+            self.waiting_for_mango = False
+            self.generate_id()
+
+        self.frames_gated = 0
+
+        self.camera_running = True
+        self.model_stage = 0
+        self.current_model_name = ""
+        # En modo continuo los tiempos se inician al detectar cada mango
+        self.overall_detection_start_time = None if continuous else time.time()
+        self.detection_start_time = None if continuous else time.time()
+
+        self.detection_thread = threading.Thread(target=self.generate_frames_thread)
+        self.detection_thread.start()
+
+        return {
+            "status": "success",
+            "message": "Cámara iniciada en modo continuo" if continuous else "Cámara iniciada",
+            "lane": self.lane_id,
+            "lote": self.current_lote,
+            "id": None if continuous else self.current_id
+        }
+
+    def stop(self):
+        self.stop_detection() # Primero detenemos la detección
+        self.release_camera() # Luego liberamos la cámara
+
+    def get_status(self):
+        return {
+            "lane": self.lane_id,
+            "camera_index": self.camera_index,
+            "serial_port": self.arduino.port,
+            "actuation": self.arduino.get_stats(),
+            "timeline": self.timeline,
+            "latency": self.latency_tracker.summary()["total"],
+            "pins": self.pins,
+            "running": self.camera_running,
+            "model_stage": self.model_stage,
+            "lote": self.current_lote,
+            "id": self.current_id,
+            "detections_count": self.detections_buffer.rows_in_lote(),
+            "detections_pending": len(self.detections_buffer),
+            "journal": self.journal.get_stats() if self.journal else None,
+            "db_writer": self.db_writer.get_stats(),
+            "capture": self.frame_grabber.get_stats() if self.frame_grabber else None,
+            "stages": self.last_stage_reports,
+            "mango_votes": self.mango_votes.snapshot() if self.mango_votes else None,
+            "frames_gated": self.frames_gated,
+            "continuous": self.continuous_mode,
+            "waiting_for_mango": self.waiting_for_mango,
+            "preprocessing": self.preprocessor.get_stats() if self.preprocessor else None,
+            "photo_selection": self.capture_selector.get_stats() if self.capture_selector else None
+        }
@@ -0,0 +1,107 @@
+import threading
+from collections import deque
+
+# Componentes de la latencia de un mango, en orden, desde la lectura de su frame decisivo
+# (el último clasificado) hasta que el pin de la decisión sale por el serial
+LATENCY_COMPONENTS = (
+    'capture',         # camera.read() del frame
+    'queue_wait',      # desde la lectura hasta que la inferencia toma el frame
+    'inference',       # predict de los modelos sobre el batch
+    'vote',            # votos, cierre del ciclo y decisión
+    'serial_enqueue',  # entrega de la línea de tiempo al planificador del puerto
+    'timeline_offset', # espera configurada antes de activar el pin (ACTUATION_TIMELINE offset_s)
+    'serial_write',    # desde que el comando vence hasta que se escribe en el puerto
+)
+# Límites superiores (ms) de los buckets del histograma
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+PERCENTILES = (50, 90, 95, 99)
+# Mangos recientes con que se calculan los percentiles en memoria
+TRACE_WINDOW = 1000
+
+
+class MangoLatencyTrace:
+    """
+    Marcas de tiempo (time.monotonic()) del frame decisivo de un mango a lo largo del pipeline.
+    """
+    __slots__ = ('lote', 'item_id', 'read_start', 'read_end', 'dequeued', 'inference_end',
+                 'decided', 'enqueued', 'due', 'written')
+
+    def __init__(self, lote, item_id, read_start, read_end, dequeued, inference_end):
+        self.lote = lote
+        self.item_id = item_id
+        self.read_start = read_start
+        self.read_end = read_end
+        self.dequeued = dequeued
+        self.inference_end = inference_end
+        self.decided = None
+        self.enqueued = None
+        self.due = None
+        self.written = None
+
+    def breakdown(self):
+        """Milisegundos de cada componente (LATENCY_COMPONENTS) y el total."""
+        marks = (self.read_start, self.read_end, self.dequeued, self.inference_end,
+                 self.decided, self.enqueued, self.due, self.written)
+        values = {name: round((end - start) * 1000, 3) for name, start, end in zip(LATENCY_COMPONENTS, marks, marks[1:])}
+        values['total'] = round((self.written - self.read_start) * 1000, 3)
+        return values
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def latency_summary(rows):
+    """
+    Percentiles e histograma por componente. rows: lista de dicts de breakdown().
+    """
+    summary = {"mangos": len(rows)}
+    for name in LATENCY_COMPONENTS + ('total',):
+        values = sorted(row[name] for row in rows if row.get(name) is not None)
+        histogram = {f"<={limit}": 0 for limit in HISTOGRAM_BUCKETS_MS}
+        histogram[f">{HISTOGRAM_BUCKETS_MS[-1]}"] = 0
+        for value in values:
+            for limit in HISTOGRAM_BUCKETS_MS:
+                if value <= limit:
+                    histogram[f"<={limit}"] += 1
+                    break
+            else:
+                histogram[f">{HISTOGRAM_BUCKETS_MS[-1]}"] += 1
+        stats = {f"p{pct}": percentile(values, pct) for pct in PERCENTILES}
+        stats["max"] = values[-1] if values else None
+        stats["histograma_ms"] = histogram
+        summary[name] = stats
+    return summary
+
+
+class LatencyTracker:
+    """
+    Guarda el desglose de latencia de los mangos recientes de una línea y lo envía a la BD
+    (tabla latency_traces) cuando el comando de la decisión sale por el puerto.
+    """
+
+    def __init__(self, db_writer=None, window=TRACE_WINDOW):
+        self.db_writer = db_writer
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+
+    def on_written(self, trace, queued_at, due_at, written_at):
+        """
+        Callback del planificador del puerto al escribir el comando que activa el pin de la decisión.
+        Corre en el thread escritor del puerto: solo anota y encola.
+        """
+        trace.enqueued = queued_at
+        trace.due = due_at
+        trace.written = written_at
+        breakdown = trace.breakdown()
+        with self._lock:
+            self._recent.append(breakdown)
+        if self.db_writer is not None:
+            self.db_writer.submit_latency_trace(trace.lote, trace.item_id, breakdown)
+
+    def summary(self):
+        with self._lock:
+            rows = list(self._recent)
+        return latency_summary(rows)
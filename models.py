@@ -0,0 +1,105 @@
+import time
+import threading
+import numpy as np
+from backends import load_model
+
+# Archivos de pesos de cada modelo, indexados por el nombre simplificado
+# que usa el análisis local (sin .pt)
+MODEL_FILES = {
+    'exportabilidad': 'exportabilidad.pt',
+    'madurez': 'madurez.pt',
+    'defectos': 'defectos.pt',
+}
+
+# Tamaño del frame usado para el calentamiento (igual al de la cámara)
+WARMUP_FRAME_SHAPE = (480, 640, 3)
+
+
+class ModelRegistry:
+    """
+    Registro de modelos YOLO cargados una sola vez por proceso.
+    Los modelos se cargan y se calientan al llamar a preload() o, de forma
+    perezosa, la primera vez que se piden con get(). Guarda los tiempos de
+    carga y calentamiento de cada modelo.
+    backend: 'pytorch', 'onnx' u 'openvino' (ver backends.py); los formatos exportados
+    se generan una vez y quedan junto a los pesos.
+    Los predictores de Ultralytics guardan estado por instancia y no son thread-safe:
+    como varias líneas comparten los mismos modelos, la inferencia se hace con predict(),
+    que serializa las llamadas a cada modelo con su propio lock (modelos distintos sí
+    corren en paralelo).
+    """
+
+    def __init__(self, model_files=None, warmup_frame_shape=WARMUP_FRAME_SHAPE, backend='pytorch'):
+        self.model_files = dict(model_files or MODEL_FILES)
+        self.backend = backend
+        self.warmup_frame_shape = warmup_frame_shape
+        self._models = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+        self._predict_locks = {name: threading.Lock() for name in self.model_files}
+
+    def weights_name(self, name):
+        """
+        Retorna el nombre del archivo de pesos (ej: 'madurez.pt') de un modelo.
+        Es el nombre que se guarda en la columna model_name de la BD.
+        """
+        return self.model_files[name]
+
+    def get(self, name):
+        """
+        Retorna el modelo listo para inferencia. Si todavía no se cargó,
+        lo carga y lo calienta antes de devolverlo.
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            # Otro thread pudo haberlo cargado mientras esperábamos el lock
+            if name not in self._models:
+                self._models[name] = self._load(name)
+            return self._models[name]
+
+    def predict(self, name, source, **kwargs):
+        """
+        Ejecuta predict del modelo con el lock del modelo tomado, así dos líneas no usan
+        a la vez el mismo predictor.
+        """
+        model = self.get(name)
+        with self._predict_locks[name]:
+            return model.predict(source, **kwargs)
+
+    def preload(self):
+        """
+        Carga y calienta todos los modelos registrados.
+        Pensado para llamarse una vez al iniciar el proceso.
+        """
+        for name in self.model_files:
+            self.get(name)
+        total = sum(t['load_s'] + t['warmup_s'] for t in self._timings.values())
+        print(f"DEBUG: {len(self._models)} modelos precargados en {total:.2f}s.")
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def get_timings(self):
+        """
+        Retorna un diccionario {modelo: {'load_s': float, 'warmup_s': float}}
+        con los tiempos de carga de los modelos ya cargados.
+        """
+        return {name: dict(t) for name, t in self._timings.items()}
+
+    def _load(self, name):
+        weights = self.model_files[name]
+        start = time.perf_counter()
+        model = load_model(weights, self.backend)
+        load_s = time.perf_counter() - start
+
+        # La primera inferencia inicializa el predictor y es mucho más lenta
+        # que las siguientes; se hace aquí para que no la pague la primera etapa.
+        start = time.perf_counter()
+        model.predict(np.zeros(self.warmup_frame_shape, dtype=np.uint8), verbose=False)
+        warmup_s = time.perf_counter() - start
+
+        self._timings[name] = {'load_s': round(load_s, 4), 'warmup_s': round(warmup_s, 4)}
+        print(f"DEBUG: Modelo {weights} ({self.backend}) cargado en {load_s:.2f}s y calentado en {warmup_s:.2f}s.")
+        return model
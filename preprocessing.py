@@ -0,0 +1,144 @@
+import cv2
+import numpy as np
+import torch
+
+# Color de relleno del letterbox (el mismo que usa YOLO)
+LETTERBOX_COLOR = 114
+
+
+def letterbox(image, imgsz):
+    """
+    Redimensiona manteniendo la proporción y rellena hasta imgsz x imgsz.
+    Retorna (imagen, escala, (relleno_x, relleno_y)).
+    """
+    height, width = image.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+    canvas = np.full((imgsz, imgsz, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = image
+    return canvas, ratio, (pad_x, pad_y)
+
+
+class PreprocessMeta:
+    """
+    Cómo se obtuvo el tensor de un frame: recorte (x, y, ancho, alto) en el frame
+    original, escala y relleno del letterbox. Permite llevar las cajas de vuelta al frame.
+    """
+    __slots__ = ('crop', 'ratio', 'pad')
+
+    def __init__(self, crop, ratio, pad):
+        self.crop = crop
+        self.ratio = ratio
+        self.pad = pad
+
+    def to_frame_coords(self, xyxy):
+        """
+        Convierte cajas (N, 4) del espacio del tensor al del frame original.
+        """
+        boxes = np.asarray(xyxy, dtype=np.float32).copy()
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - self.pad[0]) / self.ratio + self.crop[0]
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - self.pad[1]) / self.ratio + self.crop[1]
+        return boxes
+
+
+class SharedPreprocessor:
+    """
+    Preprocesa cada batch de frames una sola vez para todos los modelos: letterbox,
+    BGR -> RGB, escala 0-1 y formato NCHW. Los modelos que piden el mismo tamaño de
+    entrada y el mismo recorte reciben el mismo tensor; YOLO no vuelve a preprocesarlo.
+
+    Con ROI activo, el modelo localizador (exportabilidad) encuentra el mango y los modelos
+    de roi_models analizan solo ese recorte, lo que permite usar una entrada más chica
+    (ej. 320 para defectos). El ROI se reinicia con cada mango nuevo.
+    """
+
+    def __init__(self, model_imgsz, roi_locator=None, roi_models=(), roi_margin=0.15):
+        self.model_imgsz = dict(model_imgsz)
+        self.roi_locator = roi_locator
+        self.roi_models = set(roi_models)
+        self.roi_margin = roi_margin
+        self.roi = None          # (x, y, ancho, alto) del mango en el frame, en píxeles
+        self.last_metas = {}     # nombre_modelo -> [PreprocessMeta] del último batch
+        self.tensors_built = 0
+        self.tensors_reused = 0
+
+    def reset_roi(self):
+        self.roi = None
+
+    def _crop_for(self, model_name, frame):
+        height, width = frame.shape[:2]
+        if self.roi is not None and model_name in self.roi_models:
+            return self.roi
+        return (0, 0, width, height)
+
+    def prepare_batch(self, frames, model_names):
+        """
+        Retorna {nombre_modelo: tensor (B, 3, imgsz, imgsz)} para el batch de frames.
+        Cada combinación distinta de (recorte, tamaño de entrada) se calcula una sola vez.
+        """
+        built = {}
+        inputs = {}
+        for name in model_names:
+            imgsz = self.model_imgsz.get(name, 640)
+            crops = [self._crop_for(name, frame) for frame in frames]
+            key = (imgsz, tuple(crops))
+            if key in built:
+                self.tensors_reused += 1
+            else:
+                images, metas = [], []
+                for frame, (x, y, w, h) in zip(frames, crops):
+                    image, ratio, pad = letterbox(frame[y:y + h, x:x + w], imgsz)
+                    images.append(image)
+                    metas.append(PreprocessMeta((x, y, w, h), ratio, pad))
+                batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+                tensor = torch.from_numpy(np.ascontiguousarray(batch)).float().div_(255.0)
+                built[key] = (tensor, metas)
+                self.tensors_built += 1
+            inputs[name], self.last_metas[name] = built[key]
+        return inputs
+
+    def update_roi(self, model_name, results, frame_shape):
+        """
+        Actualiza el ROI con la caja de mayor confianza del modelo localizador en el último frame.
+        """
+        if model_name != self.roi_locator or not results:
+            return
+        boxes = results[-1].boxes
+        if boxes is None or len(boxes.cls) == 0:
+            return
+        best = int(boxes.conf.argmax())
+        x1, y1, x2, y2 = self.last_metas[model_name][-1].to_frame_coords(boxes.xyxy[best:best + 1].cpu().numpy())[0]
+        margin_x, margin_y = (x2 - x1) * self.roi_margin, (y2 - y1) * self.roi_margin
+        height, width = frame_shape[:2]
+        x1, y1 = max(0, int(x1 - margin_x)), max(0, int(y1 - margin_y))
+        x2, y2 = min(width, int(x2 + margin_x)), min(height, int(y2 + margin_y))
+        if x2 - x1 >= 32 and y2 - y1 >= 32:
+            self.roi = (x1, y1, x2 - x1, y2 - y1)
+
+    def annotate(self, model_name, result, frame):
+        """
+        Dibuja las cajas de un resultado sobre el frame original completo: quita el relleno
+        del letterbox y pega la imagen anotada en la posición del recorte.
+        """
+        meta = self.last_metas[model_name][-1]
+        plotted = result.plot()
+        x, y, w, h = meta.crop
+        new_w, new_h = int(round(w * meta.ratio)), int(round(h * meta.ratio))
+        plotted = plotted[meta.pad[1]:meta.pad[1] + new_h, meta.pad[0]:meta.pad[0] + new_w]
+        if (new_w, new_h) != (w, h):
+            plotted = cv2.resize(plotted, (w, h), interpolation=cv2.INTER_LINEAR)
+        annotated = frame.copy()
+        annotated[y:y + h, x:x + w] = plotted
+        if (x, y, w, h) != (0, 0, frame.shape[1], frame.shape[0]):
+            cv2.rectangle(annotated, (x, y), (x + w, y + h), (255, 0, 255), 1)
+        return annotated
+
+    def get_stats(self):
+        return {
+            "tensores_calculados": self.tensors_built,
+            "tensores_reutilizados": self.tensors_reused,
+            "roi": self.roi,
+        }
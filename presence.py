@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+
+
+class FrameDiffPresence:
+    """
+    Detecta si hay un objeto (mango) frente a la cámara comparando cada frame, reducido
+    y en escala de grises, contra un fondo aprendido de la banda vacía.
+    Usa histéresis: la presencia se activa tras `frames_on` frames con cambio y se
+    desactiva tras `frames_off` frames sin cambio, para no disparar IDs por ruido.
+    roi: región de interés (x, y, ancho, alto) en fracciones del frame; None usa el frame completo.
+    El fondo se aprende del primer frame, por lo que la banda debe estar vacía al iniciar.
+    La llegada de un objeto (paso de ausente a presente) queda anotada hasta que se consulta
+    con consume_arrival(), así un disparador cuenta cada mango una sola vez aunque siga a la vista.
+    """
+
+    def __init__(self, scale=0.125, pixel_threshold=25, area_threshold=0.02,
+                 frames_on=3, frames_off=5, learning_rate=0.05, roi=None):
+        self.scale = scale
+        self.roi = roi
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold
+        self.frames_on = frames_on
+        self.frames_off = frames_off
+        self.learning_rate = learning_rate
+        self.present = False
+        self.changed_ratio = 0.0
+        self._background = None
+        self._streak = 0
+        self._arrived = False
+
+    def _prepare(self, frame):
+        if self.roi is not None:
+            height, width = frame.shape[:2]
+            x, y, w, h = self.roi
+            frame = frame[int(y * height):int((y + h) * height), int(x * width):int((x + w) * width)]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def update(self, frame):
+        """
+        Procesa un frame y retorna True mientras haya un objeto presente.
+        """
+        small = self._prepare(frame)
+        if self._background is None:
+            self._background = small.astype(np.float32)
+            return False
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self._background))
+        self.changed_ratio = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+        candidate = self.changed_ratio >= self.area_threshold
+
+        # Histéresis: contar frames seguidos que contradicen el estado actual
+        if candidate != self.present:
+            self._streak += 1
+            if self._streak >= (self.frames_on if candidate else self.frames_off):
+                self.present = candidate
+                self._streak = 0
+                if candidate:
+                    self._arrived = True
+        else:
+            self._streak = 0
+
+        # El fondo solo se actualiza con la banda vacía, así el mango no se "absorbe"
+        if not self.present and not candidate:
+            cv2.accumulateWeighted(small, self._background, self.learning_rate)
+        return self.present
+
+    def consume_arrival(self):
+        """
+        True si llegó un objeto (ausente -> presente) desde la última consulta; la anotación se borra.
+        """
+        arrived, self._arrived = self._arrived, False
+        return arrived
+
+    def reset(self):
+        self.present = False
+        self._background = None
+        self._streak = 0
+        self._arrived = False
+
+
+class SerialPresence:
+    """
+    Presencia informada por un sensor conectado al Arduino. El firmware envía un frame
+    de presencia (ver serial_protocol.py) cuando el sensor detecta un objeto y cuando se libera.
+    El thread lector del ArduinoLink entrega esos avisos; update() ignora el frame y devuelve
+    el último estado recibido. Como en FrameDiffPresence, cada aviso de presencia que llega con
+    el sensor libre queda anotado como una llegada hasta consume_arrival().
+    """
+
+    def __init__(self, arduino_link):
+        self.arduino_link = arduino_link
+        self.present = False
+        self._arrived = False
+        arduino_link.add_presence_listener(self._on_presence)
+
+    def _on_presence(self, present):
+        if present and not self.present:
+            self._arrived = True
+        self.present = present
+
+    def update(self, frame):
+        return self.present
+
+    def consume_arrival(self):
+        arrived, self._arrived = self._arrived, False
+        return arrived
+
+    def reset(self):
+        self.present = False
+        self._arrived = False
+
+    def stop(self):
+        self.arduino_link.remove_presence_listener(self._on_presence)
@@ -0,0 +1,213 @@
+"""
+Cuantización INT8 de los tres modelos con validación de la decisión por mango.
+
+Uso:
+    python quantization.py images/<lote>            # fotos JPEG guardadas por la línea
+    python quantization.py --db [--lote 12345]      # BLOBs de la tabla captured_images
+
+Pasos:
+  1. Agrupa las capturas por mango (lote, ID) y separa mangos de calibración y de validación.
+  2. Exporta cada modelo a ONNX y lo cuantiza a INT8 (estático, QDQ) calibrando con las capturas.
+  3. Compara en los mangos de validación la decisión exportable / no exportable del modelo
+     INT8 con la del modelo .pt, con la misma regla que se envía al Arduino, y la latencia.
+  4. Escribe int8_gate.json. El backend 'onnx_int8' solo se habilita si la concordancia
+     alcanza QUANTIZATION_MIN_AGREEMENT y los pesos y el INT8 siguen siendo los validados
+     (ver backends.py).
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import argparse
+import datetime
+import cv2
+import numpy as np
+import onnxruntime
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+from ultralytics import YOLO
+from models import MODEL_FILES
+from backends import EXPORT_IMGSZ, QUANTIZATION_GATE_FILE, ensure_exported, exported_path, int8_artifacts, load_model
+from voting import MangoVoteAggregator
+from detection_columns import DetectionColumns
+from database import get_captured_image_blobs
+from config import PREDICT_CONF, QUANTIZATION_MIN_AGREEMENT
+
+# Nombre de las fotos guardadas por la línea: <lote>-<id>-<n>.jpg
+PHOTO_NAME = re.compile(r'^(\d+)-(\d+)-\d+\.jpg$')
+
+
+def load_mango_frames_from_dir(directory):
+    """
+    Retorna {(lote, ID): [frames]} con las fotos JPEG del directorio (recursivo).
+    Las fotos que no siguen el formato <lote>-<id>-<n>.jpg cuentan como un mango cada una.
+    """
+    mangos = {}
+    for path in sorted(glob.glob(os.path.join(directory, '**', '*.jpg'), recursive=True)):
+        name = os.path.basename(path)
+        if name.endswith(('-Pie.jpg', '-Bar.jpg')):
+            continue  # Gráficos de los reportes
+        frame = cv2.imread(path)
+        if frame is None:
+            continue
+        match = PHOTO_NAME.match(name)
+        key = (match.group(1), match.group(2)) if match else (name, name)
+        mangos.setdefault(key, []).append(frame)
+    return mangos
+
+
+def load_mango_frames_from_db(lote_number=None):
+    """
+    Retorna {(lote, ID): [frames]} con las fotos guardadas como BLOB en captured_images.
+    """
+    mangos = {}
+    for lote, item_id, blob in get_captured_image_blobs(lote_number):
+        frame = cv2.imdecode(np.frombuffer(blob, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            mangos.setdefault((str(lote), str(item_id)), []).append(frame)
+    return mangos
+
+
+def preprocess(frame, imgsz=EXPORT_IMGSZ):
+    """
+    Mismo preprocesamiento que aplica YOLO antes del ONNX exportado: letterbox a imgsz
+    con relleno gris (114), BGR -> RGB, escala 0-1 y formato NCHW.
+    """
+    height, width = frame.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return tensor[None]
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+    """
+    Entrega las capturas preprocesadas a ONNX Runtime para calibrar los rangos de activación.
+    """
+
+    def __init__(self, input_name, frames):
+        self._inputs = iter([{input_name: preprocess(frame)} for frame in frames])
+
+    def get_next(self):
+        return next(self._inputs, None)
+
+
+def quantize_model(weights, calibration_frames):
+    """
+    Exporta el modelo a ONNX y genera su versión INT8 calibrada. Retorna la ruta del INT8.
+    """
+    fp32_path = ensure_exported(weights, 'onnx')
+    int8_path = exported_path(weights, 'onnx_int8')
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    start = time.perf_counter()
+    quantize_static(fp32_path, int8_path, FrameCalibrationReader(input_name, calibration_frames),
+                    quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8, per_channel=True)
+    print(f"DEBUG: {weights} cuantizado a {int8_path} con {len(calibration_frames)} frames en {time.perf_counter() - start:.1f}s.")
+    return int8_path
+
+
+def mango_decision(models, frames, latencies):
+    """
+    Decisión exportable / no exportable de un mango a partir de sus fotos.
+    models: {nombre_modelo: modelo YOLO}; latencies: {nombre_modelo: [segundos]} se completa aquí.
+    """
+    mango_votes = MangoVoteAggregator()
+    for name, model in models.items():
+        for frame in frames:
+            start = time.perf_counter()
+            results = model.predict(frame, conf=PREDICT_CONF, verbose=False)
+            latencies[name].append(time.perf_counter() - start)
+            mango_votes.add_columns(name, DetectionColumns.from_results(results, [0.0]))
+    return mango_votes.is_exportable()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cuantización INT8 con validación de la decisión por mango")
+    parser.add_argument('directory', nargs='?', help="Directorio con fotos capturadas, ej: images/12345")
+    parser.add_argument('--db', action='store_true', help="Usar las fotos guardadas en captured_images")
+    parser.add_argument('--lote', help="Con --db, limitar a un lote")
+    parser.add_argument('--calibration-frames', type=int, default=100)
+    parser.add_argument('--threshold', type=float, default=QUANTIZATION_MIN_AGREEMENT,
+                        help="Concordancia mínima para aprobar el modelo INT8")
+    args = parser.parse_args()
+
+    if args.db:
+        mangos = load_mango_frames_from_db(args.lote)
+        source = f"captured_images{' lote ' + args.lote if args.lote else ''}"
+    elif args.directory:
+        mangos = load_mango_frames_from_dir(args.directory)
+        source = args.directory
+    else:
+        parser.error("Indica un directorio de fotos o --db")
+    if not mangos:
+        print(f"ERROR: No se encontraron capturas en {source}")
+        return 1
+
+    # Mangos alternados para calibrar y validar, así la validación no usa las fotos de calibración
+    keys = sorted(mangos)
+    calibration_keys, validation_keys = keys[0::2], keys[1::2]
+    if not validation_keys:
+        print("ADVERTENCIA: Un solo mango disponible; se valida con las mismas fotos de calibración.")
+        validation_keys = calibration_keys
+    calibration_frames = [frame for key in calibration_keys for frame in mangos[key]][:args.calibration_frames]
+    print(f"Capturas de {source}: {len(keys)} mangos, {len(calibration_frames)} frames de calibración, "
+          f"{len(validation_keys)} mangos de validación.")
+
+    full_models, int8_models = {}, {}
+    for name, weights in MODEL_FILES.items():
+        int8_path = quantize_model(weights, calibration_frames)
+        full_models[name] = load_model(weights, 'pytorch')
+        int8_models[name] = YOLO(int8_path, task='detect')
+
+    full_latencies = {name: [] for name in MODEL_FILES}
+    int8_latencies = {name: [] for name in MODEL_FILES}
+    disagreements = []
+    for key in validation_keys:
+        full_decision = mango_decision(full_models, mangos[key], full_latencies)
+        int8_decision = mango_decision(int8_models, mangos[key], int8_latencies)
+        if full_decision != int8_decision:
+            disagreements.append({'lote': key[0], 'id': key[1], 'completo': full_decision, 'int8': int8_decision})
+
+    agreement = 1.0 - len(disagreements) / len(validation_keys)
+    approved = agreement >= args.threshold
+    latency_ms = {
+        name: {
+            'completo': round(float(np.mean(full_latencies[name])) * 1000, 2),
+            'int8': round(float(np.mean(int8_latencies[name])) * 1000, 2),
+        }
+        for name in MODEL_FILES
+    }
+    gate = {
+        'fecha': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'origen': source,
+        'frames_calibracion': len(calibration_frames),
+        'mangos_validacion': len(validation_keys),
+        'concordancia': round(agreement, 4),
+        'umbral': args.threshold,
+        'aprobado': approved,
+        # backends.py solo usa el INT8 si estos archivos siguen siendo los validados
+        'artefactos': {weights: int8_artifacts(weights) for weights in MODEL_FILES.values()},
+        'latencia_ms': latency_ms,
+        'desacuerdos': disagreements,
+    }
+    with open(QUANTIZATION_GATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(gate, f, indent=2, ensure_ascii=False)
+
+    for name, lat in latency_ms.items():
+        print(f"{MODEL_FILES[name]:<20} completo {lat['completo']:>8.2f} ms   int8 {lat['int8']:>8.2f} ms")
+    print(f"Concordancia de la decisión por mango: {agreement * 100:.1f}% (umbral {args.threshold * 100:.1f}%)")
+    if approved:
+        print("Modelo INT8 aprobado. Para usarlo: INFERENCE_BACKEND = 'onnx_int8' en config.py")
+        return 0
+    print(f"Modelo INT8 rechazado: el backend 'onnx_int8' seguirá usando el ONNX completo. Detalle en {QUANTIZATION_GATE_FILE}")
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Protocolo binario entre el servidor y el Arduino (ver arduino/arduino.ino).
+
+Servidor -> Arduino, un frame por escritura con uno o más comandos de pin:
+    0xA5 | seq | n | pin_1 estado_1 ... pin_n estado_n | xor
+    seq: número de secuencia (0-255); estado: 1 = HIGH, 0 = LOW;
+    xor: XOR de seq, n y los 2*n bytes de comandos.
+
+Arduino -> servidor, frames de 4 bytes:
+    tipo | a | b | xor(tipo, a, b)
+    ACK_FRAME      a = seq confirmado, b = estado (ACK_OK, ACK_BAD_CHECKSUM, ACK_BAD_PIN)
+    PRESENCE_FRAME a = 1 si el sensor detecta un mango, 0 al liberarse
+    READY_FRAME    enviado una vez al iniciar el firmware
+"""
+
+COMMAND_START = 0xA5
+MAX_COMMANDS_PER_FRAME = 8
+
+ACK_FRAME = 0xAC
+PRESENCE_FRAME = 0xB0
+READY_FRAME = 0xB1
+DEVICE_FRAME_TYPES = (ACK_FRAME, PRESENCE_FRAME, READY_FRAME)
+DEVICE_FRAME_SIZE = 4
+
+ACK_OK = 0
+ACK_BAD_CHECKSUM = 1
+ACK_BAD_PIN = 2
+ACK_STATUS_NAMES = {ACK_OK: 'ok', ACK_BAD_CHECKSUM: 'checksum inválido', ACK_BAD_PIN: 'pin inválido'}
+
+
+def _xor(values):
+    checksum = 0
+    for value in values:
+        checksum ^= value
+    return checksum
+
+
+def encode_command_frame(seq, commands):
+    """
+    commands: [(pin, estado)] con estado 'H' / 'L'. Retorna los bytes del frame.
+    """
+    if not 0 < len(commands) <= MAX_COMMANDS_PER_FRAME:
+        raise ValueError(f"Un frame lleva de 1 a {MAX_COMMANDS_PER_FRAME} comandos ({len(commands)})")
+    body = [seq & 0xFF, len(commands)]
+    for pin, state in commands:
+        body.extend((pin, 1 if state == 'H' else 0))
+    return bytes([COMMAND_START] + body + [_xor(body)])
+
+
+def encode_device_frame(frame_type, a=0, b=0):
+    return bytes([frame_type, a, b, _xor((frame_type, a, b))])
+
+
+class DeviceFrameParser:
+    """
+    Separa los frames de 4 bytes que envía el Arduino. Los bytes que no forman un frame
+    válido se descartan de a uno hasta volver a sincronizar.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.discarded_bytes = 0
+
+    def feed(self, data):
+        """Agrega bytes recibidos y retorna la lista de frames completos [(tipo, a, b)]."""
+        self._buffer.extend(data)
+        frames = []
+        while len(self._buffer) >= DEVICE_FRAME_SIZE:
+            frame_type, a, b, checksum = self._buffer[:DEVICE_FRAME_SIZE]
+            if frame_type in DEVICE_FRAME_TYPES and _xor((frame_type, a, b)) == checksum:
+                frames.append((frame_type, a, b))
+                del self._buffer[:DEVICE_FRAME_SIZE]
+            else:
+                del self._buffer[0]
+                self.discarded_bytes += 1
+        return frames
+
+
+class CommandFrameParser:
+    """
+    Lado Arduino (lo usa el emulador): separa los frames de comandos del servidor.
+    feed() retorna [(seq, [(pin, estado)], checksum_ok)].
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer.extend(data)
+        frames = []
+        while True:
+            start = self._buffer.find(bytes([COMMAND_START]))
+            if start < 0:
+                self._buffer.clear()
+                return frames
+            del self._buffer[:start]
+            if len(self._buffer) < 3:
+                return frames
+            seq, count = self._buffer[1], self._buffer[2]
+            if not 0 < count <= MAX_COMMANDS_PER_FRAME:
+                del self._buffer[0]
+                continue
+            size = 3 + 2 * count + 1
+            if len(self._buffer) < size:
+                return frames
+            body = self._buffer[1:size - 1]
+            checksum_ok = _xor(body) == self._buffer[size - 1]
+            commands = [(body[2 + 2 * i], 'H' if body[3 + 2 * i] else 'L') for i in range(count)]
+            frames.append((seq, commands, checksum_ok))
+            del self._buffer[:size]
@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from actuation import PinOwnership, decision_timeline, run_timeline
+
+PINS = {'deteccion': 7, 'exportable': 12, 'no_exportable': 13}
+TIMELINE = {'offset_s': 0.5, 'dwell_s': 1.0}
+
+
+def schedule_decisions(decisions):
+    """
+    Entrega las líneas de tiempo con run_timeline, como lo hace la línea, y retorna los comandos
+    (vence_en, orden, pin, estado, owner) en el orden en que el planificador los aplicaría.
+    decisions: [(inicio_s, exportable)], un mango por elemento.
+    """
+    commands = []
+    for start, exportable in decisions:
+        def send(pin_role, state, delay, _on_written, owner, start=start):
+            commands.append((start + delay, len(commands), PINS[pin_role], state, owner))
+        run_timeline(decision_timeline(exportable, TIMELINE), send)
+    return sorted(commands)
+
+
+def apply_commands(commands):
+    """
+    Aplica los comandos con PinOwnership y retorna el estado de los pines después de cada uno.
+    """
+    ownership = PinOwnership()
+    pins = {pin: 'L' for pin in PINS.values()}
+    history = []
+    for _due, _order, pin, state, owner in commands:
+        if ownership.apply(pin, state, owner):
+            pins[pin] = state
+        history.append(dict(pins))
+    return history
+
+
+class OverlappingTimelinesTest(unittest.TestCase):
+
+    def assert_never_both_high(self, history):
+        for pins in history:
+            self.assertFalse(pins[12] == 'H' and pins[13] == 'H', f"Pines 12 y 13 en HIGH a la vez: {pins}")
+
+    def test_opposite_decisions_never_leave_both_pins_high(self):
+        # El segundo mango se decide durante el dwell del primero, con la decisión contraria
+        for first_exportable in (True, False):
+            history = apply_commands(schedule_decisions([(0.0, first_exportable), (0.4, not first_exportable)]))
+            self.assert_never_both_high(history)
+            active = PINS['no_exportable'] if first_exportable else PINS['exportable']
+            # El pin del segundo mango quedó en HIGH al cerrar el primero y baja con su propio dwell
+            self.assertEqual(history[-1][active], 'L')
+
+    def test_stale_reset_does_not_cut_newer_activation(self):
+        # Misma decisión: el LOW del primer mango vence durante el dwell del segundo y se descarta
+        commands = schedule_decisions([(0.0, True), (0.4, True)])
+        history = apply_commands(commands)
+        first_reset = next(idx for idx, command in enumerate(commands)
+                           if command[2] == PINS['exportable'] and command[3] == 'L' and command[0] == 1.5)
+        self.assertEqual(history[first_reset][PINS['exportable']], 'H')
+        self.assertEqual(history[-1][PINS['exportable']], 'L')
+
+
+if __name__ == '__main__':
+    unittest.main()
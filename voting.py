@@ -0,0 +1,214 @@
+import math
+import time
+import numpy as np
+
+# Clases que votan en cada etapa: (clase favorable, clase desfavorable)
+STAGE_CLASSES = {
+    'exportabilidad': ('exportable', 'no_exportable'),
+    'madurez': ('mango_verde', 'mango_maduro'),
+    'defectos': ('mango_sin_defectos', 'mango_con_defectos'),
+}
+
+# Motivos por los que termina una etapa
+STOP_TIME = 'tiempo'                   # Se cumplió la duración fija de la etapa
+STOP_FRAMES = 'frames'                 # Se agotó el presupuesto de frames (modo concurrente)
+STOP_MAJORITY = 'mayoria_decidida'     # La mayoría ya no puede invertirse con los frames restantes
+STOP_CONFIDENCE = 'cota_confianza'     # La proporción de la mayoría superó la cota de confianza
+STOP_SKIPPED = 'omitida'               # Etapa omitida en cascada: otra etapa ya rechazó el mango
+
+# Motivos de salida temprana: la etapa se cerró con su voto ya decidido
+EARLY_EXIT_REASONS = (STOP_MAJORITY, STOP_CONFIDENCE)
+
+
+# Clases que cuentan para la decisión de cada modelo: {clave en counts: nombre de clase del modelo}
+DECISION_CLASSES = {
+    'exportabilidad': {'exportable': 'exportable', 'no_exportable': 'no_exportable'},
+    'madurez': {'verde': 'mango_verde', 'maduro': 'mango_maduro'},
+    'defectos': {'con_defecto': 'mango_con_defectos', 'sin_defecto': 'mango_sin_defectos'},
+}
+
+
+class MangoVoteAggregator:
+    """
+    Votos de un mango acumulados a medida que llegan las detecciones: por modelo y clase,
+    la cantidad de detecciones y la suma de confianzas. La memoria es fija por mango
+    (un par de arrays por modelo, del tamaño de sus clases) y la decisión no recorre
+    las detecciones.
+    """
+
+    def __init__(self):
+        self._names = {}        # modelo -> {id de clase: nombre}
+        self._counts = {}       # modelo -> array de cantidades por id de clase
+        self._conf_sums = {}    # modelo -> array de sumas de confianza por id de clase
+        self.total_detections = 0
+
+    def add_columns(self, model_name, columns):
+        """
+        Suma las detecciones de un batch. model_name: nombre sin .pt; columns: DetectionColumns.
+        """
+        if len(columns) == 0:
+            return
+        if model_name not in self._counts:
+            size = max(columns.names, default=-1) + 1
+            self._names[model_name] = dict(columns.names)
+            self._counts[model_name] = np.zeros(size, dtype=np.int64)
+            self._conf_sums[model_name] = np.zeros(size, dtype=np.float64)
+        size = len(self._counts[model_name])
+        self._counts[model_name] += np.bincount(columns.class_id, minlength=size)[:size]
+        self._conf_sums[model_name] += np.bincount(columns.class_id, weights=columns.confidence, minlength=size)[:size]
+        self.total_detections += len(columns)
+
+    def count(self, model_name, class_name):
+        names = self._names.get(model_name)
+        if not names:
+            return 0
+        for class_id, name in names.items():
+            if name == class_name:
+                return int(self._counts[model_name][class_id])
+        return 0
+
+    def counts(self):
+        """
+        Recuento por modelo con las claves que usa mango_is_exportable.
+        """
+        return {
+            model_name: {key: self.count(model_name, class_name) for key, class_name in classes.items()}
+            for model_name, classes in DECISION_CLASSES.items()
+        }
+
+    def is_exportable(self):
+        return mango_is_exportable(self.counts())
+
+    def snapshot(self):
+        """
+        Estado de los votos para /camera_status: {modelo: {clase: {'detecciones', 'confianza_promedio'}}}.
+        """
+        snapshot = {}
+        for model_name, names in self._names.items():
+            counts, conf_sums = self._counts[model_name], self._conf_sums[model_name]
+            snapshot[model_name] = {
+                names[class_id]: {
+                    'detecciones': int(counts[class_id]),
+                    'confianza_promedio': round(float(conf_sums[class_id] / counts[class_id]), 4),
+                }
+                for class_id in np.flatnonzero(counts).tolist()
+            }
+        return snapshot
+
+
+def mango_is_exportable(counts):
+    """
+    Decisión que se envía al clasificador: exportable solo si las tres etapas votan a favor
+    (exportable > no_exportable, verde > maduro y sin_defecto > con_defecto).
+    """
+    return (
+        counts['exportabilidad']['exportable'] > counts['exportabilidad']['no_exportable'] and
+        counts['madurez']['verde'] > counts['madurez']['maduro'] and
+        counts['defectos']['sin_defecto'] > counts['defectos']['con_defecto']
+    )
+
+
+def wilson_lower_bound(successes, total, z=1.96):
+    """
+    Cota inferior del intervalo de Wilson (95% por defecto) para la proporción successes/total.
+    """
+    if total == 0:
+        return 0.0
+    p = successes / total
+    denominator = 1 + z * z / total
+    centre = p + z * z / (2 * total)
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total))
+    return (centre - margin) / denominator
+
+
+class StageVote:
+    """
+    Lleva el voto de una etapa (un modelo) para el mango actual y decide si la etapa
+    puede terminar antes de su duración fija. Registra el motivo de fin, los frames
+    usados y la duración de la etapa.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.positive_class, self.negative_class = STAGE_CLASSES[model_name]
+        self.votes = {self.positive_class: 0, self.negative_class: 0}
+        self.frames = 0
+        self.max_votes_per_frame = 1
+        self.start_time = time.time()
+        self.stop_reason = None
+        self.frames_used = None
+        self.duration_s = None
+
+    def add_columns(self, columns):
+        """
+        Suma los votos de un batch de frames. columns: DetectionColumns del modelo de la etapa.
+        """
+        positive = columns.count_per_frame(self.positive_class)
+        negative = columns.count_per_frame(self.negative_class)
+        self.frames += columns.num_frames
+        self.votes[self.positive_class] += int(positive.sum())
+        self.votes[self.negative_class] += int(negative.sum())
+        if columns.num_frames:
+            self.max_votes_per_frame = max(self.max_votes_per_frame, int((positive + negative).max()))
+
+    def check_early_exit(self, remaining_frames, min_frames, confidence_bound=None):
+        """
+        Termina la etapa si la mayoría ya no puede invertirse (ni empatar) con los votos
+        que caben en remaining_frames, o si la cota inferior de Wilson de la proporción
+        de la mayoría alcanza confidence_bound. Retorna el motivo de fin o None.
+        """
+        if self.stop_reason is not None:
+            return self.stop_reason
+        if self.frames < min_frames:
+            return None
+        leader = max(self.votes.values())
+        trailer = min(self.votes.values())
+        if self.majority_decided(remaining_frames):
+            self.stop(STOP_MAJORITY)
+        elif confidence_bound is not None and leader > 0 and wilson_lower_bound(leader, leader + trailer) >= confidence_bound:
+            self.stop(STOP_CONFIDENCE)
+        return self.stop_reason
+
+    def majority_decided(self, remaining_frames):
+        """
+        True si la mayoría ya no puede invertirse (ni empatar) con los votos que caben en remaining_frames.
+        """
+        leader = max(self.votes.values())
+        trailer = min(self.votes.values())
+        return leader - trailer > remaining_frames * self.max_votes_per_frame
+
+    def rejection_decided(self, remaining_frames, min_frames):
+        """
+        True si la etapa ya dejó al mango como no exportable de forma definitiva: terminó por
+        salida temprana rechazándolo, o (aunque siga abierta) su mayoría en contra ya no puede
+        invertirse. Es lo que usa la cascada en modo concurrente, con o sin EARLY_EXIT.
+        """
+        if not self.rejects():
+            return False
+        if self.stop_reason is not None:
+            return self.stop_reason in EARLY_EXIT_REASONS
+        return self.frames >= min_frames and self.majority_decided(remaining_frames)
+
+    def rejects(self):
+        """
+        True si el voto de la etapa deja al mango como no exportable: la clase favorable
+        no supera a la desfavorable (mismo criterio que analyze_and_send_signals_to_arduino).
+        Solo es definitivo una vez que la etapa terminó.
+        """
+        return self.votes[self.positive_class] <= self.votes[self.negative_class]
+
+    def stop(self, reason):
+        if self.stop_reason is None:
+            self.stop_reason = reason
+            self.frames_used = self.frames
+            self.duration_s = time.time() - self.start_time
+
+    def report(self):
+        return {
+            'modelo': self.model_name,
+            'votos': dict(self.votes),
+            'frames': self.frames,
+            'motivo_fin': self.stop_reason,
+            'frames_usados': self.frames_used,
+            'duracion_s': round(self.duration_s, 3) if self.duration_s is not None else None,
+        }